@@ -0,0 +1,151 @@
+"""
+    Windowed deduplication of tag reads. While a tag sits in the field the rfid reader reports it many times per
+    second; the aggregator folds those reads into one record per EPC and only emits an event when a tag arrives or when
+    it has not been read for the dwell window (departure).
+"""
+import time
+from collections import OrderedDict, namedtuple
+
+ARRIVAL = 'arrival'
+DEPARTURE = 'departure'
+
+TagEvent = namedtuple('TagEvent', ['kind', 'epc', 'antenna', 'first_seen', 'last_seen', 'read_count'])
+
+
+def format_tag_event(tag_event):
+    """
+        Function to turn an arrival/departure event of a RFID tag into a terminal line.
+    """
+    if tag_event.kind == ARRIVAL:
+        return f"RFID Tag: {tag_event.epc} (antenna {tag_event.antenna})"
+    return f"RFID Tag left: {tag_event.epc} ({tag_event.read_count} reads)"
+
+
+class TagRecord:
+    """
+        Per EPC state. __slots__ keeps each record small, since a shift can see hundreds of thousands of tags.
+    """
+    __slots__ = ('first_seen', 'last_seen', 'read_count', 'antenna')
+
+    def __init__(self, now, antenna):
+        self.first_seen = now
+        self.last_seen = now
+        self.read_count = 1
+        self.antenna = antenna
+
+
+class TagAggregator:
+    """
+        Table of the tags currently in the field and of the tags that left it recently.
+
+        Tags in the field are kept in an OrderedDict sorted by last read, so departures are found by looking at the
+        front of it only. Departed tags are remembered for `history_ttl` seconds (so a returning tag keeps its first
+        seen time and read count) and the whole table never holds more than `max_tags` records: the oldest departed
+        tags are evicted first.
+    """
+
+    def __init__(self, dwell_window=2.0, history_ttl=8 * 3600, max_tags=500000):
+        """
+            :param dwell_window: Seconds without a read after which a tag is considered gone.
+            :param history_ttl: Seconds a departed tag is remembered.
+            :param max_tags: Upper bound on the number of records (present and departed) kept in memory.
+        """
+        self.dwell_window = dwell_window
+        self.history_ttl = history_ttl
+        self.max_tags = max_tags
+        self._present = OrderedDict()  # EPC bytes -> TagRecord, least recently read first
+        self._departed = OrderedDict()  # EPC bytes -> TagRecord, earliest departure first
+        self._evicted = []  # Departure events of tags evicted from the field to respect max_tags.
+        self.reads = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._present) + len(self._departed)
+
+    @property
+    def present(self):
+        """
+            Number of tags currently in the field.
+        """
+        return len(self._present)
+
+    def get(self, epc):
+        """
+            Function to look up the record of a tag.
+            :param epc: The EPC as a hexadecimal string.
+            :return: The TagRecord, or None if the tag is unknown.
+        """
+        key = bytes.fromhex(epc)
+        return self._present.get(key) or self._departed.get(key)
+
+    def observe(self, tag, now=None):
+        """
+            Function to account for one tag read.
+            :param tag: protocol.TagRead.
+            :param now: Timestamp of the read, defaults to time.time().
+            :return: An ARRIVAL TagEvent if the tag was not in the field, None otherwise.
+        """
+        if now is None:
+            now = time.time()
+        self.reads += 1
+        key = bytes.fromhex(tag.epc)  # Half the size of the hexadecimal string.
+        record = self._present.get(key)
+        if record is not None:
+            record.last_seen = now
+            record.read_count += 1
+            record.antenna = tag.antenna
+            self._present.move_to_end(key)
+            return None
+
+        record = self._departed.pop(key, None)
+        if record is None:
+            record = TagRecord(now, tag.antenna)
+            self._evict()
+        else:
+            record.last_seen = now
+            record.read_count += 1
+            record.antenna = tag.antenna
+        self._present[key] = record
+        return TagEvent(ARRIVAL, tag.epc, record.antenna, record.first_seen, now, record.read_count)
+
+    def _evict(self):
+        # Called before a new record is added.
+        while len(self) >= self.max_tags:
+            self.evictions += 1
+            if self._departed:
+                self._departed.popitem(last=False)
+            else:
+                key, record = self._present.popitem(last=False)
+                self._evicted.append(TagEvent(DEPARTURE, key.hex(), record.antenna, record.first_seen,
+                                              record.last_seen, record.read_count))
+
+    def expire(self, now=None):
+        """
+            Function to find the tags that left the field and forget the ones departed longer than history_ttl ago.
+            Cheap enough to call on every iteration of the receive loop.
+            :param now: Current time, defaults to time.time().
+            :return: List of DEPARTURE TagEvent.
+        """
+        if now is None:
+            now = time.time()
+        events, self._evicted = self._evicted, []
+
+        present = self._present
+        departure_limit = now - self.dwell_window
+        while present:
+            key, record = next(iter(present.items()))
+            if record.last_seen > departure_limit:
+                break
+            del present[key]
+            self._departed[key] = record
+            events.append(TagEvent(DEPARTURE, key.hex(), record.antenna, record.first_seen, record.last_seen,
+                                   record.read_count))
+
+        departed = self._departed
+        history_limit = now - self.dwell_window - self.history_ttl
+        while departed:
+            key, record = next(iter(departed.items()))
+            if record.last_seen > history_limit:
+                break
+            del departed[key]
+        return events
@@ -1,24 +1,53 @@
-import serial
+import asyncio
+import logging
 import socket
-import binascii
-
-
-def open_device(com_port, baud_rate_index):
+import time
+
+import crc
+from protocol import (decode_response, inventory_command, REBOOT_COMMAND, DEVICE_INFO_COMMAND,
+                      INVENTORY_STOP_COMMAND, CMD_INVENTORY_CONTINUE, CMD_INVENTORY_STOP, CMD_REBOOT, CMD_DEVICE_INFO)
+from logs import get_logger
+from metrics import REGISTRY
+from serial_transport import SerialTransport, detect_baud_rate, BAUD_RATES
+
+logger = get_logger('api')
+
+# Metrics of the transport functions, created once so recording costs no lookup.
+COMMAND_NAMES = {CMD_INVENTORY_CONTINUE: 'start_reading', CMD_INVENTORY_STOP: 'stop_reading', CMD_REBOOT: 'reboot',
+                 CMD_DEVICE_INFO: 'device_info'}
+COMMAND_LATENCY = {cmd: REGISTRY.histogram('rfid_command_seconds', 'Command round trip time', command=name)
+                   for cmd, name in COMMAND_NAMES.items()}
+COMMAND_ERRORS = {cmd: REGISTRY.counter('rfid_command_errors_total', 'Commands failing with an exception',
+                                        command=name) for cmd, name in COMMAND_NAMES.items()}
+INVALID_RESPONSES = {reason: REGISTRY.counter('rfid_invalid_responses_total', 'Command responses rejected',
+                                              reason=reason) for reason in ('incomplete', 'crc')}
+CONNECTIONS = {result: REGISTRY.counter('rfid_connections_total', 'Connection attempts', result=result)
+               for result in ('ok', 'timeout', 'error')}
+
+
+def open_device(com_port, baud_rate_index=None, on_tags=None):
     """
         Function to connect to the rfid reader device using serial.
         :param com_port: The com port of the serial.
-        :param baud_rate_index: Index of the list containing baud rates.
-        :return: Connection established using serial.
+        :param baud_rate_index: Index of the list containing baud rates, None to detect the speed of the reader.
+        :param on_tags: Optional callable receiving the tags streamed while the reading mode is active, see
+        serial_transport.SerialTransport.
+        :return: Connection established using serial (a SerialTransport), None if it failed.
     """
-    baud_rates = [9600, 19200, 38400, 57600, 115200]
     try:
-        baud_rate = baud_rates[baud_rate_index]
-        ser = serial.Serial(com_port, baud_rate, timeout=1)
-        print(f"Connected to {com_port} at {baud_rate} baud.")
-        return ser
+        baud_rate = BAUD_RATES[baud_rate_index] if baud_rate_index is not None else BAUD_RATES[-1]
+        transport = SerialTransport(com_port, baud_rate, on_tags)
     except Exception as e:
-        print(f"Failed to open serial port {com_port}: {e}")
+        logger.warning("Failed to open serial port %s: %s", com_port, e)
         return None
+    if baud_rate_index is None:
+        baud_rate = detect_baud_rate(transport)
+        if baud_rate is None:
+            logger.warning("No rfid reader answering on %s at any of %s baud.", com_port, BAUD_RATES)
+            transport.close()
+            return None
+    logger.info("Connected to %s at %s baud.", com_port, baud_rate)
+    return transport
 
 
 async def open_net_connection(ip, port, timeout=3):
@@ -33,22 +62,48 @@ async def open_net_connection(ip, port, timeout=3):
     try:
         # Use asyncio.wait_for to apply a timeout to the connection attempt
         reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
-        print(f"Network connection established to {ip}:{port}")
+        logger.info("Network connection established to %s:%s", ip, port)
         return reader, writer
     except asyncio.TimeoutError:
-        print(f"Connection attempt to {ip}:{port} timed out after {timeout} seconds.")
+        logger.warning("Connection attempt to %s:%s timed out after %s seconds.", ip, port, timeout)
         return None, None
     except Exception as e:
-        print(f"Failed to connect to {ip}:{port}: {e}")
+        logger.warning("Failed to connect to %s:%s: %s", ip, port, e)
         return None, None
 
+
+def open_socket_connection(ip, port, timeout=3):
+    """
+        Establish a blocking TCP connection to the RFID reader, as used by the command functions in this module.
+
+        :param ip: The IP address to connect to.
+        :param port: The port number to connect to.
+        :param timeout: The timeout in seconds for the connection attempt.
+        :return: The connected socket if the connection is successful, None otherwise.
+    """
+    try:
+        connection = socket.create_connection((ip, port), timeout=timeout)
+        connection.settimeout(None)  # The timeout only applies to the connection attempt.
+        logger.info("Network connection established to %s:%s", ip, port)
+        CONNECTIONS['ok'].value += 1
+        return connection
+    except socket.timeout:
+        logger.warning("Connection attempt to %s:%s timed out after %s seconds.", ip, port, timeout)
+        CONNECTIONS['timeout'].value += 1
+        return None
+    except Exception as e:
+        logger.warning("Failed to connect to %s:%s: %s", ip, port, e)
+        CONNECTIONS['error'].value += 1
+        return None
+
+
 def close_serial_connection(serial_connection):
     """
         Function to close the serial connection.
         :param serial_connection: Connection established using serial.
     """
     serial_connection.close()
-    print("Serial connection closed.")
+    logger.info("Serial connection closed.")
 
 
 def close_network_connection(socket_connection):
@@ -57,7 +112,7 @@ def close_network_connection(socket_connection):
         :param socket_connection: Connection established using socket(TCP/IP connection).
     """
     socket_connection.close()
-    print("Network connection closed.")
+    logger.info("Network connection closed.")
 
 
 def crc16_cal(data):
@@ -71,18 +126,22 @@ def crc16_cal(data):
     not, it suggests corruption or alteration.
     :param data: Data provided to calculate the crc16 checksum.
     """
-    PRESET_VALUE = 0xFFFF
-    POLYNOMIAL = 0x8408
-    uiCrcValue = PRESET_VALUE
+    return crc.crc16(data)  # Table driven, see crc.py
+
 
-    for byte in data:
-        uiCrcValue ^= byte
-        for _ in range(8):
-            if uiCrcValue & 0x0001:
-                uiCrcValue = (uiCrcValue >> 1) ^ POLYNOMIAL
-            else:
-                uiCrcValue >>= 1
-    return uiCrcValue
+# Status codes returned by the rfid reader (and possibly from tags, if applicable): code -> (log level, message).
+STATUS_MESSAGES = {
+    0x00: (logging.DEBUG, 'Successful execution.'),
+    0x01: (logging.WARNING, 'Parameter value is wrong or out of range.'),
+    0x02: (logging.WARNING, 'Command execution failed due to module internal error.'),
+    0x03: (logging.WARNING, 'Reserve'),
+    0x12: (logging.INFO, 'There is no counting to the label or entire counting command is completed.'),
+    0x14: (logging.WARNING, 'Label response timeout'),
+    0x15: (logging.WARNING, 'Demodulation tag response error'),
+    0x16: (logging.WARNING, 'Protocol authentication failed.'),
+    0x17: (logging.WARNING, 'Password error'),
+    0xFF: (logging.INFO, 'No more data'),
+}
 
 
 def interpret_response_status(status_code):
@@ -90,77 +149,82 @@ def interpret_response_status(status_code):
     The interpret_response_status function translates status codes from the RFID reader (and possibly from tags,
     if applicable) into human-readable messages, facilitating debugging and operational monitoring
     :param status_code: Status code return by the rfid reader.
+    :return: The human-readable message.
     """
-    if status_code == 0x00:
-        print("Successful execution.")
-    elif status_code == 0x01:
-        print("Parameter value is wrong or out of range.")
-    elif status_code == 0x02:
-        print("Command execution failed due to module internal error.")
-    elif status_code == 0X03:
-        print('Reserve')
-    elif status_code == 0X12:
-        print('There is no counting to the label or entire counting command is completed.')
-    elif status_code == 0X14:
-        print('Label response timeout')
-    elif status_code == 0X15:
-        print('Demodulation tag response error')
-    elif status_code == 0X16:
-        print('Protocol authentication failed.')
-    elif status_code == 0X17:
-        print('Password error')
-    elif status_code == 0XFF:
-        print('No more data')
-    else:
-        print(f"Unknown status code: {status_code}")
+    level, message = STATUS_MESSAGES.get(status_code, (logging.WARNING, None))
+    if message is None:
+        message = f"Unknown status code: {status_code}"
+    logger.log(level, message)
+    return message
 
 
-def send_rfid_reboot_command(connection, connection_type='serial'):
+def _exchange(connection, connection_type, command, read_size=1024):
     """
-        Function to send the reboot command(factory reset) to the rfid reader.
-        :param connection: The connection established with the rfid reader.
-        :param connection_type: The type of connection('serial' or 'tcp/ip(network)')
-        :return status_code: Status code returned by the rfid reader (0X00 means success).
+        Function to send a command frame and read the raw response. The round trip time is recorded in the
+        rfid_command_seconds histogram of the command.
+        :param read_size: Bytes read from a serial port; a socket is always read with recv(1024), since tags streamed
+        before the response may share the segment with it.
+        :return: The response bytes, or None if the connection type is not supported.
     """
-    # According to the documentation, the reboot command structure is as follows:
-    # HEAD 0xCF, ADDR 0xFF, CMD 0x0052, LEN 0x00, followed by CRC16
-    command_bytes = [0xCF, 0xFF, 0x00, 0x52,
-                     0x00]  # Construct the command in format - HEAD, ADDR, 0x00 and 0x52 together represent CMD, LEN
-    crc16 = crc16_cal(bytes(command_bytes))  # Calculate CRC16
-    command_bytes += [(crc16 >> 8) & 0xFF, crc16 & 0xFF]  # Append CRC16
-
-    command = bytes(command_bytes)
-
-    # Print the command being sent in hexadecimal format
-    print('Sending command (Byte Format)', command)
-    print(f"Sending command (Hexadecimal format): {binascii.hexlify(command)}")
-
+    if logger.isEnabledFor(logging.DEBUG):  # No hexadecimal formatting unless debug logging is on.
+        logger.debug('Sending command %s', command.hex())
+    cmd = (command[2] << 8) | command[3]
+    start = time.perf_counter_ns()
     try:
         if connection_type == 'serial':
             connection.write(command)
-            # Reading response with a flexible length, expecting at least 7 bytes for a valid response
-            response = connection.read(10)  # Reading more bytes to ensure complete response
+            response = connection.read(read_size)
         elif connection_type == 'network':
             connection.sendall(command)
             response = connection.recv(1024)
         else:
-            print("Unsupported connection type")
-            return
-
-        # Print the raw response received in hexadecimal format
-        print(f"Raw response received: {binascii.hexlify(response)}")
-        print('Byte format response received', response)
-
-        if len(response) >= 7:  # Checking for minimum expected response length
-            status_code = response[5]
-            print('Status code ', status_code)
-            interpret_response_status(status_code)
-            return status_code
-        else:
-            print("Invalid or incomplete response received.")
+            logger.error("Unsupported connection type %r", connection_type)
             return None
+    except Exception:
+        if cmd in COMMAND_ERRORS:
+            COMMAND_ERRORS[cmd].value += 1
+        raise
+    if cmd in COMMAND_LATENCY:
+        COMMAND_LATENCY[cmd].record(time.perf_counter_ns() - start)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Response received %s', response.hex())
+    return response
+
+
+def _decode_status(response, command):
+    """
+        Function to decode a response and check its length and CRC16.
+        :param command: The command frame sent, only the response frame of the same CMD is considered.
+        :return: The Response, or None if the response is incomplete or corrupted.
+    """
+    decoded = decode_response(response, (command[2] << 8) | command[3]) if response else None
+    if decoded is None:
+        logger.warning("Invalid or incomplete response received.")
+        INVALID_RESPONSES['incomplete'].value += 1
+        return None
+    if not decoded.crc_valid:
+        logger.warning("Response CRC16 check failed.")
+        INVALID_RESPONSES['crc'].value += 1
+        return None
+    interpret_response_status(decoded.status)
+    return decoded
+
+
+def send_rfid_reboot_command(connection, connection_type='serial'):
+    """
+        Function to send the reboot command(factory reset) to the rfid reader.
+        :param connection: The connection established with the rfid reader.
+        :param connection_type: The type of connection('serial' or 'tcp/ip(network)')
+        :return status_code: Status code returned by the rfid reader (0X00 means success).
+    """
+    # According to the documentation, the reboot command structure is as follows:
+    # HEAD 0xCF, ADDR 0xFF, CMD 0x0052, LEN 0x00, followed by CRC16. The frame is precomputed in protocol.py.
+    try:
+        response = _exchange(connection, connection_type, REBOOT_COMMAND, 10)
+        decoded = _decode_status(response, REBOOT_COMMAND)
+        return decoded.status if decoded else None
     except Exception as e:
-        print(f"Error sending reboot command: {e}")
+        logger.error("Error sending reboot command: %s", e)
         return None
 
 
@@ -170,44 +234,16 @@ def get_device_info(connection, connection_type='serial'):
     module and RFID module hardware version number, firmware version and SN number.
     :param connection: The connection established with the rfid reader.
     :param connection_type: The type of connection('serial' or 'tcp/ip(network)')
-    :return:  Returns the status_code and the response returned by the rfid reader.
+    :return:  Returns the status_code and the decoded Response (its payload holds the version information).
     """
-    command_bytes = [0xCF, 0xFF, 0x00, 0x70,
-                     0x00]  # Construct the command in format - HEAD, ADDR, 0x00 and 0x70 together represent CMD, LEN
-    crc16 = crc16_cal(bytes(command_bytes))  # Calculate CRC16 checksum
-    command_bytes += [(crc16 >> 8) & 0xFF, crc16 & 0xFF]  # Appending CRC16 checksum to command
-    command = bytes(command_bytes)
-
-    print(f"Sending GET device info command (In byte format): {command}")
-    print(f"Sending GET DEVICE INFO command (in hexadecimal format): {binascii.hexlify(command)}")
-
     try:
-        if connection_type == 'serial':
-            connection.write(command)
-            response = connection.read(1024)  # Adjust based on the expected response length
-        elif connection_type == 'network':
-            connection.sendall(command)
-            response = connection.recv(1024)
-        else:
-            print("Unsupported connection type")
-            return None, None  # Return None for both status code and response if unsupported connection type
-
-        print(f"Raw response received(Hexadecimal format): {binascii.hexlify(response)}")
-        print(f"Raw response received (Byte format): {response}")
-
-        # Process the response here as needed
-        if response:
-            status_code = response[5]
-            print(f"Status code: {status_code}")
-            interpret_response_status(status_code)
-            return status_code, response  # Return both status code and raw response for further analysis
-
-        else:
-            print("Invalid or incomplete response received.")
+        response = _exchange(connection, connection_type, DEVICE_INFO_COMMAND)
+        decoded = _decode_status(response, DEVICE_INFO_COMMAND)
+        if decoded is None:
             return None, None  # Return None if response is invalid or incomplete
-
+        return decoded.status, decoded  # Return both status code and response for further analysis
     except Exception as e:
-        print(f"Error sending GET DEVICE INFO command: {e}")
+        logger.error("Error sending GET DEVICE INFO command: %s", e)
         return None, None  # Return None in case of exceptions
 
 
@@ -218,33 +254,12 @@ def stop_reading_mode(connection, connection_type='serial'):
         :param connection_type: The type of connection('serial' or 'tcp/ip(network)')
         :return:  Returns the status_code returned by the rfid reader.
     """
-    # Command format for RFM_INVENTORY_STOP
-    command_bytes = [0xCF, 0xFF, 0x00, 0x02, 0x00]  # HEAD, ADDR, CMD, LEN
-    crc16 = crc16_cal(bytes(command_bytes))  # Calculate the CRC16 checksum
-    command_bytes += [(crc16 >> 8) & 0xFF, crc16 & 0xFF]  # Append CRC16 to the command
-
-    command = bytes(command_bytes)  # Convert the command list to bytes
-
     try:
-        if connection_type == 'serial':
-            connection.write(command)
-            response = connection.read(10)
-        elif connection_type == 'network':
-            connection.sendall(command)
-            response = connection.recv(1024)
-        else:
-            print("Unsupported connection type")
-            return None
-
-        if len(response) >= 7:  # Basic validation for response length
-            status_code = response[5]
-            interpret_response_status(status_code)  # Interpret the status code from the response
-            return status_code
-        else:
-            print("Invalid or incomplete response received.")
-            return None
+        response = _exchange(connection, connection_type, INVENTORY_STOP_COMMAND, 10)
+        decoded = _decode_status(response, INVENTORY_STOP_COMMAND)
+        return decoded.status if decoded else None
     except Exception as e:
-        print(f"Error sending RFM_INVENTORY_STOP command: {e}")
+        logger.error("Error sending RFM_INVENTORY_STOP command: %s", e)
         return None
 
 
@@ -260,39 +275,17 @@ def start_reading_mode(connection, connection_type, inv_type=0x00, inv_param=0):
         stop counting command;
         :param inv_param:  InvParam indicates the counting time, unit is seconds. If the value
         is 0, it indicates that the counting label will continue until the stop counting command is received;
+        :return: Returns the status_code and the decoded Response.
     """
-    command_bytes = [0xCF, 0xFF, 0x00, 0x01, 0x05, inv_type] + list(
-        inv_param.to_bytes(4, byteorder='little'))  # list(inv_param.to_bytes(4, byteorder='little')):
-    # Converts the inv_param (inventory parameter) into a 4-byte list, specifying the counting duration or number of
-    # cycles, depending on inv_type. The byteorder='little' indicates the byte order is little-endian, meaning the
-    # least significant byte is stored first.
-    crc16 = crc16_cal(bytes(command_bytes))  # Calculate the CRC16 checksum
-    command_bytes += [(crc16 >> 8) & 0xFF, crc16 & 0xFF]  # Append CRC16 to the command
-
-    command = bytes(command_bytes)  # Convert the command list to bytes
-    print(f'Sending Command in hexadecimal format: {binascii.hexlify(command)}')
-
     try:
-        if connection_type == 'serial':
-            connection.write(command)
-            response = connection.read(1024)  # Read the response, adjust size as needed
-        elif connection_type == 'network':
-            connection.sendall(command)
-            response = connection.recv(1024)  # Adjust based on expected response size
-        else:
-            print("Unsupported connection type")
-            return
-
-        print(f'Response from reader in hexadecimal format: {binascii.hexlify(response)}')
-        # Basic validation for response length; adjust according to expected response
-        if len(response) >= 7:
-            print("Reading Mode is Starting.......")
-            status_code = response[5]
-            interpret_response_status(status_code)
-            return status_code, response
-        else:
-            print("Invalid or no response received.")
+        # inv_param is encoded little-endian, see protocol.encode_inventory.
+        command = inventory_command(inv_type, inv_param)
+        response = _exchange(connection, connection_type, command)
+        decoded = _decode_status(response, command)
+        if decoded is None:
             return None, None
+        logger.info("Reading Mode is Starting.......")
+        return decoded.status, decoded
     except Exception as e:
-        print(f"Error sending RFM_INVENTORY_CONTINUE command: {e}")
+        logger.error("Error sending RFM_INVENTORY_CONTINUE command: %s", e)
         return None, None
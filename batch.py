@@ -0,0 +1,207 @@
+"""
+    Batch decoding of tag notifications: one call parses a whole buffer of frames and returns the EPC offsets and
+    lengths, status codes, RSSI, antenna and channel of every tag frame as arrays, instead of one frame per call.
+
+    With NumPy installed the frame boundaries, the CRC16 check and the EPC hex conversion are done with array
+    operations over all the frames of the same length at once. Without it the same results are computed frame by frame
+    in pure Python, so NumPy stays an optional dependency.
+"""
+from collections import namedtuple
+
+from crc import CRC16_TABLE, PRESET_VALUE, crc16
+from protocol import HEAD, FRAME_OVERHEAD, LEN_INDEX, DATA_INDEX, CMD_INVENTORY_CONTINUE, TAG_HEADER_LEN
+
+try:
+    import numpy
+except ImportError:  # Optional, the pure Python path gives the same results.
+    numpy = None
+
+# Arrays hold one entry per tag frame (CMD 0x0001 with an EPC), in stream order. epc_offsets index into the decoded
+# buffer. consumed is the number of bytes fully parsed: the caller keeps buffer[consumed:], the start of an incomplete
+# frame.
+TagBatch = namedtuple('TagBatch', ['epc_offsets', 'epc_lengths', 'status', 'rssi', 'antenna', 'channel',
+                                   'frames', 'crc_errors', 'consumed'])
+
+
+def _python_frame_offsets(buffer, pos, end):
+    """
+        Function to find the complete, CRC valid frames of buffer[pos:end] one frame at a time.
+        :return: A tuple of (list of frame offsets, number of CRC errors, bytes consumed).
+    """
+    offsets = []
+    crc_errors = 0
+    with memoryview(buffer) as view:
+        while True:
+            start = buffer.find(HEAD, pos, end)
+            if start < 0:
+                return offsets, crc_errors, end
+            if end - start < FRAME_OVERHEAD:
+                return offsets, crc_errors, start
+            frame_end = start + FRAME_OVERHEAD + buffer[start + LEN_INDEX]
+            if frame_end > end:
+                return offsets, crc_errors, start
+            if crc16(view[start:frame_end - 2]) != (buffer[frame_end - 2] << 8) | buffer[frame_end - 1]:
+                crc_errors += 1
+                pos = start + 1
+                continue
+            offsets.append(start)
+            pos = frame_end
+
+
+if numpy is not None:
+    _CRC_TABLE = numpy.array(CRC16_TABLE, dtype=numpy.uint16)
+
+
+def _numpy_crc_valid(data, offsets, frame_len):
+    """
+        Function to check the CRC16 of many frames of the same length at once: the CRC state of every frame is updated
+        one byte column at a time.
+        :param data: uint8 array of the buffer.
+        :param offsets: int64 array of the frame offsets.
+        :return: Boolean array, True where the CRC16 is valid.
+    """
+    frames = data[offsets[:, None] + numpy.arange(frame_len)]
+    state = numpy.full(len(offsets), PRESET_VALUE, dtype=numpy.uint16)
+    for column in frames[:, :-2].T:
+        state = (state >> 8) ^ _CRC_TABLE[(state ^ column) & 0xFF]
+    expected = (frames[:, -2].astype(numpy.uint16) << 8) | frames[:, -1]
+    return state == expected
+
+
+def _resync(buffer, view, pos, next_frame, end):
+    """
+        Function to re-sync inside a frame that failed its CRC check, as TagFrameDecoder does: the headers found before
+        next_frame, the following frame of the run, are tried one at a time.
+        :return: A tuple of (list of frame offsets, number of CRC errors, offset where the scan resumes, or None when it
+        continues with the run at next_frame).
+    """
+    offsets = []
+    crc_errors = 0
+    while True:
+        start = buffer.find(HEAD, pos, next_frame)
+        if start < 0:
+            return offsets, crc_errors, None
+        frame_end = start + FRAME_OVERHEAD + buffer[start + LEN_INDEX] if end - start >= FRAME_OVERHEAD else end + 1
+        if frame_end > end:
+            return offsets, crc_errors, start  # Header found but the rest of the frame has not arrived yet.
+        if crc16(view[start:frame_end - 2]) != (buffer[frame_end - 2] << 8) | buffer[frame_end - 1]:
+            crc_errors += 1
+            pos = start + 1
+            continue
+        offsets.append(start)
+        if frame_end > next_frame:
+            return offsets, crc_errors, frame_end  # The frames of the run after this one are not aligned any more.
+        pos = frame_end
+
+
+def _numpy_frame_offsets(buffer, data, pos, end):
+    """
+        Function to find the complete, CRC valid frames of buffer[pos:end]. The frame boundaries are found by hopping
+        from LEN byte to LEN byte over the frames sent back to back, which costs two byte reads per frame. The CRCs of
+        all those frames are then checked with array operations, one group per frame length. A frame failing its CRC
+        is re-synced byte by byte up to the next frame of the run, the frames after it are kept as checked.
+        :return: A tuple of (int64 array of frame offsets, number of CRC errors, bytes consumed).
+    """
+    runs = []
+    crc_errors = 0
+    with memoryview(buffer) as view:
+        while True:
+            start = buffer.find(HEAD, pos, end)
+            if start < 0:
+                pos = end
+                break
+            pos = start
+            run = []
+            while pos + FRAME_OVERHEAD <= end and buffer[pos] == HEAD:
+                frame_end = pos + FRAME_OVERHEAD + buffer[pos + LEN_INDEX]
+                if frame_end > end:
+                    break
+                run.append(pos)
+                pos = frame_end
+            if not run:
+                break  # Header found but the rest of the frame has not arrived yet.
+            offsets = numpy.array(run, dtype=numpy.int64)
+            frame_lengths = data[offsets + LEN_INDEX].astype(numpy.int64) + FRAME_OVERHEAD
+            valid = numpy.empty(len(offsets), dtype=bool)
+            for frame_len in numpy.unique(frame_lengths).tolist():
+                group = frame_lengths == frame_len
+                valid[group] = _numpy_crc_valid(data, offsets[group], frame_len)
+            first = 0
+            for bad in numpy.flatnonzero(~valid).tolist():
+                runs.append(offsets[first:bad])
+                crc_errors += 1
+                first = bad + 1
+                inner, errors, resume = _resync(buffer, view, run[bad] + 1, run[first] if first < len(run) else pos,
+                                                end)
+                runs.append(numpy.array(inner, dtype=numpy.int64))
+                crc_errors += errors
+                if resume is not None:
+                    pos = resume  # Rare: a frame found inside the bad one overlaps the rest of the run.
+                    break
+            else:
+                runs.append(offsets[first:])
+    offsets = numpy.concatenate(runs) if runs else numpy.empty(0, dtype=numpy.int64)
+    return offsets, crc_errors, pos
+
+
+def decode_batch(buffer, start=0, end=None):
+    """
+        Function to decode every complete tag frame of a buffer holding many frames.
+        :param buffer: bytes or bytearray with the frames, e.g. several recv() chunks joined together.
+        :param start: Offset where decoding starts.
+        :param end: Offset where decoding stops, defaults to the end of the buffer.
+        :return: TagBatch; NumPy arrays when NumPy is installed, lists otherwise.
+    """
+    end = len(buffer) if end is None else end
+    if numpy is None:
+        offsets, crc_errors, consumed = _python_frame_offsets(buffer, start, end)
+        columns = ([], [], [], [], [], [])
+        for offset in offsets:
+            data = offset + DATA_INDEX
+            if ((buffer[offset + 2] << 8) | buffer[offset + 3]) != CMD_INVENTORY_CONTINUE:
+                continue
+            data_len = buffer[offset + LEN_INDEX]
+            if data_len < TAG_HEADER_LEN or not buffer[data + 5] or data_len < TAG_HEADER_LEN + buffer[data + 5]:
+                continue  # No EPC, or an EPC longer than the frame: not a tag notification.
+            for column, value in zip(columns, (data + TAG_HEADER_LEN, buffer[data + 5], buffer[data],
+                                               (buffer[data + 1] << 8) | buffer[data + 2], buffer[data + 3],
+                                               buffer[data + 4])):
+                column.append(value)
+        return TagBatch(*columns, len(offsets), crc_errors, consumed)
+
+    data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+    offsets, crc_errors, consumed = _numpy_frame_offsets(buffer, data, start, end)
+    frame_count = len(offsets)
+    cmd = (data[offsets + 2].astype(numpy.uint16) << 8) | data[offsets + 3]
+    data_len = data[offsets + LEN_INDEX]
+    offsets = offsets[(cmd == CMD_INVENTORY_CONTINUE) & (data_len >= TAG_HEADER_LEN)]
+    tag_data = offsets + DATA_INDEX
+    epc_lengths = data[tag_data + 5]
+    keep = (epc_lengths > 0) & (data[offsets + LEN_INDEX].astype(numpy.int64) >= TAG_HEADER_LEN + epc_lengths)
+    tag_data, epc_lengths = tag_data[keep], epc_lengths[keep]
+    return TagBatch(tag_data + TAG_HEADER_LEN, epc_lengths, data[tag_data],
+                    (data[tag_data + 1].astype(numpy.uint16) << 8) | data[tag_data + 2], data[tag_data + 3],
+                    data[tag_data + 4], frame_count, crc_errors, consumed)
+
+
+def batch_epcs(buffer, batch):
+    """
+        Function to convert the EPCs of a batch to hexadecimal strings. With NumPy the EPCs of the same length are
+        gathered in one block and converted with a single hex() call.
+        :param buffer: The buffer given to decode_batch.
+        :param batch: The TagBatch returned by decode_batch.
+        :return: List of EPC hexadecimal strings, in stream order.
+    """
+    if numpy is None:
+        with memoryview(buffer) as view:
+            return [view[offset:offset + length].hex() for offset, length in zip(batch.epc_offsets, batch.epc_lengths)]
+
+    data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+    epcs = [''] * len(batch.epc_offsets)
+    for length in numpy.unique(batch.epc_lengths).tolist():
+        (indexes,) = numpy.nonzero(batch.epc_lengths == length)
+        block = data[batch.epc_offsets[indexes, None] + numpy.arange(length)].tobytes().hex()
+        width = 2 * length
+        for index, position in zip(indexes.tolist(), range(0, len(block), width)):
+            epcs[index] = block[position:position + width]
+    return epcs
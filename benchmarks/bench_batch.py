@@ -0,0 +1,83 @@
+"""
+    Benchmark of batch.decode_batch + batch.batch_epcs against main.get_rfid_tag_info, which decodes one frame per
+    call. Both must return the same EPCs. Run with and without NumPy installed to compare the two batch paths.
+    The batch decoding is also timed on a stream with corrupted frames, checked against protocol.TagFrameDecoder since
+    get_rfid_tag_info does not check the CRC.
+
+    Run from the repository root with: python -m benchmarks.bench_batch [--frames 200000] [--batch 4096] [--corrupt 1]
+"""
+import argparse
+import random
+import time
+
+import batch
+from main import get_rfid_tag_info
+from protocol import TagFrameDecoder
+from simulator import tag_frame
+
+
+def build_frames(count, population=1000, seed=1):
+    rng = random.Random(seed)
+    frames = [tag_frame(rng.randbytes(rng.choice((12, 12, 12, 16))), antenna=rng.randint(1, 4))
+              for _ in range(population)]
+    return [frames[rng.randrange(population)] for _ in range(count)]
+
+
+def corrupt_frames(frames, percent, seed=2):
+    rng = random.Random(seed)
+    corrupted = []
+    for frame in frames:
+        if rng.random() < percent / 100:
+            frame = bytearray(frame)
+            frame[rng.randrange(1, len(frame))] ^= rng.randrange(1, 256)  # Any byte but the header.
+            frame = bytes(frame)
+        corrupted.append(frame)
+    return corrupted
+
+
+def decoder_epcs(frames, batch_size):
+    epcs = []
+    for i in range(0, len(frames), batch_size):
+        epcs += [tag.epc for tag in TagFrameDecoder().feed(b''.join(frames[i:i + batch_size]))]
+    return epcs
+
+
+def run_legacy(frames):
+    start = time.perf_counter()
+    epcs = [get_rfid_tag_info(frame) for frame in frames]
+    return time.perf_counter() - start, epcs
+
+
+def run_batch(frames, batch_size):
+    buffers = [b''.join(frames[i:i + batch_size]) for i in range(0, len(frames), batch_size)]
+    epcs = []
+    start = time.perf_counter()
+    for buffer in buffers:
+        epcs += batch.batch_epcs(buffer, batch.decode_batch(buffer))
+    return time.perf_counter() - start, epcs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=4096, help='frames per decode_batch call')
+    parser.add_argument('--corrupt', type=float, default=1, help='percent of corrupted frames in the second stream')
+    args = parser.parse_args()
+
+    frames = build_frames(args.frames)
+    legacy_time, legacy_epcs = run_legacy(frames)
+    batch_time, batch_epcs = run_batch(frames, args.batch)
+    assert batch_epcs == legacy_epcs, 'decode_batch and get_rfid_tag_info disagree'
+    corrupted = corrupt_frames(frames, args.corrupt)
+    corrupted_time, corrupted_epcs = run_batch(corrupted, args.batch)
+    assert corrupted_epcs == decoder_epcs(corrupted, args.batch), 'decode_batch and TagFrameDecoder disagree'
+
+    print(f"{args.frames} frames, NumPy: {'yes' if batch.numpy is not None else 'no'}, batch: {args.batch} frames")
+    print(f"get_rfid_tag_info: {args.frames / legacy_time:12,.0f} tags/s ({legacy_time / args.frames * 1e6:.2f} us/tag)")
+    print(f"     decode_batch: {args.frames / batch_time:12,.0f} tags/s ({batch_time / args.frames * 1e6:.2f} us/tag)")
+    print(f"  {args.corrupt:g} % corrupted: {args.frames / corrupted_time:12,.0f} frames/s "
+          f"({corrupted_time / args.frames * 1e6:.2f} us/frame, {len(corrupted_epcs)} tags decoded)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+    Micro-benchmark comparing the table driven CRC16 in crc.py with the original bit by bit implementation.
+
+    Run from the repository root with: python -m benchmarks.bench_crc [--frames N]
+"""
+import argparse
+import random
+import timeit
+
+import crc
+
+
+def crc16_bitwise(data):
+    """
+        The original bit by bit CRC16 from api.crc16_cal, kept here as the reference implementation.
+    """
+    PRESET_VALUE = 0xFFFF
+    POLYNOMIAL = 0x8408
+    uiCrcValue = PRESET_VALUE
+
+    for byte in data:
+        uiCrcValue ^= byte
+        for _ in range(8):
+            if uiCrcValue & 0x0001:
+                uiCrcValue = (uiCrcValue >> 1) ^ POLYNOMIAL
+            else:
+                uiCrcValue >>= 1
+    return uiCrcValue
+
+
+def build_frames(count, seed=1):
+    """
+        Function to build tag notification sized frames (25 bytes) with a valid CRC16.
+    """
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        body = bytes([0xCF, 0xFF, 0x00, 0x01, 0x12]) + rng.randbytes(18)
+        value = crc16_bitwise(body)
+        frames.append(body + bytes([(value >> 8) & 0xFF, value & 0xFF]))
+    return frames
+
+
+def check_equivalence(rng):
+    for size in list(range(64)) + [255, 1024, 4096]:
+        data = rng.randbytes(size)
+        expected = crc16_bitwise(data)
+        assert crc.crc16(data) == expected
+        assert crc.crc16(memoryview(data)) == expected
+        split = rng.randint(0, size)
+        assert crc.update(crc.update(crc.PRESET_VALUE, data[:split]), data[split:]) == expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=20000)
+    args = parser.parse_args()
+
+    check_equivalence(random.Random(2))
+    frames = build_frames(args.frames)
+    payload = b''.join(frames)
+    views = [memoryview(frame) for frame in frames]
+    assert all(crc.verify_frames(views))
+
+    results = {
+        'bitwise per frame': timeit.timeit(lambda: [crc16_bitwise(f[:-2]) for f in frames], number=1),
+        'table per frame': timeit.timeit(lambda: [crc.crc16(f[:-2]) for f in frames], number=1),
+        'table verify_frames': timeit.timeit(lambda: crc.verify_frames(views), number=1),
+        'bitwise bulk': timeit.timeit(lambda: crc16_bitwise(payload), number=1),
+        'table bulk': timeit.timeit(lambda: crc.crc16(payload), number=1),
+    }
+    for label, elapsed in results.items():
+        print(f"{label:>20}: {elapsed * 1e3:8.1f} ms, {len(payload) / elapsed / 1e6:6.2f} MB/s")
+    print(f"Speed-up (per frame): {results['bitwise per frame'] / results['table per frame']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
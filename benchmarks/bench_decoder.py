@@ -0,0 +1,71 @@
+"""
+    Throughput benchmark for protocol.TagFrameDecoder.
+
+    Run from the repository root with: python -m benchmarks.bench_decoder [--megabytes N]
+"""
+import argparse
+import random
+import time
+
+from protocol import TagFrameDecoder
+from simulator import tag_frame
+
+
+def build_stream(megabytes, population=1000, seed=1):
+    """
+        Function to build a byte stream of tag notifications of at least the requested size.
+        :return: A tuple of (stream, number of frames in the stream).
+    """
+    rng = random.Random(seed)
+    frames = [tag_frame(rng.randbytes(12), antenna=rng.randint(1, 4)) for _ in range(population)]
+    target = int(megabytes * 1024 * 1024)
+    parts, size = [], 0
+    while size < target:
+        frame = frames[rng.randrange(population)]
+        parts.append(frame)
+        size += len(frame)
+    return b''.join(parts), len(parts)
+
+
+def split_stream(stream, chunk_size=None, seed=2):
+    """
+        Function to cut the stream into chunks the way recv() returns them. Without a chunk size the cuts are random so
+        that frames end up split across chunks.
+    """
+    if chunk_size:
+        return [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+    rng = random.Random(seed)
+    chunks, pos = [], 0
+    while pos < len(stream):
+        step = rng.randint(1, 2048)
+        chunks.append(stream[pos:pos + step])
+        pos += step
+    return chunks
+
+
+def run(chunks, expected_frames):
+    decoder = TagFrameDecoder()
+    tags = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        tags += len(decoder.feed(chunk))
+    elapsed = time.perf_counter() - start
+    assert tags == expected_frames, f"decoded {tags} tags, expected {expected_frames}"
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--megabytes', type=float, default=8)
+    args = parser.parse_args()
+
+    stream, frame_count = build_stream(args.megabytes)
+    print(f"Stream: {len(stream) / 1e6:.1f} MB, {frame_count} frames")
+    for label, chunks in (('recv(1024) chunks', split_stream(stream, 1024)),
+                          ('random split chunks', split_stream(stream))):
+        elapsed = run(chunks, frame_count)
+        print(f"{label:>20}: {len(stream) / elapsed / 1e6:7.2f} MB/s, {frame_count / elapsed:10.0f} tags/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+    End to end benchmark of the receive path (ReaderSession + SessionReactor + TagFrameDecoder) against simulated
+    readers running in a separate process. Reports tags/sec, p50/p99 tag to consumer latency and CPU time per tag of
+    the consumer process.
+
+    Run from the repository root with: python -m benchmarks.bench_end_to_end [--readers 8] [--rate 5000] [--seconds 10]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+from protocol import TagFrameDecoder
+from reactor import SessionReactor
+from session import ReaderSession
+from simulator import start_readers, epc_timestamp, FRAGMENT_MODES, FRAGMENT_NONE
+
+
+def run_simulators(connection, count, options):
+    async def serve():
+        readers = await start_readers(count, timestamps=True, **options)
+        connection.send([reader.port for reader in readers])
+        await asyncio.get_running_loop().run_in_executor(None, connection.recv)  # Wait for the stop message.
+        connection.send((sum(reader.tags_sent for reader in readers), sum(reader.corrupted for reader in readers)))
+        for reader in readers:
+            await reader.close()
+
+    asyncio.run(serve())
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def measure(ports, seconds):
+    sessions = [ReaderSession('127.0.0.1', port) for port in ports]
+    latencies = []
+    counts = {'tags': 0}
+
+    def make_handler(session):
+        decoder = TagFrameDecoder(on_response=session.on_response)
+
+        def on_data(session, data):
+            tags = decoder.feed(data)
+            now = time.monotonic_ns()
+            counts['tags'] += len(tags)
+            for tag in tags:
+                latencies.append(now - epc_timestamp(tag.epc))
+
+        return decoder, on_data
+
+    reactor = SessionReactor()
+    decoders = []
+    for session in sessions:
+        session.connect()
+        decoder, on_data = make_handler(session)
+        decoders.append(decoder)
+        reactor.add(session, on_data)
+    thread = reactor.start()
+    for session in sessions:
+        reactor.call_soon(session.start_reading)  # On the reactor thread, which owns the connections.
+
+    time.sleep(0.5)  # Warm up.
+    latencies.clear()
+    start_tags, start_cpu, start_wall = counts['tags'], time.process_time(), time.perf_counter()
+    time.sleep(seconds)
+    tags, cpu, wall = counts['tags'] - start_tags, time.process_time() - start_cpu, time.perf_counter() - start_wall
+    samples = sorted(latencies)
+
+    for session in sessions:
+        reactor.call_soon(session.stop_reading)
+    reactor.stop()
+    thread.join(5)
+    reactor.close()
+    for session in sessions:
+        session.close()
+    return tags, wall, cpu, samples, sum(decoder.crc_errors for decoder in decoders)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--rate', type=int, default=5000, help='tag notifications per second and per reader')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--fragmentation', choices=FRAGMENT_MODES, default=FRAGMENT_NONE)
+    parser.add_argument('--corrupt-ratio', type=float, default=0.0)
+    args = parser.parse_args()
+
+    parent, child = multiprocessing.Pipe()
+    options = {'rate': args.rate, 'fragmentation': args.fragmentation, 'corrupt_ratio': args.corrupt_ratio}
+    simulators = multiprocessing.Process(target=run_simulators, args=(child, args.readers, options), daemon=True)
+    simulators.start()
+    ports = parent.recv()
+
+    tags, wall, cpu, samples, crc_errors = measure(ports, args.seconds)
+    parent.send('stop')
+    sent, corrupted = parent.recv()
+    simulators.join(5)
+
+    print(f"readers: {args.readers}, offered: {args.readers * args.rate} tags/s, "
+          f"fragmentation: {args.fragmentation}, corrupt ratio: {args.corrupt_ratio}")
+    print(f"received: {tags / wall:,.0f} tags/s ({tags} tags in {wall:.1f} s, {sent} sent in total, "
+          f"{corrupted} corrupted, {crc_errors} CRC errors)")
+    print(f"latency: p50 {percentile(samples, 0.50) / 1e6:.2f} ms, p99 {percentile(samples, 0.99) / 1e6:.2f} ms")
+    print(f"cpu: {cpu / tags * 1e6:.2f} us/tag" if tags else "cpu: no tags received")
+
+
+if __name__ == '__main__':
+    main()
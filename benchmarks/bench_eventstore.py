@@ -0,0 +1,51 @@
+"""
+    Benchmark of the tag event store: append cost on the caller thread, then last_seen()/history() query latency over
+    millions of stored reads.
+
+    Run from the repository root with: python -m benchmarks.bench_eventstore [--reads N] [--directory DIR]
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from eventstore import TagEventStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reads', type=int, default=2000000)
+    parser.add_argument('--population', type=int, default=100000)
+    parser.add_argument('--directory', help='store directory, a temporary one is used and removed by default')
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp(prefix='rfid-events-')
+    rng = random.Random(1)
+    epcs = [rng.randbytes(12).hex() for _ in range(args.population)]
+    try:
+        store = TagEventStore(directory, segment_records=500000, max_pending=args.reads)
+        base = time.time() - 8 * 3600
+        step = 8 * 3600 / args.reads  # Spread the reads over a shift.
+        start = time.perf_counter()
+        for i in range(args.reads):
+            store.append(epcs[i % args.population], '192.168.101.3', timestamp=base + i * step)
+        append_time = time.perf_counter() - start
+        store.flush(timeout=120)
+        print(f"append: {append_time / args.reads * 1e6:.2f} us/read on the caller, {store.dropped} dropped, "
+              f"{len(store.sealed)} sealed segments")
+
+        samples = [rng.choice(epcs) for _ in range(200)]
+        for label, query in (('last_seen', store.last_seen), ('history', store.history)):
+            start = time.perf_counter()
+            for epc in samples:
+                assert query(epc)
+            print(f"{label}: {(time.perf_counter() - start) / len(samples) * 1e3:.3f} ms/query")
+        store.close()
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
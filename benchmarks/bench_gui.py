@@ -0,0 +1,53 @@
+"""
+    Synthetic load for the gui: a producer thread pushes tag events into main.tag_queue at a fixed rate while the normal
+    gui runs, and the backlog of the queue is printed every second. The backlog stays close to rate * GUI_REFRESH_MS
+    when the gui keeps up; a growing backlog means the Tk event loop is falling behind. Needs a display.
+
+    Run from the repository root with: python -m benchmarks.bench_gui [--rate 5000]
+"""
+import argparse
+import os
+import threading
+import time
+
+import main
+from aggregator import TagEvent, ARRIVAL, DEPARTURE
+
+
+def produce(rate, stop):
+    period = 0.01  # Send in 10 ms bursts, like a busy reader.
+    per_burst = max(1, int(rate * period))
+    serial_number = 0
+    next_burst = time.monotonic()
+    while not stop.is_set():
+        now = time.time()
+        for _ in range(per_burst):
+            serial_number += 1
+            kind = ARRIVAL if serial_number % 2 else DEPARTURE
+            main.tag_queue.put(TagEvent(kind, os.urandom(12).hex(), 1, now, now, 1))
+        main.tag_read_count += per_burst
+        next_burst += period
+        time.sleep(max(0.0, next_burst - time.monotonic()))
+
+
+def monitor(stop):
+    while not stop.wait(1.0):
+        print(f"reads: {main.tag_read_count:>9}, queue backlog: {main.tag_queue.qsize():>6}")
+
+
+def run():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rate', type=int, default=5000, help='tag events per second')
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    threading.Thread(target=produce, args=(args.rate, stop), daemon=True).start()
+    threading.Thread(target=monitor, args=(stop,), daemon=True).start()
+    try:
+        main.launch_gui()
+    finally:
+        stop.set()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,61 @@
+"""
+    Per tag cost of the receive path (decode + tag logging) with logging off, sampled and fully on, compared with the
+    former print() per tag. The log output goes to os.devnull so only the formatting and I/O calls are measured.
+
+    Run from the repository root with: python -m benchmarks.bench_logging [--tags N]
+"""
+import argparse
+import contextlib
+import logging
+import os
+import random
+import time
+
+from benchmarks.bench_decoder import split_stream
+from logs import configure_logging, get_logger, TagLogSampler
+from protocol import TagFrameDecoder
+from simulator import tag_frame
+
+
+def run(chunks, log_tag):
+    decoder = TagFrameDecoder()
+    tags = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        for tag in decoder.feed(chunk):
+            log_tag(tag)
+            tags += 1
+    return (time.perf_counter() - start) / tags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tags', type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    population = [tag_frame(rng.randbytes(12)) for _ in range(1000)]
+    stream = b''.join(rng.choices(population, k=args.tags))
+    chunks = split_stream(stream, 1024)
+
+    with open(os.devnull, 'w') as devnull:
+        configure_logging(logging.WARNING, devnull)
+        tag_logger = get_logger('tags', '127.0.0.1:2022')
+        results = {'no logging': run(chunks, lambda tag: None)}
+
+        sampler = TagLogSampler(tag_logger)
+        results['debug off'] = run(chunks, sampler.log)
+
+        configure_logging(logging.DEBUG)
+        results['debug on, sampled'] = run(chunks, TagLogSampler(tag_logger).log)
+        results['debug on, every tag'] = run(chunks, TagLogSampler(tag_logger, max_per_second=10 ** 9).log)
+
+        with contextlib.redirect_stdout(devnull):
+            results['print per tag (old)'] = run(chunks, lambda tag: print('RFID TAG', tag.epc))
+
+    for label, per_tag in results.items():
+        print(f"{label:>20}: {per_tag * 1e6:6.2f} us/tag")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+    Overhead of the metrics instrumentation of the receive loop: decodes the same stream with and without
+    metrics.ReaderMetrics (perf_counter_ns around decoder.feed + counters + latency histogram) and reports the cost per
+    tag of each and the relative overhead. Also reports the cost of the individual metric updates.
+
+    Run from the repository root with: python -m benchmarks.bench_metrics [--megabytes 8] [--rounds 5]
+"""
+import argparse
+import time
+import timeit
+
+from benchmarks.bench_decoder import build_stream, split_stream
+from metrics import Histogram, ReaderMetrics, Registry
+from protocol import TagFrameDecoder
+
+
+def run_plain(chunks):
+    decoder = TagFrameDecoder()
+    tags = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        tags += len(decoder.feed(chunk))
+    return time.perf_counter() - start, tags
+
+
+def run_instrumented(chunks):
+    decoder = TagFrameDecoder()
+    reader_metrics = ReaderMetrics('bench', decoder, Registry())
+    tags = 0
+    start = time.perf_counter()
+    for chunk in chunks:
+        decode_start = time.perf_counter_ns()
+        decoded = decoder.feed(chunk)
+        reader_metrics.observe(len(chunk), len(decoded), time.perf_counter_ns() - decode_start)
+        tags += len(decoded)
+    return time.perf_counter() - start, tags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--megabytes', type=float, default=8)
+    parser.add_argument('--chunk-size', type=int, default=1024, help='bytes per recv(), the metrics cost is per chunk')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    stream, frame_count = build_stream(args.megabytes)
+    chunks = split_stream(stream, args.chunk_size)
+    plain, instrumented = [], []
+    for _ in range(args.rounds):  # Interleaved, best of N, to keep machine noise out of the comparison.
+        elapsed, tags = run_plain(chunks)
+        plain.append(elapsed)
+        elapsed, tags = run_instrumented(chunks)
+        instrumented.append(elapsed)
+    plain_time, instrumented_time = min(plain), min(instrumented)
+
+    histogram = Histogram()
+    record = timeit.timeit(lambda: histogram.record(123456), number=200000) / 200000
+    counter = Registry().counter('bench_total')
+    increment = timeit.timeit('counter.value += 1', globals={'counter': counter}, number=1000000) / 1000000
+
+    print(f"{frame_count} tags in {len(chunks)} chunks of {args.chunk_size} bytes, best of {args.rounds}")
+    print(f"      plain: {plain_time / tags * 1e9:7.1f} ns/tag")
+    print(f"instrumented: {instrumented_time / tags * 1e9:7.1f} ns/tag")
+    print(f"   overhead: {(instrumented_time / plain_time - 1) * 100:+.2f} %")
+    print(f"histogram.record: {record * 1e9:.0f} ns, counter increment: {increment * 1e9:.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+    Benchmark of the serial transport against a simulated reader served on a pseudo terminal: command round trip of
+    a plain serial.Serial(timeout=1) read (the previous api.open_device behaviour) versus SerialTransport, time of the
+    baud rate detection, and tag streaming throughput/latency through the transport's background reader.
+
+    Run from the repository root with: python -m benchmarks.bench_serial [--rate 20000] [--seconds 5]
+"""
+import argparse
+import asyncio
+import queue
+import statistics
+import threading
+import time
+
+import serial
+
+import api
+from benchmarks.bench_end_to_end import percentile
+from serial_transport import SerialTransport, detect_baud_rate, BAUD_RATES
+from simulator import SimulatedReader, epc_timestamp
+
+
+def start_simulator(baud_rate, rate):
+    started = queue.Queue()
+
+    def run():
+        async def serve():
+            started.put(await SimulatedReader(rate=rate, timestamps=True).start_serial(baud_rate))
+            await asyncio.Event().wait()
+
+        asyncio.run(serve())
+
+    threading.Thread(target=run, name='simulated-serial-reader', daemon=True).start()
+    return started.get()
+
+
+def command_latencies(connection, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        api.get_device_info(connection, 'serial')
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rate', type=int, default=20000, help='tag notifications per second')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--commands', type=int, default=5, help='round trips measured with each transport')
+    args = parser.parse_args()
+
+    baud_rate = BAUD_RATES[-1]
+    reader = start_simulator(baud_rate, args.rate)
+
+    plain = serial.Serial(reader.serial_port, baud_rate, timeout=1)
+    plain_latency = statistics.median(command_latencies(plain, args.commands))
+    plain.close()
+
+    latencies = []
+    counts = {'tags': 0}
+
+    def on_tags(tags):
+        now = time.monotonic_ns()
+        counts['tags'] += len(tags)
+        latencies.extend(now - epc_timestamp(tag.epc) for tag in tags)
+
+    transport = SerialTransport(reader.serial_port, BAUD_RATES[0], on_tags)
+    start = time.perf_counter()
+    detected = detect_baud_rate(transport)
+    detect_time = time.perf_counter() - start
+    transport_latency = statistics.median(command_latencies(transport, args.commands))
+
+    api.start_reading_mode(transport, 'serial')
+    time.sleep(0.5)  # Warm up.
+    latencies.clear()
+    start_tags, start_wall = counts['tags'], time.perf_counter()
+    time.sleep(args.seconds)
+    tags, wall = counts['tags'] - start_tags, time.perf_counter() - start_wall
+    samples = sorted(latencies)
+    api.stop_reading_mode(transport, 'serial')
+    transport.close()
+
+    print(f"get_device_info round trip: serial.Serial(timeout=1) {plain_latency * 1e3:.1f} ms, "
+          f"SerialTransport {transport_latency * 1e3:.2f} ms")
+    print(f"baud rate detection: {detected} baud found in {detect_time * 1e3:.0f} ms "
+          f"(trying {BAUD_RATES[:BAUD_RATES.index(detected) + 1] if detected else BAUD_RATES})")
+    print(f"streaming: offered {args.rate} tags/s, received {tags / wall:,.0f} tags/s, "
+          f"latency p50 {percentile(samples, 0.50) / 1e6:.2f} ms, p99 {percentile(samples, 0.99) / 1e6:.2f} ms, "
+          f"{transport.decoder.crc_errors} CRC errors")
+
+
+if __name__ == '__main__':
+    main()
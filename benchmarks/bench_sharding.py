@@ -0,0 +1,54 @@
+"""
+    Benchmark of the sharded ingestion (sharding.ShardedIngestor) against simulated readers running in a separate
+    process, for several worker counts. Reports the tags/sec collected by the parent. Scaling with the number of
+    workers needs at least as many free cores as workers, plus one for the simulators.
+
+    Run from the repository root with: python -m benchmarks.bench_sharding [--readers 16] [--rate 5000] [--workers 1 2 4]
+"""
+import argparse
+import multiprocessing
+import time
+
+from benchmarks.bench_end_to_end import run_simulators
+from sharding import ShardedIngestor, TAG_RECORD
+
+
+def measure(ports, workers, seconds):
+    ingestor = ShardedIngestor([('127.0.0.1', port) for port in ports], workers).start()
+    time.sleep(1.0)  # Worker start up (spawn) and warm up.
+    ingestor.poll_records()
+    start_tags, start_wall = ingestor.received, time.perf_counter()
+    deadline = start_wall + seconds
+    while time.perf_counter() < deadline:
+        if not ingestor.poll_records():
+            ingestor.wait(deadline - time.perf_counter())
+    tags, wall = ingestor.received - start_tags, time.perf_counter() - start_wall
+    ingestor.stop()
+    return tags, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--rate', type=int, default=5000, help='tag notifications per second and per reader')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    print(f"readers: {args.readers}, offered: {args.readers * args.rate} tags/s, "
+          f"cores: {multiprocessing.cpu_count()}, record: {TAG_RECORD.size} bytes")
+    for workers in args.workers:
+        parent, child = multiprocessing.Pipe()
+        simulators = multiprocessing.Process(target=run_simulators, args=(child, args.readers, {'rate': args.rate}),
+                                             daemon=True)
+        simulators.start()
+        ports = parent.recv()
+        tags, wall = measure(ports, workers, args.seconds)
+        parent.send('stop')
+        parent.recv()
+        simulators.join(5)
+        print(f"workers: {workers}, received: {tags / wall:,.0f} tags/s ({tags} tags in {wall:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
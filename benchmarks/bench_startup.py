@@ -0,0 +1,61 @@
+"""
+    Startup benchmark of the headless mode: restarts daemon.py against simulated readers and measures the time from
+    launching the process to the first tag received (time-to-first-tag), with the startup phases reported by the
+    daemon itself. Also measures the import time of main.py, which no longer loads the gui toolkit.
+
+    Run from the repository root with: python -m benchmarks.bench_startup [--readers 4] [--restarts 10]
+"""
+import argparse
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_end_to_end import run_simulators
+
+
+def time_command(command):
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, timeout=60)
+    elapsed = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    return elapsed, result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--restarts', type=int, default=10)
+    args = parser.parse_args()
+
+    parent, child = multiprocessing.Pipe()
+    simulators = multiprocessing.Process(target=run_simulators, args=(child, args.readers, {'rate': 1000}),
+                                         daemon=True)
+    simulators.start()
+    ports = parent.recv()
+
+    imports = [time_command([sys.executable, '-c', 'import main'])[0] for _ in range(args.restarts)]
+    command = [sys.executable, 'daemon.py', '--first-tag-exit'] + [f'127.0.0.1:{port}' for port in ports]
+    totals, phases = [], {}
+    for _ in range(args.restarts):
+        elapsed, output = time_command(command)
+        totals.append(elapsed)
+        for item in output.split():
+            phase, _, value = item.partition('=')
+            phases.setdefault(phase, []).append(float(value.rstrip('ms')))
+
+    parent.send('stop')
+    parent.recv()
+    simulators.join(5)
+
+    print(f"readers: {args.readers}, restarts: {args.restarts} (medians)")
+    print(f"import main: {statistics.median(imports) * 1e3:.1f} ms")
+    for phase, values in phases.items():
+        print(f"{phase} (in process): {statistics.median(values):.1f} ms")
+    print(f"launch to exit after first tag: {statistics.median(totals) * 1e3:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""
+    Publish/subscribe fan-out of the decoded tags. The receive loop publishes every batch of tags once; each subscriber
+    (gui, PLC bridge, UDP broadcaster, file sink...) has its own bounded queue and its own thread calling its sink with
+    batches of tags. The receive loop only appends to the queues, so a slow or stuck sink never delays the socket reads
+    or the other subscribers: what happens when its queue is full is decided by its policy. BLOCK is the only policy
+    applying back-pressure, and a stuck sink can hold up the receive loop only once by block_timeout: after a timeout
+    it drops instead of waiting until its queue has drained.
+
+    Set RFID_TAG_FILE=path and/or RFID_TAG_UDP=host:port to attach the file and UDP sinks in main.py / daemon.py.
+"""
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+
+from logs import get_logger
+
+DROP_OLDEST = 'drop-oldest'  # A full queue drops its oldest tag to make room, the sink sees the most recent tags.
+BLOCK = 'block'  # A full queue makes publish() wait up to block_timeout for room, then new tags are dropped.
+COALESCE = 'coalesce'  # Pending reads of the same EPC are merged into the latest one, a full queue drops the oldest.
+POLICIES = (DROP_OLDEST, BLOCK, COALESCE)
+
+logger = get_logger('bus')
+
+
+def epc_key(item):
+    """
+        Function returning the coalescing key of a published (reader, TagRead) item.
+    """
+    return item[0], item[1].epc
+
+
+class Subscription:
+    """
+        One subscriber: a bounded queue of (enqueue time, item) and the thread delivering batches to the sink.
+    """
+
+    def __init__(self, name, sink, maxsize=10000, policy=DROP_OLDEST, batch_size=500, flush_interval=0.1,
+                 block_timeout=0.05, key=epc_key):
+        """
+            :param name: Name of the subscriber, used in the logs and the metrics.
+            :param sink: Callable receiving a list of (reader, TagRead), called from the subscription thread.
+            :param maxsize: Maximum number of tags waiting for the sink.
+            :param policy: DROP_OLDEST, BLOCK or COALESCE.
+            :param batch_size: Maximum number of tags per sink call.
+            :param flush_interval: Seconds the thread waits for a batch to fill up before calling the sink anyway.
+            :param block_timeout: With BLOCK, seconds publish() may wait for room. Once a wait times out the
+            subscription drops instead of waiting until the sink has emptied its queue, so a stuck sink holds up the
+            receive loop once, not at every publish().
+            :param key: With COALESCE, callable returning the key of the tags to merge.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {POLICIES}")
+        self.name = name
+        self.sink = sink
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.key = key
+        self._queue = OrderedDict() if policy == COALESCE else deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closing = False
+        self._stalled = False  # BLOCK only: a wait timed out, don't wait again before the queue is drained.
+        self.published = 0  # Tags offered to this subscriber.
+        self.delivered = 0  # Tags handed to the sink.
+        self.dropped = 0  # Tags lost because the queue was full.
+        self.coalesced = 0  # Tags merged into a pending read of the same EPC.
+        self.sink_errors = 0
+        self.max_depth = 0
+        self.last_latency = 0.0  # Seconds between the publication of the oldest tag of the last batch and its delivery.
+        self.thread = threading.Thread(target=self._run, name=f'rfid-bus-{name}', daemon=True)
+        self.thread.start()
+
+    def put_many(self, items):
+        """
+            Function to queue tags for the sink, called by TagBus.publish().
+        """
+        now = time.monotonic()
+        deadline = now + self.block_timeout
+        queue = self._queue
+        with self._lock:
+            if self._closing:
+                return
+            self.published += len(items)
+            for item in items:
+                if self.policy == COALESCE:
+                    key = self.key(item)
+                    pending = queue.get(key)
+                    if pending is not None:
+                        queue[key] = (pending[0], item)  # Keeps its place and the time of the first pending read.
+                        self.coalesced += 1
+                        continue
+                    if len(queue) >= self.maxsize:
+                        queue.popitem(last=False)
+                        self.dropped += 1
+                    queue[key] = (now, item)
+                    continue
+                if len(queue) >= self.maxsize:
+                    if self.policy == DROP_OLDEST:
+                        queue.popleft()
+                        self.dropped += 1
+                    elif self._stalled or not self._not_full.wait_for(lambda: len(queue) < self.maxsize,
+                                                                      max(0.0, deadline - time.monotonic())):
+                        self._stalled = True
+                        self.dropped += 1
+                        continue
+                queue.append((now, item))
+            if len(queue) > self.max_depth:
+                self.max_depth = len(queue)
+            self._not_empty.notify()
+
+    def _take_batch(self):
+        # Waits for a first tag, then up to flush_interval for the batch to fill up.
+        queue = self._queue
+        with self._lock:
+            self._not_empty.wait_for(lambda: queue or self._closing)
+            if not queue:
+                return None
+            if len(queue) < self.batch_size and not self._closing:
+                self._not_empty.wait_for(lambda: len(queue) >= self.batch_size or self._closing, self.flush_interval)
+            count = min(len(queue), self.batch_size)
+            if self.policy == COALESCE:
+                entries = [queue.popitem(last=False)[1] for _ in range(count)]
+            else:
+                entries = [queue.popleft() for _ in range(count)]
+            if not queue:
+                self._stalled = False  # The sink caught up, publish() may wait for it again.
+            self._not_full.notify_all()
+        return entries
+
+    def _run(self):
+        while True:
+            entries = self._take_batch()
+            if entries is None:
+                return
+            try:
+                self.sink([item for _, item in entries])
+            except Exception as e:
+                self.sink_errors += 1
+                logger.exception('Sink %s failed on a batch of %d tags: %s', self.name, len(entries), e)
+            self.delivered += len(entries)
+            self.last_latency = time.monotonic() - entries[0][0]
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def lag(self):
+        """
+            Function to measure how far behind the sink is.
+            :return: Seconds since the oldest tag waiting in the queue was published, 0 when the queue is empty.
+        """
+        with self._lock:
+            if not self._queue:
+                return 0.0
+            oldest = next(iter(self._queue.values())) if self.policy == COALESCE else self._queue[0]
+            return time.monotonic() - oldest[0]
+
+    def stats(self):
+        """
+            Function to get the metrics of the subscriber.
+            :return: Dict of the counters, queue depth and lag.
+        """
+        return {'policy': self.policy, 'published': self.published, 'delivered': self.delivered,
+                'dropped': self.dropped, 'coalesced': self.coalesced, 'sink_errors': self.sink_errors,
+                'depth': self.depth, 'max_depth': self.max_depth, 'lag': self.lag(),
+                'last_latency': self.last_latency}
+
+    def close(self, timeout=2):
+        """
+            Function to deliver the tags still queued (within the timeout) and stop the thread.
+        """
+        with self._lock:
+            self._closing = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        self.thread.join(timeout)
+
+
+class TagBus:
+    """
+        Fan-out of the tags published by the receive loop to any number of subscribers.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, name, sink, **options):
+        """
+            Function to add a subscriber, see Subscription for the options.
+            :return: The Subscription.
+        """
+        subscription = Subscription(name, sink, **options)
+        with self._lock:
+            previous = self._subscriptions.get(name)
+            # Copy on write, so publish() iterates over the subscriptions without taking the lock.
+            self._subscriptions = {**self._subscriptions, name: subscription}
+        if previous is not None:
+            previous.close()
+        return subscription
+
+    def unsubscribe(self, name):
+        with self._lock:
+            subscriptions = dict(self._subscriptions)
+            subscription = subscriptions.pop(name, None)
+            self._subscriptions = subscriptions
+        if subscription is not None:
+            subscription.close()
+
+    def publish(self, reader, tags):
+        """
+            Function to hand a batch of decoded tags to every subscriber.
+            :param reader: The reader the tags come from, e.g. 'ip:port'.
+            :param tags: List of protocol.TagRead.
+        """
+        if not tags:
+            return
+        subscriptions = self._subscriptions
+        if subscriptions:
+            items = [(reader, tag) for tag in tags]
+            for subscription in subscriptions.values():
+                subscription.put_many(items)
+
+    def stats(self):
+        """
+            :return: Dict of subscriber name -> metrics, see Subscription.stats().
+        """
+        return {name: subscription.stats() for name, subscription in self._subscriptions.items()}
+
+    def close(self):
+        for name in list(self._subscriptions):
+            self.unsubscribe(name)
+
+
+def format_tag_line(reader, tag):
+    return f"{time.time():.3f} {reader} {tag.epc} {tag.antenna} {tag.rssi}"
+
+
+class FileSink:
+    """
+        Appends one line per tag to a text file, one write and one flush per batch.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'a')
+
+    def __call__(self, batch):
+        self._file.write(''.join(format_tag_line(reader, tag) + '\n' for reader, tag in batch))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class UdpSink:
+    """
+        Broadcasts the tags as UDP datagrams of text lines, as many lines per datagram as fit in max_datagram bytes.
+    """
+
+    def __init__(self, address, max_datagram=1400, broadcast=False):
+        """
+            :param address: (host, port) to send to.
+            :param max_datagram: Maximum payload per datagram, the default stays under a common Ethernet MTU.
+            :param broadcast: Allow a broadcast address.
+        """
+        self.address = address
+        self.max_datagram = max_datagram
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if broadcast:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    def __call__(self, batch):
+        datagram = bytearray()
+        for reader, tag in batch:
+            line = (format_tag_line(reader, tag) + '\n').encode()
+            if datagram and len(datagram) + len(line) > self.max_datagram:
+                self._socket.sendto(datagram, self.address)
+                datagram.clear()
+            datagram += line
+        if datagram:
+            self._socket.sendto(datagram, self.address)
+
+    def close(self):
+        self._socket.close()
+
+
+def subscribe_environment_sinks(bus, environ):
+    """
+        Function to attach the sinks configured with RFID_TAG_FILE / RFID_TAG_UDP.
+        :param environ: os.environ or an equivalent mapping.
+        :return: List of the sinks opened, to close once the bus is closed.
+    """
+    sinks = []
+    if environ.get('RFID_TAG_FILE'):
+        sink = FileSink(environ['RFID_TAG_FILE'])
+        bus.subscribe('file', sink, policy=DROP_OLDEST)  # A stuck disk must not hold up the receive loop.
+        sinks.append(sink)
+    if environ.get('RFID_TAG_UDP'):
+        host, _, port = environ['RFID_TAG_UDP'].rpartition(':')
+        sink = UdpSink((host, int(port)), broadcast=host.endswith('.255'))
+        bus.subscribe('udp', sink, policy=COALESCE)  # Listeners want the latest read of each tag, not every read.
+        sinks.append(sink)
+    return sinks
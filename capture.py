@@ -0,0 +1,165 @@
+"""
+    Capture of the raw bytes received from the rfid readers, and replay of a capture through a decoder.
+
+    A capture file starts with the CAPTURE_MAGIC header followed by records: a RECORD_HEADER (kind, monotonic
+    timestamp in ns, reader id, length) and `length` bytes. KIND_READER records name a reader id the first time it is
+    used, KIND_CHUNK records hold one chunk exactly as returned by recv().
+
+    Replay from the repository root with: python capture.py replay FILE [--speed N] [--decoder frame|legacy]
+"""
+import argparse
+import struct
+import threading
+import time
+
+CAPTURE_MAGIC = b'RFIDCAP1'
+RECORD_HEADER = struct.Struct('<BqHI')
+KIND_READER = 0
+KIND_CHUNK = 1
+
+
+class CaptureWriter:
+    """
+        Appends raw chunks to a capture file. write() is safe to call from several receive threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(CAPTURE_MAGIC)
+        self._readers = {}
+        self._lock = threading.Lock()
+        self.chunks = 0
+
+    def write(self, reader, chunk, timestamp_ns=None):
+        """
+            Function to record one chunk.
+            :param reader: Name of the reader the chunk came from, e.g. 'ip:port'.
+            :param chunk: The bytes returned by recv().
+            :param timestamp_ns: time.monotonic_ns() of the reception, defaults to now.
+        """
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        with self._lock:
+            reader_id = self._readers.get(reader)
+            if reader_id is None:
+                reader_id = self._readers[reader] = len(self._readers)
+                name = reader.encode()
+                self._file.write(RECORD_HEADER.pack(KIND_READER, timestamp_ns, reader_id, len(name)) + name)
+            self._file.write(RECORD_HEADER.pack(KIND_CHUNK, timestamp_ns, reader_id, len(chunk)))
+            self._file.write(chunk)
+            self.chunks += 1
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_capture(path):
+    """
+        Generator over the chunks of a capture file.
+        :return: Iterator of (timestamp_ns, reader, chunk).
+    """
+    readers = {}
+    with open(path, 'rb') as capture_file:
+        if capture_file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            header = capture_file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return  # End of file, or a record cut short by a crash.
+            kind, timestamp_ns, reader_id, length = RECORD_HEADER.unpack(header)
+            data = capture_file.read(length)
+            if len(data) < length:
+                return
+            if kind == KIND_READER:
+                readers[reader_id] = data.decode()
+            elif kind == KIND_CHUNK:
+                yield timestamp_ns, readers.get(reader_id, str(reader_id)), data
+
+
+def replay(path, on_chunk, speed=None):
+    """
+        Function to feed a capture back, chunk by chunk, keeping the original timing scaled by `speed`.
+        :param path: The capture file.
+        :param on_chunk: Callable receiving (reader, chunk).
+        :param speed: 1 for real time, N for N times faster, None (or 0) for as fast as possible.
+        :return: Number of chunks replayed.
+    """
+    chunks = 0
+    first = None
+    started = time.monotonic()
+    for timestamp_ns, reader, chunk in read_capture(path):
+        if speed:
+            if first is None:
+                first = timestamp_ns
+            delay = (timestamp_ns - first) / 1e9 / speed - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        on_chunk(reader, chunk)
+        chunks += 1
+    return chunks
+
+
+def frame_decoder_sink():
+    """
+        Function returning an on_chunk callable decoding with one TagFrameDecoder per reader, and the tag counter.
+    """
+    from protocol import TagFrameDecoder
+
+    decoders = {}
+    counts = {'tags': 0}
+
+    def on_chunk(reader, chunk):
+        decoder = decoders.get(reader)
+        if decoder is None:
+            decoder = decoders[reader] = TagFrameDecoder()
+        counts['tags'] += len(decoder.feed(chunk))
+
+    return on_chunk, counts
+
+
+def legacy_decoder_sink():
+    """
+        Function returning an on_chunk callable using main.get_rfid_tag_info (first frame of each chunk only).
+    """
+    from main import get_rfid_tag_info
+
+    counts = {'tags': 0}
+
+    def on_chunk(reader, chunk):
+        if get_rfid_tag_info(chunk):
+            counts['tags'] += 1
+
+    return on_chunk, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a raw capture of the rfid reader streams')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = subcommands.add_parser('replay')
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('--speed', type=float, default=0, help='1 for real time, N for Nx, 0 for maximum')
+    replay_parser.add_argument('--decoder', choices=('frame', 'legacy'), default='frame')
+    args = parser.parse_args()
+
+    on_chunk, counts = frame_decoder_sink() if args.decoder == 'frame' else legacy_decoder_sink()
+    size = {'bytes': 0}
+
+    def measure(reader, chunk):
+        size['bytes'] += len(chunk)
+        on_chunk(reader, chunk)
+
+    start = time.perf_counter()
+    chunks = replay(args.path, measure, args.speed or None)
+    elapsed = time.perf_counter() - start
+    print(f"{chunks} chunks, {size['bytes'] / 1e6:.2f} MB, {counts['tags']} tags in {elapsed:.3f} s "
+          f"({size['bytes'] / elapsed / 1e6:.2f} MB/s, {counts['tags'] / elapsed:,.0f} tags/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+"""
+    pytest configuration: the modules live at the repository root, which pytest puts on sys.path because of this file.
+
+    Run from the repository root with: python -m pytest -q
+"""
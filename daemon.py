@@ -0,0 +1,174 @@
+"""
+    Headless entry point for kiosk and server boxes: connects to the given readers, starts the reading mode, streams
+    the tags to the log, the tag event store and the bus sinks (see bus.py), and stops the readers on SIGINT/SIGTERM.
+    Nothing of the gui is imported, so the program starts without a display and reaches the first tag quickly after a
+    restart.
+
+    Run from the repository root with: python daemon.py [--store DIR] [--first-tag-exit] ip[:port] ...
+    (python main.py --headless ... is equivalent)
+"""
+import time
+
+STARTED = time.monotonic()  # Reference for the startup timings, taken before the other imports.
+
+import argparse
+import logging
+import os
+import signal
+
+from aggregator import TagAggregator, format_tag_event
+from bus import TagBus, subscribe_environment_sinks
+from eventstore import TagEventStore
+from logs import configure_logging, get_logger, TagLogSampler
+from metrics import ReaderMetrics, start_http_server
+from protocol import TagFrameDecoder
+from reactor import SessionReactor
+from session import ReaderSession, READING
+
+logger = get_logger('daemon')
+
+
+class StartupTimer:
+    """
+        Records how long each startup phase took, counted from the start of the process (the import of this module).
+    """
+
+    def __init__(self, started=STARTED):
+        self.started = started
+        self.phases = {}
+
+    def mark(self, phase):
+        """
+            Function to record the end of a phase, only the first call for a given phase counts.
+            :return: Seconds since the start, for the first call.
+        """
+        if phase not in self.phases:
+            self.phases[phase] = time.monotonic() - self.started
+            logger.info('startup: %s after %.1f ms', phase, self.phases[phase] * 1e3)
+        return self.phases[phase]
+
+
+def run_headless(readers, store_dir=None, dwell_window=2.0, first_tag_exit=False, metrics_port=None):
+    """
+        Function to run the connect/start/stream/stop lifecycle of the readers without the gui, until SIGINT/SIGTERM.
+        :param readers: List of (ip, port).
+        :param store_dir: Directory of the tag event store, None to not store the reads.
+        :param dwell_window: Seconds without a read after which a tag is reported as departed.
+        :param first_tag_exit: Stop as soon as the first tag is received, used to measure the startup time.
+        :param metrics_port: Port of the local metrics HTTP endpoint (see metrics.py), None to not serve them.
+        :return: The StartupTimer holding the startup timings.
+    """
+    timer = StartupTimer()
+    timer.mark('imports done')
+    store = TagEventStore(store_dir) if store_dir else None
+    bus = TagBus()
+    sinks = subscribe_environment_sinks(bus, os.environ)
+    metrics_server = start_http_server(metrics_port) if metrics_port is not None else None
+    reactor = SessionReactor()
+    reading = set()
+
+    def on_state_change(session):
+        if session.state == READING:
+            reading.add(session)
+            if len(reading) == len(sessions):
+                timer.mark('readers reading')
+        else:
+            reading.discard(session)
+
+    # The reactor connects every session at once without blocking, so offline readers don't delay the others, and
+    # starts the reading mode as soon as each connection is up; readers that could not be reached are retried with the
+    # session backoff.
+    sessions = [ReaderSession(ip, port, on_state_change=on_state_change) for ip, port in readers]
+
+    def make_handler(session):
+        decoder = TagFrameDecoder(on_response=session.on_response)
+        aggregator = TagAggregator(dwell_window)
+        reader_name = f'{session.ip}:{session.port}'
+        event_log = get_logger('tags', reader_name)
+        reader_metrics = ReaderMetrics(reader_name, decoder)
+        tag_log = TagLogSampler(event_log)  # Every read at debug level, rate limited; arrivals/departures at info.
+        generation = session.generation
+
+        def on_data(reader_session, data):
+            nonlocal generation
+            if reader_session.generation != generation:
+                if decoder.pending:
+                    reader_metrics.partial_frames.value += 1
+                decoder.reset()  # Partial frames from the old connection can't be completed.
+                generation = reader_session.generation
+            start = time.perf_counter_ns()
+            tags = decoder.feed(data)
+            reader_metrics.observe(len(data), len(tags), time.perf_counter_ns() - start)
+            if not tags:
+                return
+            bus.publish(reader_name, tags)
+            if 'first tag' not in timer.phases:
+                timer.mark('first tag')
+                if first_tag_exit:
+                    reactor.stop()
+            for tag in tags:
+                tag_log.log(tag)
+                if store:
+                    store.append(tag.epc, reader_session.ip)
+                tag_event = aggregator.observe(tag)
+                if tag_event:
+                    event_log.info(format_tag_event(tag_event))
+
+        def expire_tags():
+            for tag_event in aggregator.expire():
+                event_log.info(format_tag_event(tag_event))
+
+        return on_data, expire_tags
+
+    for session in sessions:
+        session.reading = True
+        on_data, expire_tags = make_handler(session)
+        reactor.add(session, on_data)
+        reactor.add_timer(min(dwell_window / 4, 0.5), expire_tags)
+
+    def request_stop(signum, frame):
+        logger.info('Signal %d received, stopping.', signum)
+        reactor.stop()
+
+    previous_handlers = {signum: signal.signal(signum, request_stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        reactor.run()
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        for session in sessions:
+            if session.connection is not None:
+                session.stop_reading()
+            session.close()
+        reactor.close()
+        bus.close()
+        if metrics_server:
+            metrics_server.shutdown()
+        for sink in sinks:
+            sink.close()
+        if store:
+            store.close()
+    return timer
+
+
+def main(argv=None):
+    from fleet import READER_IPS, READER_PORT, parse_reader
+
+    parser = argparse.ArgumentParser(description='Read rfid readers without the gui')
+    parser.add_argument('readers', nargs='*', help='ip[:port], defaults to the configured readers')
+    parser.add_argument('--store', default=None, help='directory of the tag event store, not stored by default')
+    parser.add_argument('--dwell', type=float, default=2.0, help='seconds without a read before a tag departs')
+    parser.add_argument('--first-tag-exit', action='store_true', help='exit at the first tag (startup measurement)')
+    parser.add_argument('--metrics-port', type=int, default=None, help='serve metrics on http://127.0.0.1:PORT/metrics')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args(argv)
+    configure_logging(logging.DEBUG if args.debug else logging.INFO)
+
+    readers = [parse_reader(reader) for reader in args.readers] or [(ip, READER_PORT) for ip in READER_IPS]
+    timer = run_headless(readers, args.store, args.dwell, args.first_tag_exit, args.metrics_port)
+    if args.first_tag_exit:
+        print(' '.join(f'{phase.replace(" ", "_")}={seconds * 1e3:.1f}ms' for phase, seconds in timer.phases.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""
+    Append-only store of tag reads on disk, so they outlive the gui window.
+
+    Reads are packed into fixed-width binary records and appended to numbered segment files by a background writer
+    thread that commits them in groups, so the receive path never waits for the disk. When a segment is full it is
+    sealed and a sidecar index is written next to it: one entry per (EPC, time bucket) holding the last record of that
+    EPC in the bucket, sorted so a lookup is a binary search over the memory-mapped index instead of a scan of the
+    records.
+
+    Segment files: segment-NNNNNN.dat (records) and segment-NNNNNN.idx (index, sealed segments only).
+"""
+import hashlib
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from logs import get_logger
+from protocol import STATUS_SUCCESS
+
+# timestamp_ns(8) reader IPv4(4) status(1) EPC length(1) EPC(32) padding(2)
+RECORD = struct.Struct('<q4sBB32s2x')
+MAX_EPC_LEN = 32
+# EPC hash(8) time bucket(4) record number in the segment(4)
+INDEX_ENTRY = struct.Struct('<QII')
+
+StoredEvent = namedtuple('StoredEvent', ['timestamp', 'reader', 'epc', 'status'])
+
+logger = get_logger('eventstore')
+
+
+def epc_hash(epc):
+    """
+        Function to compute the 64 bit key of an EPC used by the index.
+        :param epc: Raw EPC bytes.
+    """
+    return int.from_bytes(hashlib.blake2b(epc, digest_size=8).digest(), 'little')
+
+
+def _reader_address(reader):
+    # 'ip' or 'ip:port' -> 4 bytes, zeros when the reader is not an IPv4 address.
+    try:
+        return socket.inet_aton(reader.rsplit(':', 1)[0] if reader.count(':') == 1 else reader)
+    except OSError:
+        return bytes(4)
+
+
+def _unpack_record(buffer, offset=0):
+    timestamp, address, status, epc_len, epc = RECORD.unpack_from(buffer, offset)
+    return StoredEvent(timestamp / 1e9, socket.inet_ntoa(address), epc[:epc_len].hex(), status)
+
+
+class SealedSegment:
+    """
+        A full segment and its index, both memory mapped for queries.
+    """
+
+    def __init__(self, data_path, index_path):
+        self.data_path = data_path
+        self.index_path = index_path
+        with open(data_path, 'rb') as data_file:
+            self.data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(data_path) \
+                else b''
+        with open(index_path, 'rb') as index_file:
+            self.index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(index_path) \
+                else b''
+        self.entries = len(self.index) // INDEX_ENTRY.size
+
+    def _entry(self, position):
+        return INDEX_ENTRY.unpack_from(self.index, position * INDEX_ENTRY.size)
+
+    def lookup(self, key, first_bucket=0, last_bucket=0xFFFFFFFF):
+        """
+            Function to find the index entries of an EPC hash within a bucket range.
+            :return: List of (bucket, record number), oldest bucket first.
+        """
+        entries = self.entries
+        # Binary search for the first entry >= (key, first_bucket), the entries are sorted by (hash, bucket).
+        low, high = 0, entries
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, bucket, _ = self._entry(middle)
+            if (entry_key, bucket) < (key, first_bucket):
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < entries:
+            entry_key, bucket, record_number = self._entry(low)
+            if entry_key != key or bucket > last_bucket:
+                break
+            found.append((bucket, record_number))
+            low += 1
+        return found
+
+    def record(self, record_number):
+        return _unpack_record(self.data, record_number * RECORD.size)
+
+    def close(self):
+        for mapped in (self.data, self.index):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+
+def write_index(data_path, index_path, bucket_ns):
+    """
+        Function to build the sidecar index of a segment file.
+    """
+    latest = {}
+    with open(data_path, 'rb') as data_file:
+        data = data_file.read()
+    for record_number in range(len(data) // RECORD.size):
+        timestamp, _, _, epc_len, epc = RECORD.unpack_from(data, record_number * RECORD.size)
+        latest[(epc_hash(epc[:epc_len]), timestamp // bucket_ns)] = record_number
+    with open(index_path + '.tmp', 'wb') as index_file:
+        index_file.write(b''.join(INDEX_ENTRY.pack(key, bucket, record_number)
+                                  for (key, bucket), record_number in sorted(latest.items())))
+    os.replace(index_path + '.tmp', index_path)
+
+
+class TagEventStore:
+    """
+        Persistent, indexed store of tag reads. append() is safe to call from any thread and never touches the disk.
+    """
+
+    def __init__(self, directory, segment_records=1000000, bucket_seconds=60, commit_interval=0.2,
+                 max_pending=200000, fsync=False):
+        """
+            :param directory: Directory of the segment files, created if needed.
+            :param segment_records: Number of records after which a segment is sealed and indexed.
+            :param bucket_seconds: Width of the time buckets of the index.
+            :param commit_interval: Seconds between two group commits.
+            :param max_pending: Records buffered in memory at most; when the disk can't keep up, new records are
+            dropped (and counted in `dropped`) rather than slowing down the caller.
+            :param fsync: Also fsync every group commit.
+        """
+        self.directory = directory
+        self.segment_records = segment_records
+        self.bucket_ns = int(bucket_seconds * 1e9)
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.appended = 0
+        self.dropped = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.sealed = []  # SealedSegment, oldest first
+        numbers = sorted(int(name[8:14]) for name in os.listdir(directory)
+                         if name.startswith('segment-') and name.endswith('.dat'))
+        for number in numbers:
+            data_path, index_path = self._paths(number)
+            if not os.path.exists(index_path):  # Segment left active by the previous run.
+                write_index(data_path, index_path, self.bucket_ns)
+            self.sealed.append(SealedSegment(data_path, index_path))
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._active_index = {}  # EPC hash -> {bucket: record number} for the active segment
+        self._active_number = (numbers[-1] + 1) if numbers else 1
+        self._active_records = 0
+        self._active_file = open(self._paths(self._active_number)[0], 'ab')
+        self._wakeup = threading.Event()
+        self._flushed = threading.Condition()
+        self._commits = 0
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name='rfid-eventstore', daemon=True)
+        self._writer.start()
+
+    def _paths(self, number):
+        base = os.path.join(self.directory, f'segment-{number:06d}')
+        return base + '.dat', base + '.idx'
+
+    def append(self, epc, reader='', status=STATUS_SUCCESS, timestamp=None):
+        """
+            Function to queue one tag read for the next group commit.
+            :param epc: The EPC as a hexadecimal string (longer EPCs are truncated to MAX_EPC_LEN bytes).
+            :param reader: IP address (or 'ip:port') of the reader.
+            :param status: Status code of the read.
+            :param timestamp: Time of the read in seconds, defaults to time.time().
+            :return: True if the read was queued, False if it was dropped.
+        """
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return False
+        raw = bytes.fromhex(epc)[:MAX_EPC_LEN]
+        timestamp_ns = time.time_ns() if timestamp is None else int(timestamp * 1e9)
+        record = RECORD.pack(timestamp_ns, _reader_address(reader), status, len(raw), raw)
+        with self._lock:
+            self._pending.append((record, epc_hash(raw), timestamp_ns // self.bucket_ns))
+            if len(self._pending) == self.max_pending // 2:
+                self._wakeup.set()  # Commit early rather than drop reads in a burst.
+        self.appended += 1
+        return True
+
+    def _write_loop(self):
+        while True:
+            self._wakeup.wait(self.commit_interval)
+            self._wakeup.clear()
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                try:
+                    self._commit(batch)
+                except OSError as e:
+                    logger.error('Failed to write %d tag events: %s', len(batch), e)
+            with self._flushed:
+                self._commits += 1
+                self._flushed.notify_all()
+            if self._closed and not self._pending:
+                break
+
+    def _commit(self, batch):
+        position = 0
+        while position < len(batch):
+            room = self.segment_records - self._active_records
+            chunk = batch[position:position + room]
+            self._active_file.write(b''.join(record for record, _, _ in chunk))
+            self._active_file.flush()
+            if self.fsync:
+                os.fsync(self._active_file.fileno())
+            with self._lock:
+                active_index = self._active_index
+                for offset, (_, key, bucket) in enumerate(chunk, self._active_records):
+                    buckets = active_index.get(key)
+                    if buckets is None:
+                        active_index[key] = {bucket: offset}
+                    else:
+                        buckets[bucket] = offset
+            self._active_records += len(chunk)
+            position += len(chunk)
+            if self._active_records >= self.segment_records:
+                self._seal()
+
+    def _seal(self):
+        # Called on the writer thread: index the full segment and start the next one.
+        self._active_file.close()
+        data_path, index_path = self._paths(self._active_number)
+        with open(index_path + '.tmp', 'wb') as index_file:
+            index_file.write(b''.join(INDEX_ENTRY.pack(key, bucket, buckets[bucket])
+                                      for key, buckets in sorted(self._active_index.items())
+                                      for bucket in sorted(buckets)))
+        os.replace(index_path + '.tmp', index_path)
+        segment = SealedSegment(data_path, index_path)
+        with self._lock:
+            self.sealed.append(segment)
+            self._active_index = {}
+            self._active_number += 1
+            self._active_records = 0
+            self._active_file = open(self._paths(self._active_number)[0], 'ab')
+
+    def flush(self, timeout=5):
+        """
+            Function to wait until everything appended so far is written to the segment files.
+        """
+        with self._flushed:
+            target = self._commits + 2  # The commit in progress may have swapped its batch before our append.
+            self._wakeup.set()
+            self._flushed.wait_for(lambda: self._commits >= target or not self._writer.is_alive(), timeout)
+
+    def _active_lookup(self, key, first_bucket, last_bucket):
+        with self._lock:
+            buckets = self._active_index.get(key, {})
+            found = sorted((bucket, record_number) for bucket, record_number in buckets.items()
+                           if first_bucket <= bucket <= last_bucket)
+            data_path = self._paths(self._active_number)[0]
+        if not found:
+            return []
+        events = []
+        with open(data_path, 'rb') as data_file:  # seek() and read() rather than os.pread(), missing on Windows.
+            for _, record_number in found:
+                data_file.seek(record_number * RECORD.size)
+                events.append(_unpack_record(data_file.read(RECORD.size)))
+        return events
+
+    def history(self, epc, since=None, until=None):
+        """
+            Function to find where and when an EPC was seen: the last read of every time bucket in the range. Only
+            the reads within the range are returned, so the bucket at either end contributes nothing when its last
+            read falls outside.
+            :param epc: The EPC as a hexadecimal string.
+            :param since: Start of the range in seconds (epoch), None for no limit.
+            :param until: End of the range in seconds (epoch), None for no limit.
+            :return: List of StoredEvent, oldest first.
+        """
+        raw = bytes.fromhex(epc)[:MAX_EPC_LEN]
+        key = epc_hash(raw)
+        # Nanoseconds like append(), so a read stored with timestamp=since or until is within the range.
+        since_ns = None if since is None else int(since * 1e9)
+        until_ns = None if until is None else int(until * 1e9)
+        first_bucket = 0 if since_ns is None else since_ns // self.bucket_ns
+        last_bucket = 0xFFFFFFFF if until_ns is None else until_ns // self.bucket_ns
+        events = []
+        with self._lock:
+            sealed = list(self.sealed)
+        for segment in sealed:
+            events.extend(segment.record(record_number)
+                          for _, record_number in segment.lookup(key, first_bucket, last_bucket))
+        events.extend(self._active_lookup(key, first_bucket, last_bucket))
+        wanted = raw.hex()
+        # Drop hash collisions, and the reads of the edge buckets that are outside the range.
+        events = [event for event in events if event.epc == wanted
+                  and (since_ns is None or event.timestamp >= since_ns / 1e9)
+                  and (until_ns is None or event.timestamp <= until_ns / 1e9)]
+        events.sort(key=lambda event: event.timestamp)
+        return events
+
+    def last_seen(self, epc):
+        """
+            Function to find the last read of an EPC, newest segment first so the search usually stops early.
+            :param epc: The EPC as a hexadecimal string.
+            :return: StoredEvent, or None if the EPC was never stored.
+        """
+        raw = bytes.fromhex(epc)[:MAX_EPC_LEN]
+        key = epc_hash(raw)
+        wanted = raw.hex()
+        for event in reversed(self._active_lookup(key, 0, 0xFFFFFFFF)):
+            if event.epc == wanted:
+                return event
+        with self._lock:
+            sealed = list(self.sealed)
+        for segment in reversed(sealed):
+            for _, record_number in reversed(segment.lookup(key)):
+                event = segment.record(record_number)
+                if event.epc == wanted:
+                    return event
+        return None
+
+    def close(self):
+        """
+            Function to write the pending records and stop the writer thread. The active segment is indexed when the
+            store is opened again.
+        """
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join()
+        self._active_file.close()
+        if not self._active_records:
+            os.remove(self._paths(self._active_number)[0])
+        for segment in self.sealed:
+            segment.close()
@@ -0,0 +1,303 @@
+"""
+    Asyncio fleet manager: one event loop connects to every configured rfid reader at once, drives each reader from its
+    own task and merges all the tag streams into a single async iterator.
+
+    Run from the repository root with: python fleet.py [ip[:port] ...]
+"""
+import asyncio
+import logging
+import sys
+
+from api import open_net_connection, interpret_response_status
+from logs import configure_logging, get_logger, TagLogSampler
+from protocol import (TagFrameDecoder, decode_response, inventory_command, CMD_INVENTORY_CONTINUE, CMD_INVENTORY_STOP,
+                      CMD_DEVICE_INFO, INVENTORY_STOP_COMMAND, DEVICE_INFO_COMMAND)
+
+READER_PORT = 2022
+READER_IPS = ('192.168.101.3', '192.168.102.3', '192.168.103.3', '192.168.104.3', '192.168.105.3', '192.168.106.3',
+              '192.168.108.3', '192.168.11.3', '192.168.12.3', '192.168.13.3', '192.168.14.3', '192.168.15.3',
+              '192.168.16.3', '192.168.18.3', '192.168.1.200')
+
+
+def parse_reader(value, default_port=READER_PORT):
+    """
+        Function to parse a reader given on the command line.
+        :param value: 'ip' or 'ip:port'.
+        :return: A tuple of (ip, port).
+    """
+    ip, _, port = value.partition(':')
+    return ip, int(port) if port else default_port
+
+
+class ReaderClient:
+    """
+        A single rfid reader driven over asyncio streams. A background task decodes everything the reader sends:
+        tags are pushed to the shared queue, command responses complete the matching pending command. A full queue
+        back-pressures the socket, except while a command waits for its response: the oldest tags are then dropped so
+        the response behind them is still read.
+    """
+
+    def __init__(self, ip, port, tag_queue):
+        """
+            :param ip: The IP address of the rfid reader.
+            :param port: The port number of the rfid reader.
+            :param tag_queue: asyncio.Queue receiving ('ip:port', TagRead) tuples.
+        """
+        self.ip = ip
+        self.port = port
+        self.name = f'{ip}:{port}'  # Several readers may share an IP behind a NAT or a serial server.
+        self.tag_queue = tag_queue
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        self.decoder = TagFrameDecoder(on_response=self._on_response)
+        self._pending = {}  # cmd -> future waiting for the response frame
+        self._command_waiting = asyncio.Event()  # Set while _pending is not empty.
+        self.dropped = 0  # Tags dropped because the queue was full while a command was waiting.
+        self._read_task = None
+        self._inventory = None  # Set of EPCs collected while inventory() is running.
+        self.logger = get_logger('fleet', self.name)
+
+    async def connect(self, timeout=3):
+        """
+            Function to open the connection and start the receive task.
+            :return: True if the connection is established, False otherwise.
+        """
+        self.reader, self.writer = await open_net_connection(self.ip, self.port, timeout)
+        if self.reader is None:
+            return False
+        self.connected = True
+        self.decoder.reset()
+        self._read_task = asyncio.create_task(self._read_loop(), name=f"rfid-{self.name}")
+        return True
+
+    async def _read_loop(self):
+        try:
+            while True:
+                chunk = await self.reader.read(4096)
+                if not chunk:
+                    self.logger.warning('Connection closed by the RFID reader.')
+                    break
+                for tag in self.decoder.feed(chunk):
+                    if self._inventory is not None:
+                        self._inventory.add(tag.epc)
+                    await self._queue_tag((self.name, tag))
+        except (ConnectionError, OSError) as e:
+            self.logger.error('Error receiving RFID tag data: %s', e)
+        finally:
+            self.connected = False
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_result(None)
+            self._pending.clear()
+            self._command_waiting.clear()
+
+    async def _queue_tag(self, item):
+        queue = self.tag_queue
+        if not queue.full():
+            queue.put_nowait(item)
+            return
+        if not self._pending:
+            # Back-pressure the socket while the consumers are slow, until a command needs its response to be read.
+            put = asyncio.ensure_future(queue.put(item))
+            command = asyncio.ensure_future(self._command_waiting.wait())
+            await asyncio.wait((put, command), return_when=asyncio.FIRST_COMPLETED)
+            command.cancel()
+            if not put.cancel():
+                return  # The tag is queued.
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+            if self.dropped == 1:
+                self.logger.warning('Tag queue full while a command is waiting, dropping the oldest tags.')
+        queue.put_nowait(item)
+
+    def _on_response(self, cmd, frame):
+        future = self._pending.pop(cmd, None)
+        if not self._pending:
+            self._command_waiting.clear()
+        if future is not None and not future.done():
+            future.set_result(frame)
+
+    async def command(self, cmd, command, timeout=2):
+        """
+            Function to send a command to the rfid reader and wait for its response frame.
+            :param cmd: The 2 byte command code, used to match the response.
+            :param command: The complete command frame, see the precomputed frames in protocol.py.
+            :param timeout: Seconds to wait for the response.
+            :return: The status code returned by the rfid reader, None if there was no response.
+        """
+        if not self.connected:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        self._pending[cmd] = future
+        self._command_waiting.set()
+        self.writer.write(command)
+        await self.writer.drain()
+        try:
+            frame = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(cmd, None)
+            if not self._pending:
+                self._command_waiting.clear()
+            self.logger.warning('No response to command 0x%04X after %s seconds.', cmd, timeout)
+            return None
+        response = decode_response(frame, cmd) if frame else None
+        if response is None or not response.crc_valid:
+            return None
+        return response.status
+
+    async def start(self, inv_type=0x00, inv_param=0):
+        """
+            Function to start the reading mode, see api.start_reading_mode for the meaning of the parameters.
+        """
+        status_code = await self.command(CMD_INVENTORY_CONTINUE, inventory_command(inv_type, inv_param))
+        if status_code is not None:
+            interpret_response_status(status_code)
+        return status_code
+
+    async def stop(self):
+        """
+            Function to stop the reading mode.
+        """
+        status_code = await self.command(CMD_INVENTORY_STOP, INVENTORY_STOP_COMMAND)
+        if status_code is not None:
+            interpret_response_status(status_code)
+        return status_code
+
+    async def device_info(self):
+        """
+            Function to request the device information, mostly useful as a cheap liveness check.
+        """
+        return await self.command(CMD_DEVICE_INFO, DEVICE_INFO_COMMAND)
+
+    async def inventory(self, seconds):
+        """
+            Function to read the tags in the field for the given number of seconds.
+            :return: Set of the EPCs seen by this reader.
+        """
+        self._inventory = seen = set()
+        try:
+            if await self.start(0x00, seconds) is None:
+                return seen
+            await asyncio.sleep(seconds)
+            await self.stop()
+            return seen
+        finally:
+            self._inventory = None
+
+    async def close(self):
+        """
+            Function to close the connection and stop the receive task, which may be waiting for room in the queue.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+        self.connected = False
+
+
+class ReaderFleet:
+    """
+        Every configured rfid reader served by one event loop. Commands run concurrently on all connected readers and
+        tags from all of them are available through tags().
+    """
+
+    def __init__(self, readers=None, queue_size=10000):
+        """
+            :param readers: List of (ip, port), defaults to the configured readers.
+            :param queue_size: Tags buffered between the readers and the consumer of tags().
+        """
+        if readers is None:
+            readers = [(ip, READER_PORT) for ip in READER_IPS]
+        self.tag_queue = asyncio.Queue(queue_size)
+        self.readers = {}  # 'ip:port' -> ReaderClient
+        for ip, port in readers:
+            client = ReaderClient(ip, port, self.tag_queue)
+            self.readers[client.name] = client
+
+    @property
+    def connected(self):
+        return [client for client in self.readers.values() if client.connected]
+
+    async def _run_all(self, clients, operation, *args):
+        results = await asyncio.gather(*(getattr(client, operation)(*args) for client in clients),
+                                       return_exceptions=True)
+        return {client.name: result for client, result in zip(clients, results)}
+
+    async def connect_all(self, timeout=3):
+        """
+            Function to connect to every reader at once.
+            :return: Dict of 'ip:port' -> True/False.
+        """
+        return await self._run_all(list(self.readers.values()), 'connect', timeout)
+
+    async def start_all(self, inv_type=0x00, inv_param=0):
+        """
+            :return: Dict of 'ip:port' -> status code returned by each connected reader.
+        """
+        return await self._run_all(self.connected, 'start', inv_type, inv_param)
+
+    async def stop_all(self):
+        """
+            :return: Dict of 'ip:port' -> status code returned by each connected reader.
+        """
+        return await self._run_all(self.connected, 'stop')
+
+    async def inventory_all(self, seconds):
+        """
+            :return: Dict of 'ip:port' -> set of EPCs seen by each connected reader.
+        """
+        return await self._run_all(self.connected, 'inventory', seconds)
+
+    async def close_all(self):
+        await self._run_all(list(self.readers.values()), 'close')
+
+    async def tags(self):
+        """
+            Async iterator over ('ip:port', TagRead) from every reader, in arrival order.
+        """
+        while True:
+            yield await self.tag_queue.get()
+
+    async def __aenter__(self):
+        await self.connect_all()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close_all()
+
+
+async def stream_fleet(readers):
+    """
+        Function to connect to the given readers, start reading on all of them and print the merged tag stream until
+        interrupted.
+        :param readers: List of (ip, port).
+    """
+    logger = get_logger('fleet')
+    async with ReaderFleet(readers) as fleet:
+        samplers = {name: TagLogSampler(get_logger('tags', name), level=logging.INFO) for name in fleet.readers}
+        logger.info('%d of %d readers connected.', len(fleet.connected), len(fleet.readers))
+        await fleet.start_all()
+        try:
+            async for name, tag in fleet.tags():
+                samplers[name].log(tag)
+        finally:
+            await fleet.stop_all()
+
+
+if __name__ == '__main__':
+    configure_logging()
+    try:
+        asyncio.run(stream_fleet([parse_reader(reader) for reader in sys.argv[1:]] or
+                                 [(ip, READER_PORT) for ip in READER_IPS]))
+    except KeyboardInterrupt:
+        pass
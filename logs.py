@@ -0,0 +1,88 @@
+"""
+    Logging for the rfid reader program, built on the standard logging module.
+
+    All loggers live under the 'rfid' namespace and every record carries the reader it is about (`reader` field, '-'
+    when it is not tied to one reader). Per tag logging goes through TagLogSampler, which costs a single level check
+    when debug logging is off and is rate limited when it is on. Code formatting frames as hexadecimal must guard it
+    with logger.isEnabledFor(logging.DEBUG) so it never runs with debug off.
+"""
+import logging
+import sys
+import time
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s [%(reader)s] %(message)s'
+
+
+class ReaderContextFilter(logging.Filter):
+    """
+        Gives every record a `reader` field, so records from loggers without reader context still format.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, 'reader'):
+            record.reader = '-'
+        return True
+
+
+def configure_logging(level=logging.INFO, stream=None):
+    """
+        Function to send the 'rfid' logs to a stream (stderr by default). Calling it again only changes the level.
+        :param level: Logging level, e.g. logging.DEBUG to see every command and response frame.
+        :param stream: The stream to write to.
+    """
+    logger = logging.getLogger('rfid')
+    logger.setLevel(level)
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler.addFilter(ReaderContextFilter())
+        logger.addHandler(handler)
+    return logger
+
+
+def get_logger(name, reader=None):
+    """
+        Function to get a logger of the 'rfid' namespace.
+        :param name: Name of the component, e.g. 'api' or 'session'.
+        :param reader: Optional reader context (e.g. 'ip:port') added to every record.
+        :return: A Logger, or a LoggerAdapter when a reader is given.
+    """
+    logger = logging.getLogger(f'rfid.{name}')
+    if reader is None:
+        return logger
+    return logging.LoggerAdapter(logger, {'reader': reader})
+
+
+class TagLogSampler:
+    """
+        Rate limited per tag logging: at most `max_per_second` tag reads are logged each second, the number of reads
+        left out is logged when the next second starts.
+    """
+
+    def __init__(self, logger, max_per_second=10, level=logging.DEBUG):
+        self.logger = logger
+        self.max_per_second = max_per_second
+        self.level = level
+        self._window_end = 0.0
+        self._logged = 0
+        self._suppressed = 0
+
+    def log(self, tag):
+        """
+            Function to log one tag read, if the level is enabled and the budget of the current second allows it.
+            :param tag: protocol.TagRead.
+        """
+        if not self.logger.isEnabledFor(self.level):
+            return
+        now = time.monotonic()
+        if now >= self._window_end:
+            if self._suppressed:
+                self.logger.log(self.level, '%d more tag reads not logged', self._suppressed)
+            self._window_end = now + 1.0
+            self._logged = 0
+            self._suppressed = 0
+        if self._logged < self.max_per_second:
+            self._logged += 1
+            self.logger.log(self.level, 'RFID TAG %s antenna %d rssi %d', tag.epc, tag.antenna, tag.rssi)
+        else:
+            self._suppressed += 1
@@ -1,12 +1,81 @@
-import socket
-
-import PySimpleGUI as sg
+import os
+import queue
+import sys
 import threading
+import time
+from collections import deque
+
+from aggregator import TagAggregator, format_tag_event
+from bus import TagBus, subscribe_environment_sinks
+from capture import CaptureWriter
+from eventstore import TagEventStore
+from fleet import READER_IPS, READER_PORT
+from logs import configure_logging, get_logger, TagLogSampler
+from metrics import ReaderMetrics, start_http_server
+from protocol import TagFrameDecoder
+from reactor import SessionReactor
+from session import ReaderSession
+
+global_session = None  # Global variable to store the self-healing network session with the rfid reader
+global_reactor = None  # The reactor serving the session while connected, stopped through its wakeup socket.
+reader_thread = None  # The thread running read_continuous_rfid_res.
+dwell_window = 2.0  # Seconds without a read after which a tag is reported as departed.
+tag_queue = queue.SimpleQueue()  # Tag events handed from the reader thread to the gui, drained on a timer.
+tag_read_count = 0  # Total number of tag reads decoded, used for the reads/sec counter.
+event_store = None  # Persistent store of every tag read, opened by launch_gui when EVENT_STORE_DIR is set.
+tag_bus = TagBus()  # Fan-out of every tag read to the extra consumers (PLC bridge, UDP, file...), see bus.py.
+
+logger = get_logger('main')
+
+GUI_REFRESH_MS = 100  # Interval of the gui timer draining tag_queue.
+TERMINAL_MAX_LINES = 500  # Number of lines kept in the terminal, older lines are dropped.
+EVENT_STORE_DIR = os.environ.get('RFID_EVENT_STORE')  # When set, every tag read is stored in this directory (see
+# eventstore.py). Off by default: every raw read is kept, which is GBs per day at a few hundred reads/sec.
+METRICS_PORT = os.environ.get('RFID_METRICS_PORT')  # When set, metrics are served on http://127.0.0.1:port/metrics.
+CAPTURE_FILE = os.environ.get('RFID_CAPTURE')  # When set, every raw chunk received is recorded to this file for
+# offline replay (python capture.py replay FILE).
+
+
+class TerminalBuffer:
+    """
+        Keeps only the last lines of the terminal and writes them to the Multiline widget in a single update, no matter
+        how many lines were added since the previous refresh.
+    """
+
+    def __init__(self, element, max_lines=TERMINAL_MAX_LINES):
+        self.element = element
+        self.lines = deque(maxlen=max_lines)
+        self.dirty = False
+
+    def append(self, line):
+        self.lines.append(line)
+        self.dirty = True
 
-from api import close_network_connection, start_reading_mode, stop_reading_mode, open_net_connection
+    def extend(self, lines):
+        self.lines.extend(lines)
+        self.dirty = True
 
-global_net_conn = None  # Global variable to store the network connection
-reading_active = False  # Global flag to keep track of reading mode.
+    def flush(self):
+        if self.dirty:
+            self.element.update('\n'.join(self.lines) + '\n')
+            self.dirty = False
+
+
+def drain_tag_queue(terminal, max_lines=TERMINAL_MAX_LINES):
+    """
+        Function to move every pending tag event from tag_queue to the terminal.
+        :return: Number of events drained.
+    """
+    events = []
+    try:
+        while True:
+            events.append(tag_queue.get_nowait())
+    except queue.Empty:
+        pass
+    if events:
+        terminal.extend(format_tag_event(tag_event) for tag_event in events[-max_lines:])  # Older lines would be
+        # dropped by the terminal anyway.
+    return len(events)
 
 
 def get_rfid_tag_info(response):
@@ -25,138 +94,216 @@ def get_rfid_tag_info(response):
     return epc_hex
 
 
-def read_continuous_rfid_res(window):
+def read_continuous_rfid_res(reactor):
     """
-        Function to read continuous response from the rfid reader each time a rfid tag is scanned.
-        :param window: The terminal window of the gui to display the information.
+        Function to read continuous response from the rfid reader each time a rfid tag is scanned. The tag events are
+        put in tag_queue for the gui. The thread serves the session from connection to disconnection, so the keepalive
+        and the reconnections also run while the reading mode is off. It sleeps in the reactor until data arrives,
+        stop_receiving() wakes it up.
+        :param reactor: The SessionReactor serving the session, owned by this thread until it is stopped.
     """
-    global reading_active, global_net_conn
-    if global_net_conn and reading_active:  # If the network connection is established and reading_active flag is true.
-        # Initiate RFID reading mode once
-        start_reading_mode(global_net_conn, 'network')  # Calling the start_reading_mode function to send the command to
-        # the rfid reader to start reading.
-        print('RFID reading initiated. Waiting for tags...')
-        global_net_conn.settimeout(0.01)  # Set a timeout of 1 second
+    session = global_session
+    if session:  # If the network session is established.
+        tag_log = TagLogSampler(get_logger('tags', f'{session.ip}:{session.port}'))  # Debug level, rate limited.
+        # Reassembles frames split across recv() calls and splits batched ones; the answers to the commands go back to
+        # the session.
+        decoder = TagFrameDecoder(on_response=session.on_response)
+        aggregator = TagAggregator(dwell_window)  # Only arrivals and departures reach the gui, not every read.
+        generation = session.generation
+        reader_name = f'{session.ip}:{session.port}'
+        reader_metrics = ReaderMetrics(reader_name, decoder)  # Tags, bytes, decode latency, CRC errors...
+
+        def on_data(reader_session, response):
+            global tag_read_count
+            nonlocal generation
+            if reader_session.generation != generation:
+                if decoder.pending:
+                    reader_metrics.partial_frames.value += 1
+                decoder.reset()  # Partial frames from the old connection can't be completed.
+                generation = reader_session.generation
+            start = time.perf_counter_ns()
+            tags = decoder.feed(response)
+            reader_metrics.observe(len(response), len(tags), time.perf_counter_ns() - start)
+            tag_read_count += len(tags)
+            tag_bus.publish(reader_name, tags)  # Only queues the tags, each subscriber has its own thread.
+            store = event_store
+            for tag in tags:
+                tag_log.log(tag)
+                if store:
+                    store.append(tag.epc, reader_session.ip)  # Buffered, written by the store's own thread.
+                tag_event = aggregator.observe(tag)
+                if tag_event:
+                    tag_queue.put(tag_event)  # Displayed on the gui window at the next refresh.
 
-        while reading_active:
-            try:
-                response = global_net_conn.recv(1024)  # Receiving the response from the network connection established
-                # with the rfid reader
-                if response:
-                    rfid_tag_data = get_rfid_tag_info(response)
-                    if rfid_tag_data:
-                        print('RFID TAG', rfid_tag_data)
-                        window.write_event_value('-TAG_READ-', rfid_tag_data)  # Displaying the rfid tag on the gui
-                        # window.
-            except socket.timeout:
-                continue  # Continue the loop if a timeout occurs
-            except Exception as e:
-                print(f"Error receiving RFID tag data: {e}")
-                break  # Exit the loop on other errors
+        def expire_tags():
+            for tag_event in aggregator.expire():
+                tag_queue.put(tag_event)
 
+        reactor.add(session, on_data)
+        reactor.add_timer(min(dwell_window / 4, 0.5), expire_tags)
+        try:
+            reactor.run()
+        except Exception as e:
+            logger.exception("Error receiving RFID tag data: %s", e)
+        finally:
+            reactor.close()
 
-def start_reading(window):
+
+def start_receiving():
     """
-        Function to start the rfid reading, and it keeps on listening the response from rfid reader until stop command
-        is sent.
-        :param window: The terminal window of the gui to display the information.
+        Function to start the thread serving the connected session, it runs until stop_receiving() is called.
     """
-    global reading_active
-    reading_active = True
-    threading.Thread(target=read_continuous_rfid_res, args=(window,),  daemon=True).start()
+    global global_reactor, reader_thread
+    global_reactor = SessionReactor()  # Created here so stop_receiving() can always reach it.
+    reader_thread = threading.Thread(target=read_continuous_rfid_res, args=(global_reactor,), daemon=True)
+    reader_thread.start()
 
 
-def stop_reading():
+def start_reading():
+    """
+        Function to start the rfid reading, the tags are then received by the thread serving the session until stop
+        command is sent.
+    """
+    if global_session and global_reactor:
+        # Initiate RFID reading mode once, the session re-issues it by itself after a reconnection. The command runs
+        # on the reactor thread, which owns the connection.
+        global_reactor.call_soon(global_session.start_reading)
+        logger.info('RFID reading initiated. Waiting for tags...')
+
+
+def stop_receiving():
     """
-        Function to stop the rfid reading.
+        Function to wake up the receive thread and wait for it to exit, so it no longer reads from the connection.
     """
-    global reading_active, global_net_conn
-    # First, signal the loop to stop by setting the flag to False
-    reading_active = False
+    global global_reactor, reader_thread
+    if global_reactor:
+        global_reactor.stop()
+        global_reactor = None
+    if reader_thread:
+        reader_thread.join(timeout=2)
+        reader_thread = None
 
-    # calling stop_reading_mode to send the command to the RFID reader
-    if global_net_conn:
-        stop_reading_mode(global_net_conn, 'network')
-        print('Stopped')
+
+def stop_reading():
+    """
+        Function to stop the rfid reading, the session stays connected and served by the receive thread.
+    """
+    if global_session and global_reactor:
+        global_reactor.call_soon(global_session.stop_reading)  # On the reactor thread, which owns the connection.
+        logger.info('Stopped')
 
 
 def launch_gui():
     """
         Function to launch the gui panel
     """
-    global global_net_conn  # Reference the global connection object
+    global global_session, event_store  # Reference the global session and event store objects
+    import PySimpleGUI as sg  # Imported here so the headless mode (daemon.py) never loads Tk.
 
     sg.theme('DarkGrey13')
 
     layout = [
-        [sg.Text('Select RFID:'), sg.OptionMenu(
-            ('192.168.101.3', '192.168.102.3', '192.168.103.3', '192.168.104.3', '192.168.105.3', '192.168.106.3',
-             '192.168.108.3', '192.168.11.3', '192.168.12.3', '192.168.13.3', '192.168.14.3', '192.168.15.3',
-             '192.168.16.3', '192.168.18.3', '192.168.1.200'), key='IP_Selection', enable_events=True)],
+        [sg.Text('Select RFID:'), sg.OptionMenu(READER_IPS, key='IP_Selection', enable_events=True)],
         [sg.Button('Connect', key='Connection', disabled=False),
          sg.Button('Disconnect', key='Disconnection', disabled=False)],
         [sg.Button('Start', key='Start Reading', visible=False, disabled=False),
          sg.Button('Stop', key='Stop Reading', visible=False, disabled=False, pad=((26, 0), (3, 3)))],
         [sg.Multiline(default_text='', size=(100, 20), key='TERMINAL', autoscroll=True, background_color='black',
                       text_color='white')],
+        [sg.Text('Reads/sec: 0', key='READ_RATE', size=(30, 1))],
     ]
 
-    window = sg.Window(title="RFID Reader Program", layout=layout, margins=(10, 10), resizable=True)
+    window = sg.Window(title="RFID Reader Program", layout=layout, margins=(10, 10), resizable=True, finalize=True)
+    event_store = TagEventStore(EVENT_STORE_DIR) if EVENT_STORE_DIR else None
+    capture = CaptureWriter(CAPTURE_FILE) if CAPTURE_FILE else None
+    sinks = subscribe_environment_sinks(tag_bus, os.environ)
+    metrics_server = start_http_server(int(METRICS_PORT)) if METRICS_PORT else None
+    terminal = TerminalBuffer(window['TERMINAL'])
+    rate_time, rate_count = time.monotonic(), tag_read_count
 
     while True:
-        event, values = window.read()
+        event, values = window.read(timeout=GUI_REFRESH_MS)  # Wakes up on the timer to drain tag_queue.
         if event == sg.WINDOW_CLOSED:
             break
         elif event == 'Connection':
             if values['IP_Selection']:  # Check if an IP address is selected
-                ip, port = values['IP_Selection'], 2022  # Assuming 2022 as fixed port
-                global_net_conn = open_net_connection(ip, port)  # Open connection
-                if global_net_conn:
-                    window['TERMINAL'].update(f"Connected to {ip}:{port}\n", append=True)
+                ip, port = values['IP_Selection'], READER_PORT
+                session = ReaderSession(ip, port, on_state_change=lambda s: window.write_event_value(
+                    '-READER_STATE-', (s.state, s.reconnect_count)), capture=capture)
+                if session.connect():  # Open connection
+                    global_session = session
+                    start_receiving()  # Keepalive and reconnections from now on, tags once the reading starts.
+                    terminal.append(f"Connected to {ip}:{port}")
                     window['Start Reading'].update(visible=True, disabled=False)
                     window['Stop Reading'].update(visible=True, disabled=False)
                     window['Connection'].update(disabled=True)
                     window['Disconnection'].update(disabled=False)
                 else:
-                    window['TERMINAL'].update(f"Failed to connect to {ip}:{port}\n", append=True)
+                    terminal.append(f"Failed to connect to {ip}:{port}")
             else:
                 sg.popup("No IP address selected. Please select an IP address before connecting.")
 
         elif event == 'Disconnection':
-            if global_net_conn:
-                global reading_active
-                close_network_connection(global_net_conn)  # Close connection
-                reading_active = False
-                window['TERMINAL'].update(f"Connection is successfully closed\n", append=True)
+            if global_session:
+                stop_receiving()
+                global_session.close()  # Close connection
+                terminal.append(f"Connection is successfully closed")
                 window['Start Reading'].update(visible=False, disabled=True)
                 window['Stop Reading'].update(visible=False, disabled=True)
                 window['Disconnection'].update(disabled=True)
                 window['Connection'].update(disabled=False)
-                global_net_conn = None
+                global_session = None
             else:
-                window['TERMINAL'].update("No active connection to close.\n", append=True)
+                terminal.append("No active connection to close.")
                 sg.popup("No Active connection to close.\n")
 
         elif event == 'Start Reading':
-            if global_net_conn:
-                start_reading(window)
-                window['TERMINAL'].update("Started RFID reading...\n", append=True)
+            if global_session:
+                start_reading()
+                terminal.append("Started RFID reading...")
                 window['Stop Reading'].update(disabled=False)
                 window['Start Reading'].update(disabled=True)
 
         elif event == 'Stop Reading':
-            if global_net_conn:
+            if global_session:
                 stop_reading()
-                window['TERMINAL'].update('Stopped RFID reading...\n', append=True)
+                terminal.append('Stopped RFID reading...')
                 window['Stop Reading'].update(disabled=True)
                 window['Start Reading'].update(disabled=False)
 
-        elif event == '-TAG_READ-':  # For displaying the rfid information.
-            rfid_tag_data = values[event]  # Extract the RFID tag data from the event values
-            window['TERMINAL'].update(f"RFID Tag: {rfid_tag_data}\n", append=True)
+        elif event == '-READER_STATE-':  # Connection state changes reported by the session.
+            state, reconnect_count = values[event]
+            terminal.append(f"Reader {state} (reconnects: {reconnect_count})")
+
+        drain_tag_queue(terminal)  # For displaying the rfid information, many tags per widget update.
+        terminal.flush()
+
+        now = time.monotonic()
+        if now - rate_time >= 1.0:
+            reads = tag_read_count
+            window['READ_RATE'].update(f"Reads/sec: {(reads - rate_count) / (now - rate_time):.0f}")
+            rate_time, rate_count = now, reads
 
     window.close()
+    if global_session:
+        stop_receiving()
+        global_session.close()
+    if event_store:
+        event_store.close()
+        event_store = None
+    tag_bus.close()
+    if metrics_server:
+        metrics_server.shutdown()
+    for sink in sinks:
+        sink.close()
+    if capture:
+        capture.close()
 
 
 if __name__ == '__main__':
-    launch_gui()
+    if '--headless' in sys.argv[1:]:  # python main.py --headless [daemon.py options] ip[:port] ...
+        import daemon
+        daemon.main([arg for arg in sys.argv[1:] if arg != '--headless'])
+    else:
+        configure_logging()
+        launch_gui()
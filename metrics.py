@@ -0,0 +1,306 @@
+"""
+    Low overhead metrics of the readers and of the receive pipeline: counters, gauges, HDR style latency histograms and
+    callback metrics read only when the metrics are collected. Everything is kept in a Registry readable as a snapshot
+    dict (Registry.snapshot()) or as Prometheus text, served by start_http_server() on /metrics.
+
+    The hot paths keep a reference to their metric objects and update plain attributes without locks; a concurrent
+    update from another thread can in rare cases be lost, which is acceptable for monitoring and keeps the cost of an
+    update to a few tens of nanoseconds.
+
+    Set RFID_METRICS_PORT=port to serve the metrics from main.py (daemon.py: --metrics-port).
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BUCKET_BITS = 5  # 16 linear sub-buckets per power of two: values are kept within 1/16 (6%) of their true value.
+_SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+_SUB_BUCKET_HALF = _SUB_BUCKET_COUNT >> 1
+_BUCKET_COUNT = (64 - SUB_BUCKET_BITS + 2) * _SUB_BUCKET_HALF  # Covers every 64 bit value.
+
+# Upper bounds (seconds) of the Prometheus histogram buckets exported from the HDR buckets.
+PROMETHEUS_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                      0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _bucket_index(value):
+    """
+        Function to find the HDR bucket of a value: values below 32 have their own bucket, above that the bucket width
+        doubles with every power of two.
+    """
+    if value < _SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return shift * _SUB_BUCKET_HALF + (value >> shift)
+
+
+def _bucket_bounds(index):
+    """
+        :return: The lowest and highest value of a bucket.
+    """
+    if index < _SUB_BUCKET_COUNT:
+        return index, index
+    shift = index // _SUB_BUCKET_HALF - 1
+    mantissa = index % _SUB_BUCKET_HALF + _SUB_BUCKET_HALF
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """
+        HDR style histogram of integer values (nanoseconds for the latencies): log-linear buckets give a bounded
+        relative error at any scale, recording is a bit_length(), a shift and a list increment.
+    """
+    __slots__ = ('counts', 'count', 'total', 'max', 'unit')
+
+    def __init__(self, unit=1e-9):
+        """
+            :param unit: Size of one recorded unit in the exported values, 1e-9 exports nanoseconds as seconds.
+        """
+        self.counts = [0] * _BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.unit = unit
+
+    def record(self, value):
+        """
+            Function to record one value (an int, e.g. a duration from time.perf_counter_ns()).
+        """
+        if value < _SUB_BUCKET_COUNT:
+            value = max(value, 0)
+            self.counts[value] += 1
+        else:
+            shift = value.bit_length() - SUB_BUCKET_BITS  # _bucket_index() inlined, this is the hot path.
+            self.counts[shift * _SUB_BUCKET_HALF + (value >> shift)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """
+            Function to estimate a percentile.
+            :param fraction: e.g. 0.99 for the 99th percentile.
+            :return: The highest value of the bucket holding the percentile, in exported units; 0 when empty.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(self.count * fraction)))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(_bucket_bounds(index)[1], self.max) * self.unit
+        return self.max * self.unit
+
+    def cumulative(self, bounds):
+        """
+            Function to count the values at or below each bound, for the Prometheus buckets.
+            :param bounds: Ascending upper bounds, in exported units.
+            :return: List of cumulative counts, one per bound.
+        """
+        results = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            limit = bound / self.unit
+            while index < _BUCKET_COUNT and _bucket_bounds(index)[1] <= limit:
+                seen += self.counts[index]
+                index += 1
+            results.append(seen)
+        return results
+
+    def summary(self):
+        return {'count': self.count, 'sum': self.total * self.unit, 'max': self.max * self.unit,
+                'p50': self.percentile(0.50), 'p90': self.percentile(0.90), 'p99': self.percentile(0.99),
+                'p999': self.percentile(0.999)}
+
+
+class CallbackMetric:
+    """
+        Metric read from a callable when the metrics are collected, e.g. a counter already kept by TagFrameDecoder.
+    """
+    __slots__ = ('callback',)
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    @property
+    def value(self):
+        return self.callback()
+
+
+class Registry:
+    """
+        Named metrics, each name holding one metric per set of labels.
+    """
+
+    def __init__(self):
+        self._metrics = {}  # name -> (type, help, {labels tuple: metric})
+        self._lock = threading.Lock()
+
+    def _get(self, cls, kind, name, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._metrics.get(name)
+            if family is None:
+                family = self._metrics[name] = (kind, help_text, {})
+            elif family[0] != kind:
+                raise ValueError(f"Metric {name} is a {family[0]}, not a {kind}")
+            metric = family[2].get(key)
+            if metric is None or not isinstance(metric, cls):
+                metric = family[2][key] = factory()
+            return metric
+
+    def counter(self, name, help_text='', **labels):
+        """
+            Function to get (or create) a counter, keep the returned object to update it.
+        """
+        return self._get(Counter, 'counter', name, help_text, labels, Counter)
+
+    def gauge(self, name, help_text='', **labels):
+        return self._get(Gauge, 'gauge', name, help_text, labels, Gauge)
+
+    def histogram(self, name, help_text='', unit=1e-9, **labels):
+        return self._get(Histogram, 'histogram', name, help_text, labels, lambda: Histogram(unit))
+
+    def callback(self, name, callback, kind='counter', help_text='', **labels):
+        """
+            Function to register a metric read from `callback` at collection time, replacing a previous callback with
+            the same name and labels.
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._metrics.setdefault(name, (kind, help_text, {}))
+            family[2][key] = CallbackMetric(callback)
+
+    def snapshot(self):
+        """
+            Function to read every metric.
+            :return: Dict of name -> list of (labels dict, value); histograms give their summary dict as value.
+        """
+        with self._lock:
+            families = [(name, dict(family[2])) for name, family in self._metrics.items()]
+        return {name: [(dict(key), metric.summary() if isinstance(metric, Histogram) else metric.value)
+                       for key, metric in metrics.items()]
+                for name, metrics in families}
+
+    def prometheus_text(self):
+        """
+            Function to format every metric in the Prometheus text exposition format.
+        """
+        with self._lock:
+            families = [(name, family[0], family[1], dict(family[2])) for name, family in self._metrics.items()]
+        lines = []
+        for name, kind, help_text, metrics in families:
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in metrics.items():
+                labels = ','.join(f'{label}="{value}"' for label, value in key)
+                if not isinstance(metric, Histogram):
+                    lines.append(f"{name}{{{labels}}} {metric.value}" if labels else f"{name} {metric.value}")
+                    continue
+                prefix = labels + ',' if labels else ''
+                for bound, count in zip(PROMETHEUS_BUCKETS, metric.cumulative(PROMETHEUS_BUCKETS)):
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {metric.count}')
+                suffix = f"{{{labels}}}" if labels else ''
+                lines.append(f"{name}_sum{suffix} {metric.total * metric.unit}")
+                lines.append(f"{name}_count{suffix} {metric.count}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()  # Default registry used by api.py, session.py and the receive loops.
+
+
+class ReaderMetrics:
+    """
+        Metrics of the receive loop of one reader: chunks, bytes, tags, decode latency per chunk, and the CRC errors,
+        skipped bytes and dropped partial frames of its TagFrameDecoder.
+    """
+
+    def __init__(self, reader, decoder, registry=REGISTRY):
+        """
+            :param reader: Name of the reader, e.g. 'ip:port', used as label.
+            :param decoder: The protocol.TagFrameDecoder of the reader.
+        """
+        self.chunks = registry.counter('rfid_rx_chunks_total', 'Chunks received from the reader', reader=reader)
+        self.bytes = registry.counter('rfid_rx_bytes_total', 'Bytes received from the reader', reader=reader)
+        self.tags = registry.counter('rfid_tags_total', 'Tag reads decoded', reader=reader)
+        self.partial_frames = registry.counter('rfid_partial_frames_dropped_total',
+                                               'Incomplete frames dropped after a reconnection', reader=reader)
+        self.decode_latency = registry.histogram('rfid_decode_seconds', 'Time to decode one received chunk',
+                                                 reader=reader)
+        registry.callback('rfid_crc_errors_total', lambda: decoder.crc_errors, help_text='Frames failing the CRC16',
+                          reader=reader)
+        registry.callback('rfid_discarded_bytes_total', lambda: decoder.discarded_bytes,
+                          help_text='Bytes skipped while looking for a frame header', reader=reader)
+
+    def observe(self, size, tag_count, decode_ns):
+        """
+            Function to record one received chunk.
+            :param size: Number of bytes received.
+            :param tag_count: Number of tags decoded from it.
+            :param decode_ns: Time spent decoding it, in ns.
+        """
+        self.chunks.value += 1
+        self.bytes.value += size
+        self.tags.value += tag_count
+        self.decode_latency.record(decode_ns)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, content_type = self.registry.prometheus_text().encode(), 'text/plain; version=0.0.4'
+        elif self.path == '/snapshot':
+            body, content_type = json.dumps(self.registry.snapshot()).encode(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are not worth a log line each.
+
+
+def start_http_server(port, host='127.0.0.1', registry=REGISTRY):
+    """
+        Function to serve the metrics over HTTP from a daemon thread: Prometheus text on /metrics and the snapshot as
+        JSON on /snapshot.
+        :param port: TCP port, 0 picks a free one.
+        :param host: Address to listen on, local only by default.
+        :return: The server, server.server_address gives the port and server.shutdown() stops it.
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='rfid-metrics', daemon=True).start()
+    return server
@@ -0,0 +1,216 @@
+import struct
+from collections import namedtuple
+from functools import lru_cache
+
+from crc import crc16
+
+# Every frame exchanged with the rfid reader has the layout:
+# HEAD(1) ADDR(1) CMD(2) LEN(1) DATA(LEN) CRC16(2)
+# The CRC16 covers HEAD through DATA and is appended high byte first.
+HEAD = 0xCF
+FRAME_OVERHEAD = 7  # HEAD + ADDR + CMD + LEN + CRC16
+LEN_INDEX = 4
+DATA_INDEX = 5
+
+CMD_INVENTORY_CONTINUE = 0x0001
+CMD_INVENTORY_STOP = 0x0002
+CMD_REBOOT = 0x0052
+CMD_DEVICE_INFO = 0x0070
+
+STATUS_SUCCESS = 0x00
+
+# Tag notifications (CMD 0x0001, status 0x00) carry the tag data in the DATA field as:
+# Status(1) RSSI(2) Antenna(1) Channel(1) EPC_LEN(1) EPC(EPC_LEN)
+TAG_HEADER_LEN = 6
+
+TagRead = namedtuple('TagRead', ['epc', 'rssi', 'antenna', 'channel'])
+
+
+def build_frame(cmd, data=b'', addr=0xFF):
+    """
+        Function to build a complete frame (command or response) for the rfid reader.
+        :param cmd: The 2 byte command code, e.g. CMD_INVENTORY_CONTINUE.
+        :param data: The DATA field (at most 255 bytes).
+        :param addr: The reader address, 0xFF is the broadcast address accepted by every reader.
+        :return: The frame as bytes, CRC16 included.
+    """
+    frame = bytearray((HEAD, addr, (cmd >> 8) & 0xFF, cmd & 0xFF, len(data)))
+    frame += data
+    crc = crc16(frame)
+    frame.append((crc >> 8) & 0xFF)
+    frame.append(crc & 0xFF)
+    return bytes(frame)
+
+
+# Commands without parameters never change, so their frames (CRC included) are computed once.
+REBOOT_COMMAND = build_frame(CMD_REBOOT)
+DEVICE_INFO_COMMAND = build_frame(CMD_DEVICE_INFO)
+INVENTORY_STOP_COMMAND = build_frame(CMD_INVENTORY_STOP)
+
+# RFM_INVENTORY_CONTINUE: HEAD ADDR CMD(2) LEN=5 InvType(1) InvParam(4, little-endian) CRC16(2, big-endian)
+_INVENTORY_BODY = struct.Struct('<BBBBBBI')
+_CRC = struct.Struct('>H')
+INVENTORY_COMMAND_LEN = _INVENTORY_BODY.size + _CRC.size
+
+
+def encode_inventory(inv_type=0x00, inv_param=0, out=None):
+    """
+        Function to encode the start reading command (see api.start_reading_mode for the parameters).
+        :param out: Optional writable buffer of at least INVENTORY_COMMAND_LEN bytes to encode into, so a caller
+        sending the command repeatedly can reuse the same buffer.
+        :return: The buffer holding the command.
+    """
+    if out is None:
+        out = bytearray(INVENTORY_COMMAND_LEN)
+    _INVENTORY_BODY.pack_into(out, 0, HEAD, 0xFF, CMD_INVENTORY_CONTINUE >> 8, CMD_INVENTORY_CONTINUE & 0xFF,
+                              _INVENTORY_BODY.size - DATA_INDEX, inv_type, inv_param)
+    with memoryview(out) as view:
+        _CRC.pack_into(out, _INVENTORY_BODY.size, crc16(view[:_INVENTORY_BODY.size]))
+    return out
+
+
+@lru_cache(maxsize=32)
+def inventory_command(inv_type=0x00, inv_param=0):
+    """
+        Function returning the start reading command as bytes. Readers are started with the same few parameters over
+        and over, so the encoded frames are cached.
+    """
+    return bytes(encode_inventory(inv_type, inv_param))
+
+
+class Response:
+    """
+        A response frame returned by the rfid reader. `payload` is a memoryview on the received bytes (the DATA field
+        after the status byte), nothing is copied.
+    """
+    __slots__ = ('cmd', 'status', 'payload', 'crc_valid')
+
+    def __init__(self, cmd, status, payload, crc_valid):
+        self.cmd = cmd
+        self.status = status
+        self.payload = payload
+        self.crc_valid = crc_valid
+
+    def __repr__(self):
+        return (f"Response(cmd=0x{self.cmd:04X}, status=0x{self.status:02X}, payload={bytes(self.payload)!r}, "
+                f"crc_valid={self.crc_valid})")
+
+
+def decode_response(data, cmd=None):
+    """
+        Function to decode the response frame found in the data received from the rfid reader.
+        :param data: The bytes returned by recv()/read().
+        :param cmd: CMD of the command sent; frames of another CMD (e.g. tags streamed before the response) are
+        skipped. None takes the first frame whatever its CMD.
+        :return: The first CRC valid Response of that CMD, else the first complete frame with crc_valid False, or None
+        if the data does not hold a complete frame with a status byte.
+    """
+    view = memoryview(data)
+    size = len(view)
+    corrupted = None
+    start = data.find(HEAD)
+    while 0 <= start and size - start >= FRAME_OVERHEAD + 1:
+        data_len = view[start + LEN_INDEX]
+        frame_end = start + FRAME_OVERHEAD + data_len
+        if not data_len or frame_end > size:
+            start = data.find(HEAD, start + 1)
+            continue
+        frame_cmd = (view[start + 2] << 8) | view[start + 3]
+        crc_valid = crc16(view[start:frame_end - 2]) == (view[frame_end - 2] << 8) | view[frame_end - 1]
+        if crc_valid and (cmd is None or frame_cmd == cmd):
+            return Response(frame_cmd, view[start + DATA_INDEX], view[start + DATA_INDEX + 1:frame_end - 2], True)
+        if not crc_valid and corrupted is None:
+            corrupted = Response(frame_cmd, view[start + DATA_INDEX], view[start + DATA_INDEX + 1:frame_end - 2], False)
+        # A valid frame of another CMD is skipped whole, a corrupted one may hide the real frame after its HEAD.
+        start = data.find(HEAD, frame_end if crc_valid else start + 1)
+    return corrupted
+
+
+class TagFrameDecoder:
+    """
+        Incremental decoder for the continuous byte stream sent by the rfid reader while the reading mode is active.
+        A single recv() can hold several frames or only part of one, so the bytes are kept in a reusable buffer and
+        every complete, CRC valid frame is cut out of it. Corrupted bytes are skipped by re-syncing on the next 0xCF
+        header.
+    """
+
+    def __init__(self, on_response=None):
+        """
+            :param on_response: Optional callable receiving (cmd, frame_bytes) for every valid frame that is not a tag
+            notification, e.g. the acknowledgement of the start/stop commands.
+        """
+        self.on_response = on_response
+        self._buffer = bytearray()
+        self.frames = 0  # Number of valid frames decoded.
+        self.crc_errors = 0  # Number of candidate frames rejected by the CRC check.
+        self.discarded_bytes = 0  # Number of bytes skipped while looking for a frame header.
+
+    def reset(self):
+        """
+            Function to drop any partial frame, e.g. after the connection with the rfid reader is re-established.
+        """
+        self._buffer.clear()
+
+    @property
+    def pending(self):
+        """
+            Number of buffered bytes still waiting for the rest of their frame.
+        """
+        return len(self._buffer)
+
+    def feed(self, chunk):
+        """
+            Function to append a chunk received from the rfid reader and decode every complete frame in the buffer.
+            :param chunk: Bytes returned by recv()/read().
+            :return: List of TagRead for all the tags found, in the order they were received.
+        """
+        buffer = self._buffer
+        buffer += chunk
+        end = len(buffer)
+        tags = []
+        pos = 0
+
+        # The memoryview lets the CRC and the EPC conversion work on the buffer in place. It has to be released
+        # before the consumed bytes are deleted from the bytearray.
+        with memoryview(buffer) as view:
+            while True:
+                start = buffer.find(HEAD, pos)
+                if start < 0:
+                    self.discarded_bytes += end - pos
+                    pos = end
+                    break
+                if start != pos:
+                    self.discarded_bytes += start - pos
+                if end - start < FRAME_OVERHEAD:
+                    pos = start  # Header found but LEN has not arrived yet.
+                    break
+                data_len = buffer[start + LEN_INDEX]
+                frame_end = start + FRAME_OVERHEAD + data_len
+                if frame_end > end:
+                    pos = start  # Wait for the rest of the frame.
+                    break
+
+                crc = (buffer[frame_end - 2] << 8) | buffer[frame_end - 1]
+                if crc16(view[start:frame_end - 2]) != crc:
+                    self.crc_errors += 1
+                    pos = start + 1  # Not a real frame, look for the next header.
+                    continue
+
+                self.frames += 1
+                cmd = (buffer[start + 2] << 8) | buffer[start + 3]
+                data = start + DATA_INDEX
+                if (cmd == CMD_INVENTORY_CONTINUE and data_len >= TAG_HEADER_LEN
+                        and buffer[data] == STATUS_SUCCESS):
+                    epc_len = buffer[data + 5]
+                    epc_start = data + TAG_HEADER_LEN
+                    if epc_len and TAG_HEADER_LEN + epc_len <= data_len:
+                        tags.append(TagRead(view[epc_start:epc_start + epc_len].hex(),
+                                            (buffer[data + 1] << 8) | buffer[data + 2],
+                                            buffer[data + 3], buffer[data + 4]))
+                elif self.on_response is not None:
+                    self.on_response(cmd, bytes(view[start:frame_end]))
+                pos = frame_end
+
+        if pos:
+            del buffer[:pos]  # Compact once per chunk instead of once per frame.
+        return tags
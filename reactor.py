@@ -0,0 +1,181 @@
+"""
+    Event driven receive path: one thread blocks in selectors (epoll on Linux) until one of its reader sessions has
+    data or completes a connection attempt, a keepalive/reconnection/timer deadline is reached or another thread wakes
+    it up through a socketpair. An idle reader therefore costs no CPU, and one thread can serve one reader or many.
+    Nothing on that thread blocks: sessions connect without waiting and only send their commands.
+"""
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+
+class SessionReactor:
+    """
+        Serves ReaderSession objects from the thread calling run(). add(), remove(), call_soon() and stop() are safe to
+        call from any thread.
+    """
+
+    def __init__(self, bufsize=4096):
+        """
+            :param bufsize: Maximum number of bytes read per readable event.
+        """
+        self.bufsize = bufsize
+        self.selector = selectors.DefaultSelector()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self.selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        self._sessions = {}  # session -> [on_data callback, registered socket, registered events]
+        self._timers = []  # [next deadline, interval, callback]
+        self._calls = deque()  # Callables queued by other threads, run on the reactor thread.
+        self._running = False
+        self.thread = None
+
+    def wakeup(self):
+        """
+            Function to interrupt select() from another thread.
+        """
+        try:
+            self._wakeup_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # A wakeup is already pending, or the reactor is closed.
+
+    def call_soon(self, callback, *args):
+        """
+            Function to run a callable on the reactor thread at the next iteration.
+        """
+        self._calls.append((callback, args))
+        self.wakeup()
+
+    def add(self, session, on_data):
+        """
+            Function to serve a session from this reactor.
+            :param session: session.ReaderSession, already connected or not.
+            :param on_data: Callable receiving (session, data) for every chunk received. It has to pass the command
+            responses it decodes to session.on_response().
+        """
+        self.call_soon(self._add, session, on_data)
+
+    def _add(self, session, on_data):
+        self._sessions[session] = [on_data, None, None]
+        self._sync_registration(session)
+
+    def remove(self, session):
+        """
+            Function to stop serving a session, the session itself is left open.
+        """
+        self.call_soon(self._remove, session)
+
+    def _remove(self, session):
+        entry = self._sessions.pop(session, None)
+        if entry is not None and entry[1] is not None:
+            self._unregister(entry[1])
+
+    def add_timer(self, interval, callback):
+        """
+            Function to call `callback()` on the reactor thread every `interval` seconds.
+        """
+        self.call_soon(self._timers.append, [time.monotonic() + interval, interval, callback])
+
+    def _unregister(self, connection):
+        try:
+            self.selector.unregister(connection)
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def _sync_registration(self, session):
+        # The session replaces its socket when it reconnects, keep the selector in step. A connection attempt in
+        # progress is watched until it is writable, an established connection until data arrives.
+        entry = self._sessions[session]
+        if session.connection is not None:
+            connection, events = session.connection, selectors.EVENT_READ
+        else:
+            connection, events = session.connecting, selectors.EVENT_WRITE
+        if connection is entry[1] and events == entry[2]:
+            return
+        if entry[1] is not None:
+            self._unregister(entry[1])
+        entry[1], entry[2] = connection, events
+        if connection is not None:
+            self.selector.register(connection, events, session)
+
+    def _run_calls(self):
+        while self._calls:
+            callback, args = self._calls.popleft()
+            callback(*args)
+
+    def _maintain(self):
+        # Runs the keepalive/reconnection work and the timers, returns the time select() can sleep for.
+        wait = None
+        for session in list(self._sessions):
+            session_wait = session.maintain()
+            self._sync_registration(session)
+            if session_wait is not None and (wait is None or session_wait < wait):
+                wait = session_wait
+        now = time.monotonic()
+        for timer in self._timers:
+            if timer[0] <= now:
+                timer[2]()
+                timer[0] = now + timer[1]
+            timer_wait = max(0.0, timer[0] - now)
+            if wait is None or timer_wait < wait:
+                wait = timer_wait
+        return wait
+
+    def run(self):
+        """
+            Function to serve the sessions until stop() is called.
+        """
+        self._running = True
+        self.thread = threading.current_thread()
+        while self._running:
+            self._run_calls()
+            if not self._running:
+                break  # stop() was among the calls, do not wait in select() for the next deadline.
+            wait = self._maintain()
+            for key, events in self.selector.select(wait):
+                if key.fileobj is self._wakeup_recv:
+                    try:
+                        while self._wakeup_recv.recv(64):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                session = key.data
+                entry = self._sessions.get(session)
+                if entry is None or entry[1] is not key.fileobj:
+                    continue
+                if events & selectors.EVENT_WRITE:
+                    session.finish_connect()
+                else:
+                    data = session.receive(self.bufsize)
+                    if data:
+                        entry[0](session, data)
+                # The connection may be up, lost, or closed by a refused start: the session reconnects in maintain().
+                self._sync_registration(session)
+        self._run_calls()
+
+    def start(self, name='rfid-reactor'):
+        """
+            Function to run the reactor in a background daemon thread.
+            :return: The thread.
+        """
+        thread = threading.Thread(target=self.run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """
+            Function to make run() return, the registered sessions are left open.
+        """
+        self.call_soon(setattr, self, '_running', False)
+
+    def close(self):
+        """
+            Function to release the selector and the wakeup socketpair once run() has returned.
+        """
+        self.selector.close()
+        self._wakeup_recv.close()
+        self._wakeup_send.close()
@@ -0,0 +1,171 @@
+"""
+    Buffered serial transport for the rfid reader. A background thread reads whatever the port has received and feeds
+    it to a TagFrameDecoder: tag notifications go to the on_tags callback, command responses complete the command
+    waiting for them. A command therefore returns as soon as its LEN delimited response frame is complete, instead of
+    waiting for the read timeout of the port.
+
+    SerialTransport has write()/read() methods behaving like a serial.Serial for the command functions of api.py
+    (write a command frame, read its response frame), so they work unchanged with connection_type 'serial'.
+"""
+import threading
+import time
+
+import serial
+
+from logs import get_logger
+from metrics import ReaderMetrics
+from protocol import TagFrameDecoder, DEVICE_INFO_COMMAND, CMD_DEVICE_INFO, STATUS_SUCCESS, DATA_INDEX
+
+BAUD_RATES = [9600, 19200, 38400, 57600, 115200]  # Speeds supported by the rfid reader, see api.open_device.
+POLL_INTERVAL = 0.05  # Read timeout of the background thread, bounds how long close() waits for it.
+
+
+class SerialTransport:
+    """
+        A serial port owned by a background reader thread. One command at a time; the tags streamed while the reading
+        mode is active are delivered to on_tags from the reader thread.
+    """
+
+    def __init__(self, port, baud_rate, on_tags=None, response_timeout=1.0):
+        """
+            :param port: The com port, e.g. '/dev/ttyUSB0' or 'COM3'; a pyserial port object is also accepted.
+            :param baud_rate: Speed of the port.
+            :param on_tags: Optional callable receiving the list of protocol.TagRead decoded from each read.
+            :param response_timeout: Seconds read() waits for the response of the last command written.
+        """
+        if isinstance(port, str):
+            self.serial = serial.Serial(port, baud_rate, timeout=POLL_INTERVAL)
+        else:
+            self.serial = port
+            self.serial.timeout = POLL_INTERVAL
+        self.name = self.serial.port or 'serial'
+        self.on_tags = on_tags
+        self.response_timeout = response_timeout
+        self.logger = get_logger('serial', self.name)
+        self.decoder = TagFrameDecoder(on_response=self._on_response)
+        self.metrics = ReaderMetrics(self.name, self.decoder)
+        self._command_lock = threading.Lock()  # One command in flight, so a response matches its command.
+        self._response_ready = threading.Event()
+        self._expected_cmd = None
+        self._response = None
+        self._speed_change = None  # [baud rate, applied event, error], applied by the reader thread.
+        self._closed = threading.Event()
+        self.thread = threading.Thread(target=self._read_loop, name=f'rfid-serial-{self.name}', daemon=True)
+        self.thread.start()
+
+    @property
+    def baudrate(self):
+        return self.serial.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baud_rate):
+        # The reader thread changes the speed between two reads, resetting the decoder from this thread could happen
+        # in the middle of its feed().
+        change = self._speed_change = [baud_rate, threading.Event(), None]
+        while not change[1].wait(POLL_INTERVAL):
+            if not self.thread.is_alive():  # Closed or failed, nothing else uses the port any more.
+                self._apply_speed_change()
+        if change[2] is not None:
+            raise change[2]
+
+    def _apply_speed_change(self):
+        change, self._speed_change = self._speed_change, None
+        if change is None:
+            return
+        try:
+            self.serial.baudrate = change[0]
+            self.serial.reset_input_buffer()
+            self.decoder.reset()  # Bytes received at the old speed are garbage.
+        except (ValueError, serial.SerialException, OSError) as e:
+            change[2] = e
+        finally:
+            change[1].set()
+
+    def _read_loop(self):
+        port = self.serial
+        decoder = self.decoder
+        reader_metrics = self.metrics
+        while not self._closed.is_set():
+            if self._speed_change is not None:
+                self._apply_speed_change()
+            try:
+                data = port.read(port.in_waiting or 1)  # Everything already received, or wait for the next byte.
+            except (serial.SerialException, OSError, TypeError) as e:
+                if not self._closed.is_set():
+                    self.logger.error('Error reading from the serial port: %s', e)
+                break
+            if not data:
+                continue
+            start = time.perf_counter_ns()
+            tags = decoder.feed(data)
+            reader_metrics.observe(len(data), len(tags), time.perf_counter_ns() - start)
+            if tags and self.on_tags is not None:
+                try:
+                    self.on_tags(tags)
+                except Exception as e:
+                    self.logger.exception('on_tags failed: %s', e)
+        self._response_ready.set()  # Wake up a command still waiting.
+
+    def _on_response(self, cmd, frame):
+        if cmd == self._expected_cmd and not self._response_ready.is_set():
+            self._response = frame
+            self._response_ready.set()
+
+    def command(self, command, timeout=None):
+        """
+            Function to send a command frame and wait for its response frame.
+            :param command: The complete command frame, see the precomputed frames in protocol.py.
+            :param timeout: Seconds to wait, defaults to response_timeout.
+            :return: The response frame, or None if it did not arrive in time.
+        """
+        with self._command_lock:
+            self.write(command)
+            return self._wait_response(timeout) or None
+
+    def write(self, command):
+        """
+            Function to send a command frame; its response is then returned by read(). Used by api.py.
+        """
+        self._expected_cmd = (command[2] << 8) | command[3]
+        self._response = None
+        self._response_ready.clear()
+        self.serial.write(command)
+
+    def read(self, size=None):
+        """
+            Function to get the response of the command sent by write(), as soon as the complete frame has arrived.
+            Used by api.py, which still passes a read size: the whole frame is returned whatever its length.
+            :return: The response frame, or b'' if it did not arrive within response_timeout (like a serial timeout).
+        """
+        return self._wait_response(None)
+
+    def _wait_response(self, timeout):
+        self._response_ready.wait(self.response_timeout if timeout is None else timeout)
+        response, self._response = self._response, None
+        self._expected_cmd = None
+        return response or b''
+
+    def close(self):
+        self._closed.set()
+        self.thread.join(POLL_INTERVAL * 4)
+        self.serial.close()
+
+
+def detect_baud_rate(transport, baud_rates=BAUD_RATES, probe_timeout=0.15):
+    """
+        Function to find the speed of the rfid reader: each speed is tried with a get_device_info command and the first
+        one getting a CRC valid answer wins. Since the command returns as soon as the answer is complete, a wrong speed
+        costs at most probe_timeout instead of the 1 s timeout of a plain read.
+        :param transport: An open SerialTransport, left at the detected speed.
+        :param baud_rates: Speeds to try, most likely first.
+        :param probe_timeout: Seconds to wait for the answer at each speed.
+        :return: The detected speed, or None if the reader answered at none of them.
+    """
+    for baud_rate in baud_rates:
+        transport.baudrate = baud_rate
+        response = transport.command(DEVICE_INFO_COMMAND, probe_timeout)
+        # Only CRC valid frames reach the response, the status byte confirms the answer matches the command.
+        if response and (response[2] << 8 | response[3]) == CMD_DEVICE_INFO and response[DATA_INDEX] == STATUS_SUCCESS:
+            transport.logger.info('Reader answering at %s baud.', baud_rate)
+            return baud_rate
+    return None
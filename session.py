@@ -0,0 +1,365 @@
+"""
+    Persistent network session with an rfid reader. The session notices dead connections (socket errors, or no answer
+    to a periodic get_device_info keepalive), reconnects with jittered exponential backoff and re-issues the start
+    command by itself when the reading mode was active. Served by a reactor it never blocks: the connection attempts
+    are non-blocking and the commands are only sent, their responses come back with the received data.
+"""
+import errno
+import os
+import random
+import socket
+import threading
+import time
+
+from api import open_socket_connection, close_network_connection, start_reading_mode, CONNECTIONS
+from logs import get_logger
+from metrics import REGISTRY
+from protocol import (inventory_command, DEVICE_INFO_COMMAND, INVENTORY_STOP_COMMAND, CMD_INVENTORY_CONTINUE,
+                      DATA_INDEX, STATUS_SUCCESS)
+
+DISCONNECTED = 'disconnected'
+CONNECTED = 'connected'
+READING = 'reading'
+RECONNECTING = 'reconnecting'
+CLOSED = 'closed'
+
+KEEPALIVE_COMMAND = DEVICE_INFO_COMMAND
+
+
+class ReaderSession:
+    """
+        A network connection to one rfid reader that keeps itself alive.
+
+        It is served by a reactor.SessionReactor, which calls receive() when the connection is readable, finish_connect()
+        when a connection attempt completes and maintain() for the keepalive and the reconnections, whether the reading
+        mode is active or not. Reconnecting happens inside maintain(), so the caller never sees a dead socket; it only
+        has to reset its frame decoder when `generation` changes, and pass the command responses it decodes to
+        on_response(): the reading mode counts as started once the reader has accepted the start command.
+    """
+
+    def __init__(self, ip, port, keepalive_interval=5.0, keepalive_timeout=3.0, connect_timeout=3,
+                 backoff_initial=0.25, backoff_max=30.0, on_state_change=None, capture=None):
+        """
+            :param ip: The IP address of the rfid reader.
+            :param port: The port number of the rfid reader.
+            :param keepalive_interval: Seconds without any data before a keepalive command is sent.
+            :param keepalive_timeout: Seconds to wait for any data after the keepalive before the connection is dead.
+            :param connect_timeout: Timeout in seconds of each connection attempt.
+            :param backoff_initial: Delay before the second reconnection attempt, doubled after each failure.
+            :param backoff_max: Upper bound of the delay between reconnection attempts.
+            :param on_state_change: Optional callable receiving the session whenever its state changes.
+            :param capture: Optional capture.CaptureWriter recording every chunk received.
+        """
+        self.ip = ip
+        self.port = port
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.on_state_change = on_state_change
+        self.capture = capture
+        self.logger = get_logger('session', f'{ip}:{port}')
+        self._reconnects = REGISTRY.counter('rfid_reconnects_total', 'Successful reconnections', reader=f'{ip}:{port}')
+        self._connections_lost = REGISTRY.counter('rfid_connections_lost_total', 'Connections lost',
+                                                  reader=f'{ip}:{port}')
+
+        self.connection = None
+        self.connecting = None  # Socket of the connection attempt in progress, see begin_connect().
+        self.state = DISCONNECTED
+        self.reading = False  # Whether the reading mode should be active, restored after every reconnection.
+        self.generation = 0  # Incremented on every successful connection.
+        self.reconnect_count = 0
+        self.last_error = None
+        self.last_rx = 0.0
+        self._ping_sent = None
+        self._start_sent = None  # When the start command was sent, until the reader answers it.
+        self._start_completes_attempt = False  # Whether that answer completes a connection attempt.
+        self._connect_deadline = 0.0
+        self._connected_once = False
+        self._attempts = 0
+        self._next_attempt = 0.0
+        self._closed = threading.Event()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.logger.info('State %s (reconnects: %d)', state, self.reconnect_count)
+            if self.on_state_change is not None:
+                self.on_state_change(self)
+
+    @property
+    def connected(self):
+        return self.connection is not None
+
+    def connect(self):
+        """
+            Function to make a single blocking connection attempt, for callers outside of the reactor thread (the
+            reactor uses begin_connect()). If the reading mode was active, it is started again; a reader that does not
+            accept the start command counts as a failed attempt.
+            :return: True if the connection is established, False otherwise.
+        """
+        connection = open_socket_connection(self.ip, self.port, self.connect_timeout)
+        if connection is None:
+            self._attempt_failed('connection attempt failed')
+            return False
+        if self.reading:
+            connection.settimeout(self.connect_timeout)
+            status_code, _ = start_reading_mode(connection, 'network')
+            if status_code != STATUS_SUCCESS:
+                close_network_connection(connection)
+                self._attempt_failed('start_reading_mode failed' if status_code is None else
+                                     f'start_reading_mode returned status 0x{status_code:02X}')
+                return False
+        self._established(connection)
+        self._attempt_succeeded()
+        return True
+
+    def begin_connect(self):
+        """
+            Function to start a non-blocking connection attempt. The reactor waits for the socket in `connecting` to
+            become writable and then calls finish_connect(); maintain() gives up after connect_timeout.
+            :return: True if the attempt is in progress, False if it failed at once.
+        """
+        self._set_state(RECONNECTING)
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        connection.setblocking(False)
+        try:
+            error = connection.connect_ex((self.ip, self.port))
+        except OSError as e:  # E.g. an address that is not an IPv4 address.
+            error = e
+        if error not in (0, errno.EINPROGRESS):
+            connection.close()
+            CONNECTIONS['error'].value += 1
+            self._attempt_failed(error if isinstance(error, OSError) else os.strerror(error))
+            return False
+        self.connecting = connection
+        self._connect_deadline = time.monotonic() + self.connect_timeout
+        return True
+
+    def finish_connect(self):
+        """
+            Function to complete the attempt started by begin_connect(), once its socket is writable. If the reading
+            mode was active the start command is sent; the attempt succeeds when on_response() gets its answer.
+        """
+        connection, self.connecting = self.connecting, None
+        if connection is None:
+            return
+        error = connection.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            connection.close()
+            CONNECTIONS['error'].value += 1
+            self._attempt_failed(os.strerror(error))
+            return
+        CONNECTIONS['ok'].value += 1
+        self.logger.info('Network connection established.')
+        self._established(connection)
+        if self.reading:
+            self._send_start()
+            self._start_completes_attempt = self._start_sent is not None
+        else:
+            self._attempt_succeeded()
+
+    def _established(self, connection):
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        connection.settimeout(self.connect_timeout)  # Bounds the commands sent, recv() is only called when readable.
+        self.connection = connection
+        self.generation += 1
+        self.last_rx = time.monotonic()
+        self._ping_sent = None
+        self._start_sent = None
+        self._set_state(CONNECTED)
+
+    def _attempt_succeeded(self):
+        self._attempts = 0
+        if self._connected_once:
+            self.reconnect_count += 1
+            self._reconnects.value += 1
+        self._connected_once = True
+        self._set_state(READING if self.reading else CONNECTED)
+
+    def _attempt_failed(self, reason):
+        self.logger.warning('Connection attempt failed: %s', reason)
+        self.last_error = str(reason)
+        for connection in (self.connecting, self.connection):
+            if connection is not None:
+                try:
+                    connection.close()
+                except OSError:
+                    pass
+        self.connecting = self.connection = None
+        self._start_sent = None
+        self._next_attempt = time.monotonic() + self.next_backoff()
+        self._set_state(DISCONNECTED)
+
+    def _send_start(self):
+        try:
+            self.connection.sendall(inventory_command())
+        except OSError as e:
+            self._connection_lost(e)
+            return
+        self._start_sent = time.monotonic()
+        self._start_completes_attempt = False
+
+    def on_response(self, cmd, frame):
+        """
+            Function to hand the session a command response decoded from the received data, it is meant to be the
+            on_response callback of the protocol.TagFrameDecoder of the receive loop. The answer to the start command
+            completes the connection attempt, or fails it if the reader refused to start reading. On a connection that
+            was already up, a refused start is only logged and the session stays connected.
+            :param cmd: CMD of the response.
+            :param frame: The complete response frame.
+        """
+        if cmd != CMD_INVENTORY_CONTINUE or self._start_sent is None:
+            return
+        self._start_sent = None
+        status_code = frame[DATA_INDEX]
+        if self._start_completes_attempt:
+            self._start_completes_attempt = False
+            if status_code == STATUS_SUCCESS:
+                self._attempt_succeeded()
+            else:
+                self._attempt_failed(f'start_reading_mode returned status 0x{status_code:02X}')
+        elif status_code == STATUS_SUCCESS:
+            self._set_state(READING if self.reading else CONNECTED)
+        else:
+            self.logger.warning('start_reading_mode returned status 0x%02X, the reading mode is off.', status_code)
+            self.reading = False
+            self._set_state(CONNECTED)
+
+    def next_backoff(self):
+        """
+            Function to compute the delay before the next reconnection attempt: exponential in the number of failed
+            attempts, capped at backoff_max, and randomised so that readers dropped by the same switch flap do not all
+            retry at the same instant.
+        """
+        delay = min(self.backoff_max, self.backoff_initial * (2 ** self._attempts))
+        self._attempts += 1
+        return random.uniform(delay / 2, delay)
+
+    def _connection_lost(self, reason):
+        self.logger.warning('Connection lost: %s', reason)
+        self._connections_lost.value += 1
+        self.last_error = str(reason)
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except OSError:
+                pass
+            self.connection = None
+        self._start_sent = None
+        self._next_attempt = time.monotonic()  # The first attempt is immediate.
+        self._set_state(DISCONNECTED)
+
+    def _reconnect_if_due(self):
+        if self._closed.is_set() or time.monotonic() < self._next_attempt:
+            return
+        self.begin_connect()
+
+    def _check_keepalive(self):
+        now = time.monotonic()
+        if self._start_sent is not None:
+            if now - self._start_sent > self.connect_timeout:
+                if self._start_completes_attempt:
+                    self._attempt_failed('no response to start_reading_mode')
+                else:
+                    self._connection_lost('no response to start_reading_mode')
+        elif self._ping_sent is not None:
+            if now - self._ping_sent > self.keepalive_timeout:
+                self._connection_lost('no response to keepalive')
+        elif now - self.last_rx >= self.keepalive_interval:
+            # The response is consumed by the receive loop like any other frame, any incoming data proves the
+            # connection is alive.
+            try:
+                self.connection.sendall(KEEPALIVE_COMMAND)
+                self._ping_sent = now
+            except OSError as e:
+                self._connection_lost(e)
+
+    def receive(self, bufsize=1024):
+        """
+            Function to read the data available on the connection, to be called once select() reports the connection
+            as readable so the call never blocks.
+            :param bufsize: Maximum number of bytes to return.
+            :return: The received bytes, or None if the connection was lost (a reconnection is then scheduled).
+        """
+        try:
+            data = self.connection.recv(bufsize)
+        except OSError as e:
+            if not self._closed.is_set():
+                self._connection_lost(e)
+            return None
+        if not data:
+            self._connection_lost('connection closed by the reader')
+            return None
+        self.last_rx = time.monotonic()
+        self._ping_sent = None
+        if self.capture is not None:
+            self.capture.write(f'{self.ip}:{self.port}', data)
+        return data
+
+    def maintain(self):
+        """
+            Function to run the time based work of the session: connection attempts once the backoff delay is over and
+            their timeout, the timeout of the start command, and the keepalive when the connection has been quiet.
+            :return: Seconds until maintain() needs to be called again if no data arrives in between.
+        """
+        if self._closed.is_set():
+            return None
+        if self.connecting is not None:
+            wait = self._connect_deadline - time.monotonic()
+            if wait > 0:
+                return wait
+            CONNECTIONS['timeout'].value += 1
+            self._attempt_failed(f'connection attempt timed out after {self.connect_timeout} seconds')
+        if self.connection is None:
+            self._reconnect_if_due()
+            if self.connecting is not None:
+                return max(0.0, self._connect_deadline - time.monotonic())
+            return max(0.0, self._next_attempt - time.monotonic())
+        self._check_keepalive()
+        if self.connection is None:
+            return 0.0
+        if self._start_sent is not None:
+            return max(0.0, self._start_sent + self.connect_timeout - time.monotonic())
+        if self._ping_sent is not None:
+            return max(0.0, self._ping_sent + self.keepalive_timeout - time.monotonic())
+        return max(0.0, self.last_rx + self.keepalive_interval - time.monotonic())
+
+    def start_reading(self):
+        """
+            Function to start the reading mode, it is restored automatically after every reconnection. The start
+            command is only sent, the session is in the READING state once on_response() gets its answer.
+        """
+        self.reading = True
+        if self.connection is not None and self._start_sent is None:
+            self._send_start()
+
+    def stop_reading(self):
+        """
+            Function to stop the reading mode. The stop command is only sent, its answer comes back with the received
+            data like any other frame.
+        """
+        self.reading = False
+        if self.connection is not None:
+            try:
+                self.connection.sendall(INVENTORY_STOP_COMMAND)
+            except OSError as e:
+                self._connection_lost(e)
+                return
+            if self._start_sent is None:
+                self._set_state(CONNECTED)
+
+    def close(self):
+        """
+            Function to close the connection for good, maintain() no longer reconnects it.
+        """
+        self._closed.set()
+        self.reading = False
+        if self.connecting is not None:
+            self.connecting.close()
+            self.connecting = None
+        if self.connection is not None:
+            close_network_connection(self.connection)
+            self.connection = None
+        self._set_state(CLOSED)
@@ -0,0 +1,309 @@
+"""
+    Multi-process ingestion for large reader fleets. The readers are split across worker processes; each worker owns its
+    sockets (ReaderSession + SessionReactor) and decodes the frames itself, then hands the decoded tags to the parent
+    through a shared-memory ring buffer of fixed-width records, so nothing is pickled on the way. Frame decoding then
+    uses as many cores as there are workers instead of sharing the GIL with the gui.
+
+    Run from the repository root with: python sharding.py [--workers N] ip[:port] ...
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from logs import configure_logging, get_logger, TagLogSampler
+from protocol import TagRead, TagFrameDecoder
+
+# timestamp_ns(8) reader index(2) rssi(2) antenna(1) channel(1) EPC length(1) padding(1) EPC(32)
+TAG_RECORD = struct.Struct('<qHHBBBx32s')
+MAX_EPC_LEN = 32
+_COUNTER = struct.Struct('<Q')
+_HEAD_OFFSET = 0  # Slots written so far, only the producer updates it.
+_TAIL_OFFSET = 64  # Slots read so far, only the consumer updates it. Separate cache line from the head.
+_HEADER_SIZE = 128
+
+logger = get_logger('sharding')
+
+
+class ShmRing:
+    """
+        Single producer, single consumer ring of TAG_RECORD slots in shared memory. The producer only writes the slots
+        and then the head counter, the consumer only reads the slots and then writes the tail counter. The counters
+        are read and written under `lock`: its acquire and release are memory barriers, so a process that sees a new
+        head also sees the slots written before it (and the producer never overwrites slots still being copied) on
+        weakly ordered CPUs such as ARM, not only on x86. The lock is taken once per batch of records, and only for
+        the counters.
+    """
+
+    def __init__(self, name=None, slots=65536, lock=None):
+        """
+            :param name: Name of an existing ring to attach to, None creates a new one.
+            :param slots: Number of records the ring holds (only used when creating it).
+            :param lock: multiprocessing Lock shared by the producer and the consumer, passed to the other process along
+            with the name. Defaults to a new lock, enough when both sides are in the same process.
+        """
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + slots * TAG_RECORD.size)
+            self.shm.buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.shm.name
+        self.slots = (self.shm.size - _HEADER_SIZE) // TAG_RECORD.size
+        self.buf = self.shm.buf
+        self.lock = multiprocessing.Lock() if lock is None else lock
+        self.dropped = 0
+
+    def _counter(self, offset):
+        return _COUNTER.unpack_from(self.buf, offset)[0]
+
+    def available(self):
+        """
+            :return: Number of records waiting to be read.
+        """
+        with self.lock:
+            return self._counter(_HEAD_OFFSET) - self._counter(_TAIL_OFFSET)
+
+    def put_many(self, records):
+        """
+            Function to write packed TAG_RECORD records; never blocks, records that don't fit are dropped.
+            :param records: Bytes holding a whole number of records.
+            :return: Number of records written.
+        """
+        count = len(records) // TAG_RECORD.size
+        with self.lock:
+            head = self._counter(_HEAD_OFFSET)
+            free = self.slots - (head - self._counter(_TAIL_OFFSET))
+        if count > free:
+            self.dropped += count - free
+            count = free
+        if not count:
+            return 0
+        size = TAG_RECORD.size
+        start = head % self.slots
+        first = min(count, self.slots - start)  # Records before the end of the ring, the rest wraps to the start.
+        base = _HEADER_SIZE + start * size
+        self.buf[base:base + first * size] = records[:first * size]
+        if count > first:
+            self.buf[_HEADER_SIZE:_HEADER_SIZE + (count - first) * size] = records[first * size:count * size]
+        with self.lock:
+            _COUNTER.pack_into(self.buf, _HEAD_OFFSET, head + count)  # Publish after the slots are written.
+        return count
+
+    def get_many(self, max_records=None):
+        """
+            Function to take the records available in the ring.
+            :param max_records: Upper bound on the number of records returned.
+            :return: Bytes holding the records (possibly empty).
+        """
+        with self.lock:
+            tail = self._counter(_TAIL_OFFSET)
+            count = self._counter(_HEAD_OFFSET) - tail
+        if max_records is not None:
+            count = min(count, max_records)
+        if not count:
+            return b''
+        size = TAG_RECORD.size
+        start = tail % self.slots
+        first = min(count, self.slots - start)
+        base = _HEADER_SIZE + start * size
+        records = bytes(self.buf[base:base + first * size])
+        if count > first:
+            records += bytes(self.buf[_HEADER_SIZE:_HEADER_SIZE + (count - first) * size])
+        with self.lock:
+            _COUNTER.pack_into(self.buf, _TAIL_OFFSET, tail + count)  # Release the slots after they are copied.
+        return records
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(ring_name, ring_lock, readers, stop_event, data_ready):
+    """
+        Entry point of a worker process: serves its share of the readers and fills the ring.
+        :param ring_name: Name of the ShmRing created by the parent for this worker.
+        :param ring_lock: The lock of that ring.
+        :param readers: List of (reader index, ip, port) owned by this worker, the index is the reader id of the records.
+        :param stop_event: multiprocessing.Event set by the parent to stop the worker.
+        :param data_ready: multiprocessing.Event set after new records are written, it wakes up the parent.
+    """
+    from reactor import SessionReactor
+    from session import ReaderSession
+
+    ring = ShmRing(ring_name, lock=ring_lock)
+    reactor = SessionReactor()
+    pack = TAG_RECORD.pack
+
+    def make_handler(reader_index, session):
+        decoder = TagFrameDecoder(on_response=session.on_response)
+        generation = None
+
+        def on_data(session, data):
+            nonlocal generation
+            if session.generation != generation:
+                decoder.reset()
+                generation = session.generation
+            tags = decoder.feed(data)
+            if tags:
+                now = time.time_ns()
+                if ring.put_many(b''.join(
+                        pack(now, reader_index, tag.rssi, tag.antenna, tag.channel, len(raw), raw)
+                        for tag in tags for raw in (bytes.fromhex(tag.epc)[:MAX_EPC_LEN],))):
+                    data_ready.set()
+
+        return on_data
+
+    sessions = []
+    for reader_index, ip, port in readers:
+        session = ReaderSession(ip, port)
+        session.reading = True  # The reactor connects the session and starts the reading mode, on every reconnection too.
+        sessions.append(session)
+        reactor.add(session, make_handler(reader_index, session))
+
+    threading.Thread(target=lambda: (stop_event.wait(), reactor.stop()), daemon=True).start()
+    try:
+        reactor.run()
+    finally:
+        for session in sessions:
+            session.stop_reading()
+            session.close()
+        reactor.close()
+        if ring.dropped:
+            logger.warning('%d tags dropped, the parent did not keep up', ring.dropped)
+        ring.close()
+
+
+class ShardedIngestor:
+    """
+        Spreads the readers over worker processes and collects their tags in the parent.
+    """
+
+    def __init__(self, readers, workers=None, ring_slots=65536):
+        """
+            :param readers: List of (ip, port).
+            :param workers: Number of worker processes, defaults to the number of cores (at most one per reader).
+            :param ring_slots: Capacity of each worker's ring, in tags.
+        """
+        self.readers = list(readers)
+        self.names = [f'{ip}:{port}' for ip, port in self.readers]
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.readers)))
+        self.ring_slots = ring_slots
+        self.rings = []
+        self.processes = []
+        self._context = multiprocessing.get_context('spawn')  # Workers must not inherit the gui's threads.
+        self._stop_event = self._context.Event()
+        self._data_ready = self._context.Event()  # Set by the workers when they publish records.
+        self.received = 0
+
+    def start(self):
+        """
+            Function to create the rings and start the worker processes.
+        """
+        for worker in range(self.workers):
+            # Readers are dealt round-robin, so every worker gets the same share of a fleet of similar readers.
+            shard = [(index, ip, port) for index, (ip, port) in enumerate(self.readers)][worker::self.workers]
+            ring = ShmRing(slots=self.ring_slots, lock=self._context.Lock())
+            self.rings.append(ring)
+            process = self._context.Process(target=_worker_main, name=f'rfid-shard-{worker}', daemon=True,
+                                            args=(ring.name, ring.lock, shard, self._stop_event, self._data_ready))
+            process.start()
+            self.processes.append(process)
+        return self
+
+    def poll_records(self):
+        """
+            Function to collect the raw records from every worker ring without decoding them.
+            :return: List of bytes, each holding a whole number of TAG_RECORD records.
+        """
+        batches = []
+        for ring in self.rings:
+            records = ring.get_many()
+            if records:
+                batches.append(records)
+                self.received += len(records) // TAG_RECORD.size
+        return batches
+
+    def poll(self):
+        """
+            Function to collect the tags decoded by the workers since the last call.
+            :return: List of (reader, TagRead).
+        """
+        tags = []
+        for records in self.poll_records():
+            for _, reader_index, rssi, antenna, channel, epc_len, epc in TAG_RECORD.iter_unpack(records):
+                tags.append((self.names[reader_index], TagRead(epc[:epc_len].hex(), rssi, antenna, channel)))
+        return tags
+
+    def wait(self, timeout=None):
+        """
+            Function to sleep until a worker publishes new records or stop() is called, instead of polling the rings.
+            :param timeout: Seconds to wait at most, None waits without limit.
+            :return: False if the timeout expired, True otherwise.
+        """
+        self._data_ready.clear()
+        # Records published before the clear() don't signal again, so check the rings once more before sleeping.
+        if self._stop_event.is_set() or any(ring.available() for ring in self.rings):
+            return True
+        return self._data_ready.wait(timeout)
+
+    def tags(self):
+        """
+            Generator over (reader, TagRead) until stop() is called.
+        """
+        while not self._stop_event.is_set():
+            tags = self.poll()
+            if tags:
+                yield from tags
+            else:
+                self.wait()
+
+    def stop(self, timeout=5):
+        """
+            Function to stop the workers (they stop the reading mode of their readers) and release the rings.
+        """
+        self._stop_event.set()
+        self._data_ready.set()  # Wakes up wait().
+        for process in self.processes:
+            process.join(timeout)
+        self.poll_records()
+        for ring in self.rings:
+            ring.close()
+        self.rings = []
+        self.processes = []
+
+
+def main():
+    from fleet import READER_IPS, READER_PORT, parse_reader
+
+    parser = argparse.ArgumentParser(description='Read a fleet of rfid readers with one worker process per core')
+    parser.add_argument('readers', nargs='*', help='ip[:port], defaults to the configured readers')
+    parser.add_argument('--workers', type=int, default=None, help='defaults to the number of cores')
+    args = parser.parse_args()
+    configure_logging()
+
+    readers = [parse_reader(reader) for reader in args.readers] or [(ip, READER_PORT) for ip in READER_IPS]
+    ingestor = ShardedIngestor(readers, args.workers).start()
+    logger.info('%d readers over %d worker processes.', len(readers), ingestor.workers)
+    samplers = {}
+    try:
+        for reader, tag in ingestor.tags():
+            sampler = samplers.get(reader)
+            if sampler is None:
+                sampler = samplers[reader] = TagLogSampler(get_logger('tags', reader), level=logging.INFO)
+            sampler.log(tag)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingestor.stop()
+
+
+if __name__ == '__main__':
+    main()
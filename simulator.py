@@ -0,0 +1,280 @@
+"""
+    Simulated rfid reader speaking the same protocol as api.py, for load testing without the physical readers.
+
+    Every simulated reader answers start_reading_mode (0x0001), stop_reading_mode (0x0002), get_device_info (0x0070)
+    and reboot (0x0052) with CRC correct frames, and while the reading mode is active streams tag notifications at a
+    configurable rate, drawn from a configurable EPC population. The stream can be fragmented (frames split across
+    TCP segments) and corrupted (bytes flipped so the CRC check fails) to exercise the decoders.
+
+    A simulated reader can also be served on a pseudo terminal (start_serial), to exercise the serial transport.
+
+    Run from the repository root with: python simulator.py --readers 4 --base-port 2022 --rate 2000 [--serial]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import struct
+import time
+
+from protocol import (TagFrameDecoder, build_frame, CMD_INVENTORY_CONTINUE, CMD_INVENTORY_STOP, CMD_REBOOT,
+                      CMD_DEVICE_INFO, DATA_INDEX, STATUS_SUCCESS)
+
+STATUS_INVENTORY_DONE = 0x12
+
+FRAGMENT_NONE = 'none'  # Each batch of frames in a single write.
+FRAGMENT_RANDOM = 'random'  # Each batch cut at random offsets, so frames are split across writes.
+FRAGMENT_BYTE = 'byte'  # One byte per write, the worst case for a decoder.
+FRAGMENT_MODES = (FRAGMENT_NONE, FRAGMENT_RANDOM, FRAGMENT_BYTE)
+
+DEVICE_INFO = b'SIM-CP-1.0\x00SIM-RFID-1.0\x00SN0000000001'
+
+# In timestamp mode the 12 byte EPC carries the send time, so a consumer can compute the tag to consumer latency:
+# 4 byte tag index followed by the 8 byte time.monotonic_ns() of the batch.
+TIMESTAMP_EPC = struct.Struct('>IQ')
+
+
+def tag_frame(epc, rssi=0x00C8, antenna=1, channel=0):
+    """
+        Function to build a tag notification frame.
+        :param epc: Raw EPC bytes.
+        :return: The frame as bytes, CRC16 included.
+    """
+    return build_frame(CMD_INVENTORY_CONTINUE,
+                       bytes((STATUS_SUCCESS, (rssi >> 8) & 0xFF, rssi & 0xFF, antenna, channel, len(epc))) + epc)
+
+
+def epc_timestamp(epc_hex):
+    """
+        Function to extract the send time (time.monotonic_ns()) from an EPC produced in timestamp mode.
+    """
+    return TIMESTAMP_EPC.unpack(bytes.fromhex(epc_hex))[1]
+
+
+class SimulatedReader:
+    """
+        One simulated rfid reader listening on a TCP port.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, rate=1000, population=100, epc_len=12, antennas=4,
+                 fragmentation=FRAGMENT_NONE, corrupt_ratio=0.0, timestamps=False, tick=0.01, seed=None):
+        """
+            :param host: Address to listen on.
+            :param port: Port to listen on, 0 picks a free port (see `port` once started).
+            :param rate: Tag notifications per second while the reading mode is active.
+            :param population: Number of distinct EPCs in the field.
+            :param epc_len: Length in bytes of the EPCs.
+            :param antennas: Number of antennas the tags are spread over.
+            :param fragmentation: One of FRAGMENT_MODES.
+            :param corrupt_ratio: Fraction of the tag frames with one byte flipped.
+            :param timestamps: Put the send time in every EPC instead of drawing it from the population.
+            :param tick: Seconds between two batches of tag notifications.
+            :param seed: Seed of the random generator, for reproducible streams.
+        """
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.fragmentation = fragmentation
+        self.corrupt_ratio = corrupt_ratio
+        self.timestamps = timestamps
+        self.tick = tick
+        self.rng = random.Random(seed)
+        self.frames = [tag_frame(self.rng.randbytes(epc_len), antenna=self.rng.randint(1, antennas))
+                       for _ in range(population)]
+        self.server = None
+        self.serial_port = None  # Path of the pseudo terminal when served by start_serial().
+        self.serial_baud = None
+        self._serial_fd = None
+        self._serial_task = None
+        self.connections = 0
+        self.tags_sent = 0
+        self.corrupted = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def start_serial(self, baud_rate=None):
+        """
+            Function to serve the reader on a pseudo terminal instead of TCP, as if it was plugged on a serial port.
+            :param baud_rate: When set, commands are only answered while the port is configured at this speed, to
+            exercise the baud rate detection.
+            :return: self, open `serial_port` with pyserial to talk to the reader.
+        """
+        import pty  # POSIX only, imported here so the TCP simulator also runs on Windows.
+        import tty
+        master, slave = pty.openpty()
+        tty.setraw(slave)  # No echo nor line editing, the reader speaks binary frames.
+        self._serial_fd = slave  # Kept open so the reader survives the client closing and reopening the port.
+        self.serial_port = os.ttyname(slave)
+        self.serial_baud = baud_rate
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(master, 'rb', buffering=0))
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin,
+                                                            os.fdopen(os.dup(master), 'wb', buffering=0))
+        writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+        self._serial_task = asyncio.create_task(self._handle(reader, writer))
+        return self
+
+    def _speed_matches(self):
+        if self.serial_baud is None:
+            return True
+        import termios
+        attributes = termios.tcgetattr(self._serial_fd)
+        return attributes[5] == getattr(termios, f'B{self.serial_baud}')  # Output speed set by the client.
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self._serial_task is not None:
+            self._serial_task.cancel()
+            os.close(self._serial_fd)
+            self._serial_task = None
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Keep the fragments as separate segments.
+        commands = []
+        decoder = TagFrameDecoder(on_response=lambda cmd, frame: commands.append((cmd, frame)))
+        streaming = None
+        try:
+            while True:
+                chunk = await reader.read(1024)
+                if not chunk:
+                    break
+                decoder.feed(chunk)
+                if not self._speed_matches():
+                    commands.clear()  # At the wrong speed the reader only sees noise.
+                for cmd, frame in commands:
+                    if cmd == CMD_INVENTORY_CONTINUE:
+                        inv_param = int.from_bytes(frame[DATA_INDEX + 1:DATA_INDEX + 5], 'little')
+                        writer.write(build_frame(cmd, bytes((STATUS_SUCCESS,))))
+                        if streaming is None or streaming.done():
+                            streaming = asyncio.create_task(self._stream(writer, inv_param))
+                    elif cmd == CMD_INVENTORY_STOP:
+                        if streaming is not None:
+                            streaming.cancel()
+                            streaming = None
+                        writer.write(build_frame(cmd, bytes((STATUS_SUCCESS,))))
+                    elif cmd == CMD_DEVICE_INFO:
+                        writer.write(build_frame(cmd, bytes((STATUS_SUCCESS,)) + DEVICE_INFO))
+                    elif cmd == CMD_REBOOT:
+                        writer.write(build_frame(cmd, bytes((STATUS_SUCCESS,))))
+                        await writer.drain()
+                        return  # The reader drops the connection while it reboots.
+                commands.clear()
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if streaming is not None:
+                streaming.cancel()
+            writer.close()
+
+    def _batch(self, count, serial_number):
+        rng = self.rng
+        if self.timestamps:
+            now = time.monotonic_ns()
+            frames = [tag_frame(TIMESTAMP_EPC.pack((serial_number + i) & 0xFFFFFFFF, now)) for i in range(count)]
+        else:
+            frames = rng.choices(self.frames, k=count)
+        if self.corrupt_ratio:
+            for i in range(count):
+                if rng.random() < self.corrupt_ratio:
+                    frame = bytearray(frames[i])
+                    frame[rng.randrange(1, len(frame))] ^= 0xFF
+                    frames[i] = bytes(frame)
+                    self.corrupted += 1
+        return b''.join(frames)
+
+    def _fragments(self, data):
+        if self.fragmentation == FRAGMENT_BYTE:
+            return [data[i:i + 1] for i in range(len(data))]
+        if self.fragmentation == FRAGMENT_RANDOM:
+            fragments, pos = [], 0
+            while pos < len(data):
+                step = self.rng.randint(1, 64)
+                fragments.append(data[pos:pos + step])
+                pos += step
+            return fragments
+        return [data]
+
+    async def _stream(self, writer, inv_param):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        next_tick = started
+        owed = 0.0
+        try:
+            while not inv_param or loop.time() - started < inv_param:
+                owed += self.rate * self.tick
+                count = int(owed)
+                owed -= count
+                if count:
+                    for fragment in self._fragments(self._batch(count, self.tags_sent)):
+                        writer.write(fragment)
+                        if self.fragmentation != FRAGMENT_NONE:
+                            await writer.drain()
+                    self.tags_sent += count
+                    await writer.drain()
+                next_tick += self.tick
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            writer.write(build_frame(CMD_INVENTORY_CONTINUE, bytes((STATUS_INVENTORY_DONE,))))
+            await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def start_readers(count, host='127.0.0.1', base_port=0, serial=False, **options):
+    """
+        Function to start several simulated readers on consecutive ports (or on free ports when base_port is 0).
+        :param serial: Serve the readers on pseudo terminals instead of TCP ports.
+        :return: List of started SimulatedReader.
+    """
+    readers = []
+    for index in range(count):
+        port = base_port + index if base_port else 0
+        reader = SimulatedReader(host, port, seed=index, **options)
+        readers.append(await (reader.start_serial() if serial else reader.start()))
+    return readers
+
+
+async def serve(args):
+    readers = await start_readers(args.readers, args.host, args.base_port, rate=args.rate, population=args.population,
+                                  fragmentation=args.fragmentation, corrupt_ratio=args.corrupt_ratio,
+                                  timestamps=args.timestamps, serial=args.serial)
+    if args.serial:
+        print(f"Simulated readers on serial ports {', '.join(reader.serial_port for reader in readers)}")
+    else:
+        print(f"Simulated readers listening on {args.host}:{', '.join(str(r.port) for r in readers)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for reader in readers:
+            await reader.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Simulated rfid readers')
+    parser.add_argument('--readers', type=int, default=1)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=2022)
+    parser.add_argument('--rate', type=int, default=1000, help='tag notifications per second and per reader')
+    parser.add_argument('--population', type=int, default=100, help='distinct EPCs per reader')
+    parser.add_argument('--fragmentation', choices=FRAGMENT_MODES, default=FRAGMENT_NONE)
+    parser.add_argument('--corrupt-ratio', type=float, default=0.0)
+    parser.add_argument('--timestamps', action='store_true', help='encode the send time in the EPCs')
+    parser.add_argument('--serial', action='store_true', help='serve the readers on pseudo terminals instead of TCP')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,85 @@
+"""
+    Tests of the windowed tag deduplication of aggregator.py: arrivals, departures, history of departed tags and
+    eviction at max_tags.
+"""
+from aggregator import TagAggregator, TagEvent, ARRIVAL, DEPARTURE, format_tag_event
+from protocol import TagRead
+
+EPC_A = 'e28011700000020a1b2c3d4e'
+EPC_B = '300833b2ddd9014000000000000000ff'
+EPC_C = 'aabbccdd'
+
+
+def read(epc, antenna=1):
+    return TagRead(epc, 0x00C8, antenna, 0)
+
+
+def test_arrival_once_per_stay():
+    aggregator = TagAggregator(dwell_window=2.0)
+    assert aggregator.observe(read(EPC_A, antenna=2), now=100.0) == TagEvent(ARRIVAL, EPC_A, 2, 100.0, 100.0, 1)
+    assert aggregator.observe(read(EPC_A), now=100.5) is None
+    assert aggregator.observe(read(EPC_A, antenna=3), now=101.0) is None
+    assert aggregator.present == 1
+    record = aggregator.get(EPC_A)
+    assert (record.first_seen, record.last_seen, record.read_count, record.antenna) == (100.0, 101.0, 3, 3)
+    assert aggregator.reads == 3
+
+
+def test_departure_after_the_dwell_window():
+    aggregator = TagAggregator(dwell_window=2.0)
+    aggregator.observe(read(EPC_A), now=100.0)
+    aggregator.observe(read(EPC_B), now=101.0)
+    aggregator.observe(read(EPC_A), now=101.5)
+    assert aggregator.expire(now=102.9) == []
+    assert aggregator.expire(now=103.0) == [TagEvent(DEPARTURE, EPC_B, 1, 101.0, 101.0, 1)]
+    assert aggregator.expire(now=103.5) == [TagEvent(DEPARTURE, EPC_A, 1, 100.0, 101.5, 2)]
+    assert aggregator.present == 0
+    assert len(aggregator) == 2  # Remembered as departed.
+
+
+def test_returning_tag_keeps_its_history():
+    aggregator = TagAggregator(dwell_window=2.0, history_ttl=60)
+    aggregator.observe(read(EPC_A), now=100.0)
+    aggregator.observe(read(EPC_A), now=101.0)
+    aggregator.expire(now=110.0)
+    assert aggregator.observe(read(EPC_A, antenna=4), now=120.0) == TagEvent(ARRIVAL, EPC_A, 4, 100.0, 120.0, 3)
+    assert aggregator.present == 1
+
+
+def test_departed_tags_are_forgotten_after_history_ttl():
+    aggregator = TagAggregator(dwell_window=2.0, history_ttl=60)
+    aggregator.observe(read(EPC_A), now=100.0)
+    aggregator.expire(now=110.0)
+    assert aggregator.get(EPC_A) is not None
+    aggregator.expire(now=162.5)
+    assert aggregator.get(EPC_A) is None
+    assert len(aggregator) == 0
+    assert aggregator.observe(read(EPC_A), now=170.0) == TagEvent(ARRIVAL, EPC_A, 1, 170.0, 170.0, 1)
+
+
+def test_eviction_prefers_departed_tags():
+    aggregator = TagAggregator(dwell_window=2.0, max_tags=2)
+    aggregator.observe(read(EPC_A), now=100.0)
+    aggregator.observe(read(EPC_B), now=103.0)
+    aggregator.expire(now=103.0)  # EPC_A departed, EPC_B present.
+    aggregator.observe(read(EPC_C), now=104.0)
+    assert aggregator.evictions == 1
+    assert aggregator.get(EPC_A) is None
+    assert aggregator.present == 2
+    assert aggregator.expire(now=104.0) == []
+
+
+def test_eviction_of_present_tags_reports_their_departure():
+    aggregator = TagAggregator(dwell_window=2.0, max_tags=2)
+    aggregator.observe(read(EPC_A), now=100.0)
+    aggregator.observe(read(EPC_B), now=100.5)
+    aggregator.observe(read(EPC_A), now=101.0)  # EPC_B is now the least recently read.
+    aggregator.observe(read(EPC_C), now=101.5)
+    assert len(aggregator) == 2
+    assert aggregator.get(EPC_B) is None
+    assert aggregator.expire(now=101.5) == [TagEvent(DEPARTURE, EPC_B, 1, 100.5, 100.5, 1)]
+
+
+def test_format_tag_event():
+    assert format_tag_event(TagEvent(ARRIVAL, EPC_A, 2, 100.0, 100.0, 1)) == f'RFID Tag: {EPC_A} (antenna 2)'
+    assert format_tag_event(TagEvent(DEPARTURE, EPC_A, 2, 100.0, 101.0, 7)) == f'RFID Tag left: {EPC_A} (7 reads)'
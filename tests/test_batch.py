@@ -0,0 +1,101 @@
+"""
+    Tests of the batch decoding of batch.py against TagFrameDecoder, with NumPy and with the pure Python path.
+"""
+import random
+
+import pytest
+
+import batch
+from protocol import TagFrameDecoder, build_frame, CMD_INVENTORY_CONTINUE, CMD_INVENTORY_STOP, STATUS_SUCCESS
+
+
+def tag_frame(epc, rssi=0x00C8, antenna=1, channel=0, status=STATUS_SUCCESS):
+    return build_frame(CMD_INVENTORY_CONTINUE, bytes((status, rssi >> 8, rssi & 0xFF, antenna, channel, len(epc))) + epc)
+
+
+def stream(seed, frames=300, corrupt_ratio=0.0):
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(frames):
+        kind = rng.random()
+        if kind < 0.05:
+            frame = tag_frame(b'')  # Empty EPC.
+        elif kind < 0.1:
+            frame = build_frame(CMD_INVENTORY_STOP, bytes((STATUS_SUCCESS,)))
+        elif kind < 0.12:
+            frame = rng.randbytes(rng.randint(1, 5))  # Garbage between frames.
+        else:
+            frame = tag_frame(rng.randbytes(rng.choice((4, 12, 12, 12, 16, 32))), rssi=rng.randrange(0x10000),
+                              antenna=rng.randint(1, 4), channel=rng.randrange(50))
+        if rng.random() < corrupt_ratio:
+            frame = bytearray(frame)
+            frame[rng.randrange(len(frame))] ^= 1 << rng.randrange(8)
+            frame = bytes(frame)
+        parts.append(frame)
+    return b''.join(parts)
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def decode(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(batch, 'numpy', None)
+    return batch
+
+
+def batch_tags(decode, buffer):
+    result = decode.decode_batch(buffer)
+    epcs = decode.batch_epcs(buffer, result)
+    return [(epc, int(rssi), int(antenna), int(channel))
+            for epc, status, rssi, antenna, channel in zip(epcs, result.status, result.rssi, result.antenna,
+                                                           result.channel)
+            if status == STATUS_SUCCESS], result
+
+
+def decoder_tags(buffer):
+    decoder = TagFrameDecoder()
+    return [tuple(tag) for tag in decoder.feed(buffer)], decoder
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_tag_frame_decoder(decode, seed):
+    buffer = stream(seed)
+    tags, result = batch_tags(decode, buffer)
+    expected, decoder = decoder_tags(buffer)
+    assert tags == expected
+    assert result.frames == decoder.frames
+    assert result.crc_errors == decoder.crc_errors == 0
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_tag_frame_decoder_on_corrupted_streams(decode, seed):
+    buffer = stream(seed, corrupt_ratio=0.1)
+    tags, result = batch_tags(decode, buffer)
+    expected, decoder = decoder_tags(buffer)
+    assert tags == expected
+    assert result.crc_errors == decoder.crc_errors
+
+
+def test_empty_epc_is_not_a_tag(decode):
+    buffer = tag_frame(b'') + tag_frame(b'\x01\x02') + tag_frame(b'')
+    result = decode.decode_batch(buffer)
+    assert list(result.epc_lengths) == [2]
+    assert decode.batch_epcs(buffer, result) == ['0102']
+    assert result.frames == 3
+
+
+def test_incomplete_frame_is_left_for_the_next_call(decode):
+    frames = tag_frame(b'\xaa' * 12) + tag_frame(b'\xbb' * 12)
+    buffer = frames + tag_frame(b'\xcc' * 12)[:10]
+    result = decode.decode_batch(buffer)
+    assert decode.batch_epcs(buffer, result) == ['aa' * 12, 'bb' * 12]
+    assert result.consumed == len(frames)
+
+
+def test_start_and_end(decode):
+    first, second, third = tag_frame(b'\x01' * 4), tag_frame(b'\x02' * 4), tag_frame(b'\x03' * 4)
+    buffer = first + second + third
+    result = decode.decode_batch(buffer, len(first), len(first) + len(second))
+    assert decode.batch_epcs(buffer, result) == ['02' * 4]
+    assert result.consumed == len(first) + len(second)
@@ -0,0 +1,74 @@
+"""
+    Tests of the protocol codec of protocol.py: precomputed command frames, the start reading command and
+    decode_response on command responses.
+"""
+from crc import verify_frame
+from protocol import (build_frame, decode_response, encode_inventory, inventory_command, INVENTORY_COMMAND_LEN,
+                      REBOOT_COMMAND, DEVICE_INFO_COMMAND, INVENTORY_STOP_COMMAND, CMD_INVENTORY_CONTINUE,
+                      CMD_INVENTORY_STOP, CMD_REBOOT, CMD_DEVICE_INFO, STATUS_SUCCESS)
+
+
+def tag_frame(epc, rssi=0x00C8, antenna=1, channel=0, status=STATUS_SUCCESS):
+    return build_frame(CMD_INVENTORY_CONTINUE, bytes((status, rssi >> 8, rssi & 0xFF, antenna, channel, len(epc))) + epc)
+
+
+def corrupt(frame, index=-3):
+    frame = bytearray(frame)
+    frame[index] ^= 0x01
+    return bytes(frame)
+
+
+EPC_A = bytes.fromhex('e28011700000020a1b2c3d4e')
+EPC_B = bytes.fromhex('300833b2ddd9014000000000000000ff')
+
+
+def test_precomputed_commands():
+    assert REBOOT_COMMAND[:5] == bytes((0xCF, 0xFF, CMD_REBOOT >> 8, CMD_REBOOT & 0xFF, 0))
+    assert DEVICE_INFO_COMMAND[:5] == bytes((0xCF, 0xFF, CMD_DEVICE_INFO >> 8, CMD_DEVICE_INFO & 0xFF, 0))
+    assert INVENTORY_STOP_COMMAND[:5] == bytes((0xCF, 0xFF, CMD_INVENTORY_STOP >> 8, CMD_INVENTORY_STOP & 0xFF, 0))
+    assert all(verify_frame(command) for command in (REBOOT_COMMAND, DEVICE_INFO_COMMAND, INVENTORY_STOP_COMMAND))
+
+
+def test_inventory_command():
+    for inv_type, inv_param in ((0x00, 0), (0x01, 5), (0x02, 0x12345678)):
+        expected = build_frame(CMD_INVENTORY_CONTINUE, bytes((inv_type,)) + inv_param.to_bytes(4, 'little'))
+        assert inventory_command(inv_type, inv_param) == expected
+        assert len(expected) == INVENTORY_COMMAND_LEN
+    assert inventory_command(0x01, 5) is inventory_command(0x01, 5)  # Cached.
+
+
+def test_encode_inventory_reuses_the_buffer():
+    out = bytearray(INVENTORY_COMMAND_LEN)
+    assert encode_inventory(0x01, 5, out) is out
+    assert out == inventory_command(0x01, 5)
+    encode_inventory(0x00, 0, out)
+    assert out == inventory_command()
+
+
+def test_decode_response():
+    response = decode_response(build_frame(CMD_DEVICE_INFO, bytes((STATUS_SUCCESS,)) + b'V1.0'))
+    assert (response.cmd, response.status, bytes(response.payload), response.crc_valid) == (
+        CMD_DEVICE_INFO, STATUS_SUCCESS, b'V1.0', True)
+
+
+def test_decode_response_skips_other_commands():
+    stop = build_frame(CMD_INVENTORY_STOP, bytes((0x01,)))
+    response = decode_response(tag_frame(EPC_A) + tag_frame(EPC_B) + stop, CMD_INVENTORY_STOP)
+    assert (response.cmd, response.status, response.crc_valid) == (CMD_INVENTORY_STOP, 0x01, True)
+    assert decode_response(tag_frame(EPC_A) + stop).cmd == CMD_INVENTORY_CONTINUE
+    assert decode_response(tag_frame(EPC_A), CMD_INVENTORY_STOP) is None
+
+
+def test_decode_response_crc():
+    stop = build_frame(CMD_INVENTORY_STOP, bytes((STATUS_SUCCESS,)))
+    assert decode_response(corrupt(stop), CMD_INVENTORY_STOP).crc_valid is False
+    # A valid frame after a corrupted one wins.
+    assert decode_response(corrupt(stop) + stop, CMD_INVENTORY_STOP).crc_valid is True
+
+
+def test_decode_response_incomplete():
+    stop = build_frame(CMD_INVENTORY_STOP, bytes((STATUS_SUCCESS,)))
+    assert decode_response(b'') is None
+    assert decode_response(stop[:-1]) is None
+    assert decode_response(b'\x00\x00' + stop).status == STATUS_SUCCESS
+    assert decode_response(build_frame(CMD_INVENTORY_STOP)) is None  # No status byte.
@@ -0,0 +1,71 @@
+"""
+    Regression tests of the table driven CRC16 (crc.py) against the bit by bit loop it replaced.
+"""
+import random
+
+import pytest
+
+import crc
+
+
+def bitwise_crc16(data):
+    # The loop api.crc16_cal used before crc.py, as described in the reader documentation.
+    value = 0xFFFF
+    for byte in data:
+        value ^= byte
+        for _ in range(8):
+            if value & 0x0001:
+                value = (value >> 1) ^ 0x8408
+            else:
+                value >>= 1
+    return value
+
+
+def with_crc(data):
+    value = bitwise_crc16(data)
+    return bytes(data) + bytes(((value >> 8) & 0xFF, value & 0xFF))
+
+
+BLOCKS = [b'', bytes(range(256)), b'\xff' * 64, b'\x00' * 64] + \
+         [random.Random(seed).randbytes(seed * 7 % 300) for seed in range(50)]
+
+
+@pytest.mark.parametrize('data', BLOCKS)
+def test_crc16_matches_bitwise_loop(data):
+    assert crc.crc16(data) == bitwise_crc16(data)
+    assert crc.crc16(bytearray(data)) == bitwise_crc16(data)
+    assert crc.crc16(memoryview(data)) == bitwise_crc16(data)
+
+
+def test_every_single_byte():
+    for byte in range(256):
+        assert crc.crc16(bytes((byte,))) == bitwise_crc16(bytes((byte,)))
+
+
+@pytest.mark.parametrize('data', BLOCKS[4:])
+def test_update_in_pieces(data):
+    cut = len(data) // 3
+    state = crc.update(crc.PRESET_VALUE, data[:cut])
+    assert crc.update(state, data[cut:]) == bitwise_crc16(data)
+
+
+def test_verify_frame():
+    frame = with_crc(b'\xcf\xff\x00\x01\x01\x00')
+    assert crc.verify_frame(frame)
+    assert not crc.verify_frame(frame[:-1] + bytes((frame[-1] ^ 0x01,)))
+    assert not crc.verify_frame(b'\xcf\xff')
+
+
+def test_verify_frames_matches_verify_frame():
+    rng = random.Random(7)
+    frames = [with_crc(rng.randbytes(rng.randint(1, 40))) for _ in range(100)]
+    for index in range(0, 100, 3):
+        corrupted = bytearray(frames[index])
+        corrupted[rng.randrange(len(corrupted))] ^= 1 << rng.randrange(8)
+        frames[index] = bytes(corrupted)
+    frames += [b'', b'\x01', b'\x01\x02', memoryview(with_crc(b'\xcf'))]
+    results = crc.verify_frames(frames)
+    assert results == [crc.verify_frame(frame) for frame in frames]
+    assert results == [len(frame) >= 3 and bitwise_crc16(frame[:-2]) == (frame[-2] << 8) | frame[-1]
+                       for frame in frames]
+    assert results.count(False) == 34 + 3  # A single bit flip always breaks a CRC16.
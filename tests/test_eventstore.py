@@ -0,0 +1,98 @@
+"""
+    Tests of the on-disk tag event store (eventstore.py): append/flush, reopening, sealed segments and the ranges of
+    last_seen() and history().
+"""
+import os
+
+import pytest
+
+from eventstore import TagEventStore, StoredEvent
+
+EPC_A = 'e28011700000020a1b2c3d4e'
+EPC_B = '300833b2ddd9014000000000000000ff'
+
+
+@pytest.fixture
+def store(tmp_path):
+    opened = TagEventStore(str(tmp_path), bucket_seconds=60, commit_interval=0.01)
+    yield opened
+    opened.close()
+
+
+def test_append_flush_and_query_the_active_segment(store):
+    assert store.append(EPC_A, '192.168.1.10', timestamp=1000.0)
+    assert store.append(EPC_B, '192.168.1.11:2022', status=0x01, timestamp=1001.0)
+    store.flush()
+    assert store.last_seen(EPC_A) == StoredEvent(1000.0, '192.168.1.10', EPC_A, 0x00)
+    assert store.last_seen(EPC_B) == StoredEvent(1001.0, '192.168.1.11', EPC_B, 0x01)
+    assert store.last_seen('00112233') is None
+    assert store.history('00112233') == []
+
+
+def test_reopen_indexes_the_previous_active_segment(tmp_path):
+    store = TagEventStore(str(tmp_path), commit_interval=0.01)
+    for second in range(10):
+        store.append(EPC_A, '10.0.0.1', timestamp=1000.0 + second * 30)
+    store.close()
+    assert sorted(os.listdir(tmp_path)) == ['segment-000001.dat']
+
+    reopened = TagEventStore(str(tmp_path), commit_interval=0.01)
+    try:
+        assert 'segment-000001.idx' in os.listdir(tmp_path)
+        assert reopened.last_seen(EPC_A).timestamp == 1270.0
+        reopened.append(EPC_A, '10.0.0.2', timestamp=2000.0)
+        reopened.flush()
+        assert reopened.last_seen(EPC_A) == StoredEvent(2000.0, '10.0.0.2', EPC_A, 0x00)
+    finally:
+        reopened.close()
+
+
+def test_full_segments_are_sealed(tmp_path):
+    store = TagEventStore(str(tmp_path), segment_records=4, bucket_seconds=1, commit_interval=0.01)
+    try:
+        for second in range(10):
+            store.append(EPC_A if second % 2 else EPC_B, timestamp=1000.0 + second)
+        store.flush()
+        assert len(store.sealed) == 2
+        assert [event.timestamp for event in store.history(EPC_A)] == [1001.0, 1003.0, 1005.0, 1007.0, 1009.0]
+        assert store.last_seen(EPC_B).timestamp == 1008.0
+        assert store.last_seen(EPC_A).timestamp == 1009.0
+    finally:
+        store.close()
+
+
+def test_history_keeps_the_last_read_of_each_bucket(store):
+    # Buckets of 60 seconds: [960, 1020), [1020, 1080), [1080, 1140).
+    for timestamp in (1000.0, 1010.0, 1030.0, 1070.0, 1130.0):
+        store.append(EPC_A, timestamp=timestamp)
+    store.append(EPC_B, timestamp=1075.0)
+    store.flush()
+    assert [event.timestamp for event in store.history(EPC_A)] == [1010.0, 1070.0, 1130.0]
+
+
+def test_history_range_is_exact(store):
+    for timestamp in (1010.0, 1070.0, 1130.0):
+        store.append(EPC_A, timestamp=timestamp)
+    store.flush()
+    # The edge buckets overlap the range, their last read is left out when it falls outside.
+    assert [event.timestamp for event in store.history(EPC_A, since=1015.0)] == [1070.0, 1130.0]
+    assert [event.timestamp for event in store.history(EPC_A, until=1100.0)] == [1010.0, 1070.0]
+    assert [event.timestamp for event in store.history(EPC_A, since=1030.0, until=1060.0)] == []
+    # The bounds are included.
+    assert [event.timestamp for event in store.history(EPC_A, since=1070.0, until=1070.0)] == [1070.0]
+    assert [event.timestamp for event in store.history(EPC_A, since=1010.0, until=1130.0)] == [1010.0, 1070.0,
+                                                                                                1130.0]
+
+
+def test_history_range_in_sealed_segments(tmp_path):
+    store = TagEventStore(str(tmp_path), segment_records=2, bucket_seconds=60, commit_interval=0.01)
+    try:
+        for timestamp in (1010.0, 1070.0, 1130.0, 1190.0):
+            store.append(EPC_A, timestamp=timestamp)
+        store.flush()
+        assert len(store.sealed) == 2
+        assert [event.timestamp for event in store.history(EPC_A, since=1015.0, until=1135.0)] == [1070.0, 1130.0]
+        assert [event.timestamp for event in store.history(EPC_A, since=1131.0)] == [1190.0]
+    finally:
+        store.close()
+
@@ -0,0 +1,40 @@
+"""
+    Tests of the asyncio fleet manager (fleet.py) against simulated readers sharing one IP address.
+"""
+import asyncio
+
+from fleet import ReaderFleet, parse_reader, READER_PORT
+from protocol import STATUS_SUCCESS
+from simulator import SimulatedReader
+
+
+def test_parse_reader():
+    assert parse_reader('192.168.1.200') == ('192.168.1.200', READER_PORT)
+    assert parse_reader('192.168.1.200:4001') == ('192.168.1.200', 4001)
+
+
+async def _stream_two_readers():
+    simulated = [await SimulatedReader(rate=2000, population=5, seed=seed).start() for seed in (1, 2)]
+    names = [f'127.0.0.1:{reader.port}' for reader in simulated]
+    readers = [('127.0.0.1', reader.port) for reader in simulated]
+    try:
+        async with ReaderFleet(readers) as fleet:
+            assert list(fleet.readers) == names
+            assert len(fleet.connected) == 2
+            assert await fleet.start_all() == dict.fromkeys(names, STATUS_SUCCESS)
+            seen = set()
+            async for name, tag in fleet.tags():
+                seen.add(name)
+                if seen == set(names):
+                    break
+            assert await fleet.stop_all() == dict.fromkeys(names, STATUS_SUCCESS)
+            inventories = await fleet.inventory_all(1)
+            assert list(inventories) == names
+            assert all(inventories.values())
+    finally:
+        for reader in simulated:
+            await reader.close()
+
+
+def test_readers_sharing_an_ip_are_kept_apart():
+    asyncio.run(asyncio.wait_for(_stream_two_readers(), 20))
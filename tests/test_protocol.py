@@ -0,0 +1,111 @@
+"""
+    Tests of the frame decoding of protocol.py: TagFrameDecoder on the continuous tag stream.
+"""
+from protocol import TagFrameDecoder, TagRead, build_frame, CMD_INVENTORY_CONTINUE, CMD_INVENTORY_STOP, STATUS_SUCCESS
+
+
+def tag_frame(epc, rssi=0x00C8, antenna=1, channel=0, status=STATUS_SUCCESS):
+    return build_frame(CMD_INVENTORY_CONTINUE, bytes((status, rssi >> 8, rssi & 0xFF, antenna, channel, len(epc))) + epc)
+
+
+def corrupt(frame, index=-3):
+    frame = bytearray(frame)
+    frame[index] ^= 0x01
+    return bytes(frame)
+
+
+EPC_A = bytes.fromhex('e28011700000020a1b2c3d4e')
+EPC_B = bytes.fromhex('300833b2ddd9014000000000000000ff')
+
+
+def test_single_frame():
+    decoder = TagFrameDecoder()
+    assert decoder.feed(tag_frame(EPC_A, rssi=0x0123, antenna=2, channel=5)) == [
+        TagRead(EPC_A.hex(), 0x0123, 2, 5)]
+    assert decoder.frames == 1
+    assert decoder.pending == 0
+
+
+def test_frame_split_across_chunks():
+    frame = tag_frame(EPC_A)
+    decoder = TagFrameDecoder()
+    tags = []
+    for index in range(len(frame)):
+        tags += decoder.feed(frame[index:index + 1])
+        if index < len(frame) - 1:
+            assert not tags
+            assert decoder.pending == index + 1
+    assert tags == [TagRead(EPC_A.hex(), 0x00C8, 1, 0)]
+    assert decoder.pending == 0
+
+
+def test_split_at_every_position():
+    stream = tag_frame(EPC_A) + tag_frame(EPC_B) + tag_frame(EPC_A)
+    for cut in range(len(stream) + 1):
+        decoder = TagFrameDecoder()
+        tags = decoder.feed(stream[:cut]) + decoder.feed(stream[cut:])
+        assert [tag.epc for tag in tags] == [EPC_A.hex(), EPC_B.hex(), EPC_A.hex()]
+
+
+def test_several_frames_in_one_chunk():
+    decoder = TagFrameDecoder()
+    tags = decoder.feed(b''.join(tag_frame(epc, antenna=antenna)
+                                 for epc, antenna in ((EPC_A, 1), (EPC_B, 2), (EPC_A, 3), (EPC_B, 4))))
+    assert [(tag.epc, tag.antenna) for tag in tags] == [(EPC_A.hex(), 1), (EPC_B.hex(), 2), (EPC_A.hex(), 3),
+                                                        (EPC_B.hex(), 4)]
+    assert decoder.frames == 4
+
+
+def test_resync_after_bad_crc():
+    decoder = TagFrameDecoder()
+    tags = decoder.feed(corrupt(tag_frame(EPC_A)) + tag_frame(EPC_B))
+    assert [tag.epc for tag in tags] == [EPC_B.hex()]
+    assert decoder.crc_errors == 1
+    assert decoder.pending == 0
+
+
+def test_resync_on_header_inside_bad_frame():
+    # A corrupted LEN makes the bad frame look longer than it is, the real frame after it starts inside it.
+    decoder = TagFrameDecoder()
+    tags = decoder.feed(corrupt(tag_frame(EPC_A), index=4) + tag_frame(EPC_B) + tag_frame(EPC_A))
+    assert [tag.epc for tag in tags] == [EPC_B.hex(), EPC_A.hex()]
+    assert decoder.crc_errors >= 1
+
+
+def test_garbage_before_frame():
+    decoder = TagFrameDecoder()
+    assert [tag.epc for tag in decoder.feed(b'\x00\x01\x02' + tag_frame(EPC_A))] == [EPC_A.hex()]
+    assert decoder.discarded_bytes == 3
+
+
+def test_empty_epc_is_not_a_tag():
+    responses = []
+    decoder = TagFrameDecoder(on_response=lambda cmd, frame: responses.append(cmd))
+    assert decoder.feed(tag_frame(b'') + tag_frame(EPC_A)) == [TagRead(EPC_A.hex(), 0x00C8, 1, 0)]
+    assert decoder.frames == 2
+    assert decoder.crc_errors == 0
+    assert responses == []
+
+
+def test_epc_longer_than_frame_is_not_a_tag():
+    frame = build_frame(CMD_INVENTORY_CONTINUE, bytes((STATUS_SUCCESS, 0, 0xC8, 1, 0, 20)) + EPC_A)
+    assert TagFrameDecoder().feed(frame) == []
+
+
+def test_responses_go_to_on_response():
+    responses = []
+    decoder = TagFrameDecoder(on_response=lambda cmd, frame: responses.append((cmd, frame)))
+    ack = build_frame(CMD_INVENTORY_CONTINUE, bytes((STATUS_SUCCESS,)))
+    stop = build_frame(CMD_INVENTORY_STOP, bytes((STATUS_SUCCESS,)))
+    tags = decoder.feed(ack + tag_frame(EPC_A) + stop)
+    assert [tag.epc for tag in tags] == [EPC_A.hex()]
+    assert responses == [(CMD_INVENTORY_CONTINUE, ack), (CMD_INVENTORY_STOP, stop)]
+
+
+def test_reset_drops_partial_frame():
+    decoder = TagFrameDecoder()
+    decoder.feed(tag_frame(EPC_A)[:10])
+    decoder.reset()
+    assert decoder.pending == 0
+    assert [tag.epc for tag in decoder.feed(tag_frame(EPC_B))] == [EPC_B.hex()]
+
@@ -0,0 +1,45 @@
+"""
+    Tests of the SessionReactor loop (reactor.py): calls and timers run on its thread, stop() returns at once.
+"""
+import threading
+import time
+
+from reactor import SessionReactor
+
+
+def test_call_soon_runs_on_the_reactor_thread():
+    reactor = SessionReactor()
+    thread = reactor.start()
+    ran = threading.Event()
+    threads = []
+    reactor.call_soon(lambda: (threads.append(threading.current_thread()), ran.set()))
+    assert ran.wait(2)
+    assert threads == [thread]
+    reactor.stop()
+    thread.join(2)
+    reactor.close()
+
+
+def test_timer():
+    reactor = SessionReactor()
+    ticks = []
+    reactor.add_timer(0.01, lambda: ticks.append(time.monotonic()))
+    thread = reactor.start()
+    time.sleep(0.2)
+    reactor.stop()
+    thread.join(2)
+    reactor.close()
+    assert len(ticks) >= 3
+
+
+def test_stop_does_not_wait_for_the_next_deadline():
+    reactor = SessionReactor()
+    reactor.add_timer(60, lambda: None)  # select() would otherwise sleep for a minute.
+    thread = reactor.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    reactor.stop()
+    thread.join(2)
+    assert not thread.is_alive()
+    assert time.monotonic() - started < 0.5
+    reactor.close()
@@ -0,0 +1,72 @@
+"""
+    Tests of the serial transport (serial_transport.py) against the simulated reader served on a pseudo terminal.
+"""
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip('pty')
+
+from protocol import inventory_command, CMD_INVENTORY_CONTINUE, STATUS_SUCCESS, DATA_INDEX
+from serial_transport import SerialTransport, detect_baud_rate
+from simulator import SimulatedReader
+
+
+@pytest.fixture
+def simulated_port():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    reader = SimulatedReader(rate=20000, tick=0.002, seed=1)
+    asyncio.run_coroutine_threadsafe(reader.start_serial(baud_rate=57600), loop).result(5)
+    yield reader
+    asyncio.run_coroutine_threadsafe(reader.close(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(2)
+    loop.close()
+
+
+def test_detect_baud_rate(simulated_port):
+    transport = SerialTransport(simulated_port.serial_port, 9600)
+    try:
+        assert detect_baud_rate(transport, [9600, 115200, 57600]) == 57600
+        assert transport.baudrate == 57600
+    finally:
+        transport.close()
+
+
+def test_speed_changes_while_tags_stream(simulated_port):
+    tags = []
+    transport = SerialTransport(simulated_port.serial_port, 57600, on_tags=tags.extend)
+    try:
+        response = transport.command(inventory_command())
+        assert response[DATA_INDEX] == STATUS_SUCCESS and (response[2] << 8 | response[3]) == CMD_INVENTORY_CONTINUE
+        # The reader thread is busy decoding the stream while the speed, and with it the decoder, is reset.
+        for _ in range(20):
+            assert detect_baud_rate(transport, [115200, 57600], probe_timeout=0.05) == 57600
+        assert transport.thread.is_alive()
+        assert tags
+    finally:
+        transport.close()
+
+
+def test_decoder_reset_on_the_reader_thread(simulated_port):
+    transport = SerialTransport(simulated_port.serial_port, 9600)
+    try:
+        threads = []
+        reset = transport.decoder.reset
+        transport.decoder.reset = lambda: (threads.append(threading.current_thread()), reset())
+        transport.baudrate = 57600
+        assert threads == [transport.thread]
+    finally:
+        transport.close()
+
+
+def test_speed_change_after_close(simulated_port):
+    transport = SerialTransport(simulated_port.serial_port, 57600)
+    transport._closed.set()
+    transport.thread.join(1)
+    transport.baudrate = 115200  # Applied by the caller once the reader thread is gone.
+    assert transport.baudrate == 115200
+    transport.close()
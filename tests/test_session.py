@@ -0,0 +1,172 @@
+"""
+    Tests of the ReaderSession state machine served by a SessionReactor, against a minimal fake reader: first
+    connection, start/stop on one connection, lost connection and refused start commands.
+"""
+import socket
+import threading
+import time
+
+import pytest
+
+from protocol import TagFrameDecoder, build_frame, CMD_INVENTORY_CONTINUE, CMD_INVENTORY_STOP, STATUS_SUCCESS
+from reactor import SessionReactor
+from session import ReaderSession, CONNECTED, DISCONNECTED, READING
+
+
+class FakeReader:
+    """
+        Accepts connections and answers the start and stop commands with `start_status` and success.
+    """
+
+    def __init__(self):
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.start_status = STATUS_SUCCESS
+        self.connections = []
+        self.commands = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections.append(connection)
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        answers = []
+        decoder = TagFrameDecoder(on_response=lambda cmd, frame: answers.append(cmd))
+        while True:
+            try:
+                chunk = connection.recv(1024)
+            except OSError:
+                return
+            if not chunk:
+                return
+            decoder.feed(chunk)
+            for cmd in answers:
+                self.commands.append(cmd)
+                status = self.start_status if cmd == CMD_INVENTORY_CONTINUE else STATUS_SUCCESS
+                connection.sendall(build_frame(cmd, bytes((status,))))
+            answers.clear()
+
+    def drop(self):
+        # The session may reconnect while this runs, its new connection must survive.
+        connections, self.connections = self.connections, []
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)  # close() alone does not wake up the thread in recv().
+            except OSError:
+                pass
+            connection.close()
+
+    def close(self):
+        self.drop()
+        self.server.close()
+
+
+def wait_for(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+@pytest.fixture
+def reader():
+    fake = FakeReader()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def served():
+    reactor = SessionReactor()
+    sessions = []
+
+    def serve(session):
+        decoder = TagFrameDecoder(on_response=session.on_response)
+        reactor.add(session, lambda reader_session, data: decoder.feed(data))
+        sessions.append(session)
+        return session
+
+    thread = reactor.start()
+    yield reactor, serve
+    reactor.stop()
+    thread.join(2)
+    for session in sessions:
+        session.close()
+    reactor.close()
+
+
+def test_first_connection_starts_reading(reader, served):
+    reactor, serve = served
+    session = ReaderSession('127.0.0.1', reader.port)
+    session.reading = True
+    serve(session)
+    assert wait_for(lambda: session.state == READING)
+    assert session.generation == 1
+    assert session.reconnect_count == 0
+    assert reader.commands == [CMD_INVENTORY_CONTINUE]
+
+
+def test_start_stop_cycles_are_not_reconnections(reader, served):
+    reactor, serve = served
+    session = ReaderSession('127.0.0.1', reader.port)
+    assert session.connect()  # Blocking, like the gui's Connect button.
+    serve(session)
+    connection = session.connection
+    for _ in range(3):
+        reactor.call_soon(session.start_reading)
+        assert wait_for(lambda: session.state == READING)
+        reactor.call_soon(session.stop_reading)
+        assert wait_for(lambda: session.state == CONNECTED and len(reader.commands) % 2 == 0)
+    assert session.connection is connection
+    assert session.reconnect_count == 0
+    assert reader.commands == [CMD_INVENTORY_CONTINUE, CMD_INVENTORY_STOP] * 3
+
+
+def test_lost_connection_reconnects_and_restarts_reading(reader, served):
+    reactor, serve = served
+    session = ReaderSession('127.0.0.1', reader.port, backoff_initial=0.01)
+    session.reading = True
+    serve(session)
+    assert wait_for(lambda: session.state == READING)
+    reader.drop()
+    assert wait_for(lambda: session.generation == 2 and session.state == READING)
+    assert session.reconnect_count == 1
+    assert reader.commands == [CMD_INVENTORY_CONTINUE, CMD_INVENTORY_CONTINUE]
+
+
+def test_refused_start_fails_the_connection_attempt(reader, served):
+    reader.start_status = 0x01
+    reactor, serve = served
+    states = []
+    session = ReaderSession('127.0.0.1', reader.port, backoff_initial=10,
+                            on_state_change=lambda changed: states.append(changed.state))
+    session.reading = True
+    serve(session)
+    assert wait_for(lambda: session.last_error is not None)
+    assert wait_for(lambda: session.state == DISCONNECTED)
+    assert session.connection is None
+    assert 'status 0x01' in session.last_error
+    assert READING not in states
+    assert session.reconnect_count == 0
+
+
+def test_refused_start_keeps_an_established_connection(reader, served):
+    reader.start_status = 0x01
+    reactor, serve = served
+    session = ReaderSession('127.0.0.1', reader.port)
+    assert session.connect()
+    serve(session)
+    connection = session.connection
+    reactor.call_soon(session.start_reading)
+    assert wait_for(lambda: reader.commands == [CMD_INVENTORY_CONTINUE] and not session.reading)
+    assert session.state == CONNECTED
+    assert session.connection is connection
+    assert session.reconnect_count == 0